@@ -0,0 +1,281 @@
+"""
+回測引擎熱點的效能基準測試
+
+以合成資料放大資產數、天數與 trial 數，量測下列函式的執行時間、記憶體峰值與最適化呼叫次數：
+ETFDataLoader.load_data、PortfolioOptimizer.estimate_parameters、optimize_portfolio、
+Backtester.run_backtest、Simulator.run_and_summarize
+
+用法（在專案根目錄執行）：
+    python -m benchmarks.bench_engine --profile quick --update-baseline   # 建立 baseline
+    python -m benchmarks.bench_engine --profile quick                     # 與 baseline 比較，退步時 exit code = 1
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from scr.prepare_data import ETFDataLoader
+from scr.portfolio_optimizer import PortfolioOptimizer
+from scr.backtester import Backtester
+from scr.simulator import Simulator
+
+# panels: {天數: 該長度的資料要跑的 trial 數}
+# trial 數不能超過合法起始日的數量（10,000 天扣掉回顧與持有期間後約 7,900 個），大的 trial 數只配長的資料
+PROFILES = {
+    'quick': {'assets': [10], 'panels': {10_000: [10]}},
+    'standard': {'assets': [10, 100], 'panels': {10_000: [10, 100]}},
+    'full': {'assets': [10, 100, 500], 'panels': {10_000: [10, 1_000], 100_000: [10, 1_000, 10_000]}},
+}
+
+HOLDING_YEARS = 3
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def make_price_panel(n_assets, n_days, seed=0):
+    """
+    產生合成的 Adj Close 價格表（幾何隨機漫步，資產間有共同因子）
+    """
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0003, 0.008, size=(n_days, 1))
+    betas = rng.uniform(0.3, 1.2, size=n_assets)
+    returns = market * betas + rng.normal(0.0001, 0.006, size=(n_days, n_assets))
+
+    prices = 10 * np.exp(np.cumsum(np.log1p(returns), axis=0))
+    dates = pd.bdate_range("1680-01-01", periods=n_days)
+    columns = [f"SYN{i:04d}" for i in range(n_assets)]
+    return pd.DataFrame(prices, index=dates, columns=columns)
+
+
+def write_price_csvs(price_df, directory):
+    """
+    把合成價格寫成與 data/ 相同格式的 CSV，回傳 {代碼: 檔名}
+    """
+    file_path_dict = {}
+    for etf_code in price_df.columns:
+        prices = price_df[etf_code]
+        df = pd.DataFrame({
+            'Date': prices.index.strftime('%Y-%m-%d'),
+            'Open': prices.values, 'High': prices.values, 'Low': prices.values, 'Close': prices.values,
+            'Adj Close': prices.values, 'Volume': 0
+        })
+        filename = f"{etf_code}.csv"
+        df.to_csv(os.path.join(directory, filename), index=False, float_format='%.6f')
+        file_path_dict[etf_code] = filename
+    return file_path_dict
+
+
+def count_optimizer_calls(optimizer):
+    """
+    包住 optimizer.optimize_portfolio，回傳一個記錄呼叫次數的 dict
+    """
+    counter = {'calls': 0}
+    original = optimizer.optimize_portfolio
+
+    def counted(*args, **kwargs):
+        counter['calls'] += 1
+        return original(*args, **kwargs)
+
+    optimizer.optimize_portfolio = counted
+    return counter
+
+
+def measure(fn, repeat=1):
+    """
+    執行 fn：時間取 repeat 次中最快的一次，記憶體峰值另外以 tracemalloc 跑一次
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(timings), peak / 2 ** 20
+
+
+def count_valid_start_dates(n_days, holding_years=HOLDING_YEARS):
+    """
+    n_days 天的合成資料有幾個合法的模擬起始日（日期與資產數無關，用單一資產計算即可）
+    """
+    price_df = make_price_panel(1, n_days)
+    optimizer = PortfolioOptimizer(price_df)
+    asset_list = list(price_df.columns)
+    simulator = Simulator(optimizer, Backtester(optimizer, asset_list), asset_list, sampling="rolling")
+    return len(simulator.get_valid_start_dates(holding_years=holding_years))
+
+
+def check_profile(profile):
+    """
+    確認 profile 裡每個 (天數, trial 數) 組合都抽得到足夠的起始日，否則在開始量測前就 raise ValueError
+    """
+    infeasible = []
+    for n_days, trial_counts in PROFILES[profile]['panels'].items():
+        n_valid = count_valid_start_dates(n_days)
+        infeasible += [f"days={n_days},trials={n_trials}（只有 {n_valid} 個起始日）"
+                       for n_trials in trial_counts if n_trials > n_valid]
+    if infeasible:
+        raise ValueError(f"profile {profile} 的 trial 數超過合法起始日：" + "、".join(infeasible))
+
+
+def build_cases(n_assets, n_days, trial_counts, workdir):
+    """
+    針對一組 (資產數, 天數) 建立所有基準測試案例
+    回傳 list of (名稱, 可重複呼叫的函式, 最適化計數器 or None)
+    """
+    price_df = make_price_panel(n_assets, n_days)
+    csv_dir = os.path.join(workdir, f"csv_{n_assets}_{n_days}")
+    os.makedirs(csv_dir, exist_ok=True)
+    file_path_dict = write_price_csvs(price_df, csv_dir)
+
+    optimizer = PortfolioOptimizer(price_df)
+    asset_list = list(price_df.columns)
+    returns_index = optimizer.returns.index
+    counter = count_optimizer_calls(optimizer)
+
+    # 固定的估計區間與起始日，讓每次執行的工作量相同
+    rng = np.random.default_rng(1)
+    window = 5 * 252
+    window_starts = rng.integers(0, len(returns_index) - window, size=200)
+    windows = [(returns_index[a], returns_index[a + window - 1]) for a in window_starts]
+    mu, sigma = optimizer.estimate_parameters(*windows[0], asset_list)
+
+    backtest_start = returns_index[window + 1]
+    backtest_end = backtest_start + pd.DateOffset(years=HOLDING_YEARS)
+
+    suffix = f"assets={n_assets},days={n_days}"
+    cases = [
+        (f"load_data[{suffix}]", lambda: ETFDataLoader(file_path_dict, data_dir=csv_dir), None),
+        (f"estimate_parameters[{suffix},calls=200]",
+         lambda: [optimizer.estimate_parameters(start, end, asset_list) for start, end in windows], None),
+        (f"optimize_portfolio[{suffix},calls=20]",
+         lambda: [optimizer.optimize_portfolio(mu, sigma) for _ in range(20)], counter),
+        (f"run_backtest[{suffix},years=3]",
+         lambda: Backtester(optimizer, asset_list).run_backtest(backtest_start, backtest_end), counter),
+    ]
+
+    for n_trials in trial_counts:
+        def run_and_summarize(n_trials=n_trials):
+            backtester = Backtester(optimizer, asset_list)
+            simulator = Simulator(optimizer, backtester, asset_list, n_trials=n_trials, seed=0)
+            simulator.run_and_summarize(mode="optimal", holding_years=HOLDING_YEARS)
+
+        cases.append((f"run_and_summarize[{suffix},trials={n_trials}]", run_and_summarize, counter))
+
+    return cases
+
+
+def run_benchmarks(profile, repeat=1):
+    """
+    跑完一個 profile 的所有案例，回傳 {案例名稱: {time_s, peak_mb, optimizer_calls}}
+    """
+    check_profile(profile)
+    sizes = PROFILES[profile]
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="etf_bench_")
+    try:
+        for n_assets in sizes['assets']:
+            for n_days, trial_counts in sizes['panels'].items():
+                for name, fn, counter in build_cases(n_assets, n_days, trial_counts, workdir):
+                    # 先空跑一次算出單次的最適化呼叫次數
+                    if counter is not None:
+                        counter['calls'] = 0
+                    fn()
+                    calls = counter['calls'] if counter is not None else 0
+
+                    elapsed, peak_mb = measure(fn, repeat=repeat)
+                    results[name] = {'time_s': round(elapsed, 6), 'peak_mb': round(peak_mb, 3),
+                                     'optimizer_calls': calls}
+                    print(f"{name:<60} {elapsed:>10.4f}s {peak_mb:>10.2f}MB {calls:>8d} calls")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold, min_time=0.01, min_mb=1.0):
+    """
+    與 baseline 比較：時間或記憶體超過 (1 + threshold) 倍、或最適化呼叫次數變多 ➜ 視為退步
+    min_time / min_mb 避免極小數值的雜訊誤判
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        if current['time_s'] > base['time_s'] * (1 + threshold) and current['time_s'] - base['time_s'] > min_time:
+            regressions.append(f"{name}: time {base['time_s']:.4f}s ➜ {current['time_s']:.4f}s")
+        if current['peak_mb'] > base['peak_mb'] * (1 + threshold) and current['peak_mb'] - base['peak_mb'] > min_mb:
+            regressions.append(f"{name}: peak memory {base['peak_mb']:.2f}MB ➜ {current['peak_mb']:.2f}MB")
+        if current['optimizer_calls'] > base['optimizer_calls']:
+            regressions.append(f"{name}: optimizer calls {base['optimizer_calls']} ➜ {current['optimizer_calls']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回測引擎效能基準測試")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=3, help="每個案例重複幾次，時間取最快的一次")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON 路徑")
+    parser.add_argument("--update-baseline", action="store_true", help="把這次結果寫成新的 baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允許的退步比例（0.25 = 25%%）")
+    parser.add_argument("--output", help="另外把這次結果寫到指定的 JSON 檔")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.profile, repeat=args.repeat)
+    report = {
+        'profile': args.profile,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline 已更新：{args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"找不到 baseline（{args.baseline}），請先以 --update-baseline 建立")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print("效能退步：")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print("沒有超過門檻的退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
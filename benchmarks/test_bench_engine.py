@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from benchmarks import bench_engine
+from scr.backtester import Backtester
+from scr.portfolio_optimizer import PortfolioOptimizer
+from scr.simulator import Simulator
+
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = {'case': {'time_s': 1.0, 'peak_mb': 100.0, 'optimizer_calls': 10}}
+    noise = {'case': {'time_s': 1.2, 'peak_mb': 120.0, 'optimizer_calls': 10}}
+    assert bench_engine.compare_to_baseline(noise, baseline, threshold=0.25) == []
+
+    slower = {'case': {'time_s': 2.0, 'peak_mb': 200.0, 'optimizer_calls': 11}, 'new': noise['case']}
+    assert len(bench_engine.compare_to_baseline(slower, baseline, threshold=0.25)) == 3
+
+    # 極小的數值不因比例超標就判定退步
+    tiny = {'case': {'time_s': 0.001, 'peak_mb': 0.1, 'optimizer_calls': 0}}
+    tiny_slower = {'case': {'time_s': 0.005, 'peak_mb': 0.5, 'optimizer_calls': 0}}
+    assert bench_engine.compare_to_baseline(tiny_slower, tiny, threshold=0.25) == []
+
+
+@pytest.mark.parametrize("profile", sorted(bench_engine.PROFILES))
+def test_every_profile_is_feasible(profile):
+    # 只建立 Simulator 並抽起始日、不實際模擬：每個 (天數, trial 數) 組合都抽得到足夠的起始日
+    for n_days, trial_counts in bench_engine.PROFILES[profile]['panels'].items():
+        price_df = bench_engine.make_price_panel(1, n_days)
+        optimizer = PortfolioOptimizer(price_df)
+        asset_list = list(price_df.columns)
+        for n_trials in trial_counts:
+            simulator = Simulator(optimizer, Backtester(optimizer, asset_list), asset_list, n_trials=n_trials, seed=0)
+            assert len(simulator.get_valid_start_dates(holding_years=bench_engine.HOLDING_YEARS)) == n_trials
+    bench_engine.check_profile(profile)
+
+
+def test_infeasible_profile_fails_before_running(monkeypatch):
+    monkeypatch.setitem(bench_engine.PROFILES, 'too_many', {'assets': [4], 'panels': {2600: [2, 10_000]}})
+    with pytest.raises(ValueError, match="trials=10000"):
+        bench_engine.run_benchmarks('too_many')
+
+
+def test_smoke_run_writes_and_checks_baseline(tmp_path, monkeypatch):
+    monkeypatch.setitem(bench_engine.PROFILES, 'smoke', {'assets': [4], 'panels': {2600: [2]}})
+    baseline = str(tmp_path / "baseline.json")
+    output = str(tmp_path / "result.json")
+
+    assert bench_engine.main(["--profile", "smoke", "--repeat", "1", "--baseline", baseline,
+                              "--update-baseline"]) == 0
+    assert bench_engine.main(["--profile", "smoke", "--repeat", "1", "--baseline", baseline,
+                              "--threshold", "1000", "--output", output]) == 0
+
+    with open(output, encoding="utf-8") as f:
+        results = json.load(f)['results']
+    with open(baseline, encoding="utf-8") as f:
+        assert set(json.load(f)) == set(results)
+    assert any(name.startswith("run_and_summarize[") and result['optimizer_calls'] > 0
+               for name, result in results.items())
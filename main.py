@@ -1,14 +1,21 @@
+import argparse
+import asyncio
+import contextlib
 import os
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 from scr.prepare_data import ETFDataLoader
 from scr.portfolio_optimizer import PortfolioOptimizer
+from scr.optimizer_cache import OptimizerCache
 from scr.backtester import Backtester
 from scr.simulator import Simulator
+from scr.sweep import SweepRunner
+from scr.service import JobService
 from scr.result_reporter import ResultReporter
+from scr.performance import METRIC_NAMES
+from scr.streaming import GroupSummary, TrialWriter, PathWriter
+from scr import instrumentation
 
-def main():
+def main(stream=False, keep_paths=False, headless=False, sweep=False, serve=False, host="127.0.0.1", port=8765,
+         socket_path=None):
     # 1. 資料準備
     data_dir = "data"
     etf_files = {
@@ -25,41 +32,111 @@ def main():
     }
 
     full_paths = {k: os.path.join(data_dir, v) for k, v in etf_files.items()}
-    loader = ETFDataLoader(full_paths)
+    loader = ETFDataLoader(full_paths, cache_dir=os.path.join("cache", "prices"))
     price_df = loader.price_df
     # 2. 初始化模組
     asset_list = list(etf_files.keys())
-    optimizer = PortfolioOptimizer(price_df)
+    cache = OptimizerCache(max_size=50000, path=os.path.join("cache", "optimizer_cache.pkl"))
+    optimizer = PortfolioOptimizer(price_df, cache=cache)
     backtester = Backtester(optimizer, asset_list)
-    simulator = Simulator(optimizer, backtester, asset_list, n_trials=5)
-
-    # 執行三種模式 × 3年
-    df_opt_3y = simulator.run_and_summarize(mode="optimal", holding_years=3)
-    df_eq_3y = simulator.run_and_summarize(mode="equal", holding_years=3)
-    df_hist_3y = simulator.run_and_summarize(mode="historical", holding_years=3)
-
-    #  執行三種模式 × 5 年
-    df_opt_5y = simulator.run_and_summarize(mode="optimal", holding_years=5)
-    df_eq_5y = simulator.run_and_summarize(mode="equal", holding_years=5)
-    df_hist_5y = simulator.run_and_summarize(mode="historical", holding_years=5)
-
-    # 合併所有資料（含 3年與 5年）
-    summary_df = pd.concat([
-        df_opt_3y, df_eq_3y, df_hist_3y,
-        df_opt_5y, df_eq_5y, df_hist_5y
-    ], ignore_index=True)
+    # rolling：窮舉所有合法起始日，得到完整的績效分布
+    simulator = Simulator(optimizer, backtester, asset_list, sampling="rolling",
+                          workers=os.cpu_count() or 1, seed=42)
+
+    if serve:
+        # 常駐服務：價格、報酬與最適化快取只載入一次，回測 / 模擬請求排進佇列，相同請求直接回傳快取結果
+        service = JobService(optimizer, workers=os.cpu_count() or 1)
+        try:
+            asyncio.run(service.serve(host=host, port=port, path=socket_path))
+        except KeyboardInterrupt:
+            pass
+        cache.save()
+        print(f"最適化快取：{cache.stats()}")
+        return
+
+    if sweep:
+        # 參數掃描：資產組合 × 估計年數 × rebalance 週期 × 持有年限 × 模式，完成的 point 存在 cache/sweep，中斷後可接著跑
+        runner = SweepRunner(optimizer, {'all': asset_list, 'equity': asset_list[:7]}, lookbacks=(3, 5),
+                             rebalance_freqs=("3M", "6M", "1Y"), horizons=(3, 5), sampling="rolling",
+                             workers=os.cpu_count() or 1, seed=42, checkpoint_dir=os.path.join("cache", "sweep"))
+        sweep_df = runner.run()
+        cache.save()
+        print(f"最適化快取：{cache.stats()}")
+        print(f"參數掃描：{runner.summary}")
+
+        sweep_summary = sweep_df.groupby(["Assets", "Lookback", "Rebalance", "Mode", "Years"])[METRIC_NAMES].mean()
+        sweep_summary.to_csv(os.path.join("output", "sweep_summary.csv"))
+        return
+
+    if stream:
+        # 串流模式：trial 結果邊算邊寫入 output/，統計量以線上演算法累計，記憶體用量固定
+        output_dir = "output"
+        summary = GroupSummary()
+        paths = PathWriter(os.path.join(output_dir, "trial_paths")) if keep_paths else contextlib.nullcontext()
+        with TrialWriter(os.path.join(output_dir, "simulation_trials.csv")) as writer, paths as path_writer:
+            n_records = simulator.stream_grid(modes=("optimal", "equal", "historical"), horizons=(3, 5),
+                                              writer=writer, summary=summary, path_writer=path_writer)
+
+        cache.save()
+        print(f"最適化快取：{cache.stats()}")
+        print(f"共 {n_records} 筆 trial")
+        ResultReporter.export_streaming_summary(summary, output_dir)
+        return
+
+    # 執行三種模式 × 3 年、5 年，所有組合平行分散到各核心
+    summary_df = simulator.run_grid(modes=("optimal", "equal", "historical"), horizons=(3, 5))
+
+    # 把這次的最適化結果存起來，下次執行直接沿用
+    cache.save()
+    print(f"最適化快取：{cache.stats()}")
+
     summary_df["Label"] = summary_df["Mode"] + "_" + summary_df["Years"].astype(str) + "Y"
-    sns.boxplot(x="Label", y="Sharpe Ratio", data=summary_df)
 
-    # 5. 成果報告
-    reporter = ResultReporter(summary_df)
-    reporter.plot_avg_metrics_by_year() # 分年期比較平均績效
-    reporter.plot_boxplot_by_year("Sharpe Ratio") # 分年期 Sharpe Ratio 分布
-    reporter.plot_trial_lines_by_year("Annualized Return")   # Trial-wise 報酬線（3年 vs 5年）
-    reporter.plot_boxplot_by_label("Sharpe Ratio")
-    reporter = ResultReporter(summary_df)
-    reporter.export_all_outputs()
+    # 5. 成果報告（headless 時不開視窗，只匯出檔案）
+    reporter = ResultReporter(summary_df, headless=headless)
+    if not headless:
+        reporter.plot_avg_metrics_by_year() # 分年期比較平均績效
+        reporter.plot_boxplot_by_year("Sharpe Ratio") # 分年期 Sharpe Ratio 分布
+        reporter.plot_trial_lines_by_year("Annualized Return")   # Trial-wise 報酬線（3年 vs 5年）
+        reporter.plot_boxplot_by_label("Sharpe Ratio")
+    reporter.export_all_outputs(workers=os.cpu_count() or 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ETF 策略模擬分析")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"輸出各階段耗時明細（也可設定環境變數 {instrumentation.ENV_ENABLE}=1）")
+    parser.add_argument("--profile-dump", default=os.environ.get(instrumentation.ENV_DUMP),
+                        help=f"另外以 cProfile 執行並把 pstats 存到此路徑（或設定 {instrumentation.ENV_DUMP}）")
+    parser.add_argument("--stream", action="store_true",
+                        help="逐筆寫出 trial 結果並以線上統計量彙總（大量 trial 時記憶體用量固定，不畫圖）")
+    parser.add_argument("--keep-paths", action="store_true",
+                        help="串流模式下另外保存每個 trial 的日報酬路徑（output/trial_paths.bin）")
+    parser.add_argument("--headless", action="store_true",
+                        help="不顯示互動圖表，只以 Agg backend 匯出 PNG 與表格（伺服器 / CI 使用）")
+    parser.add_argument("--sweep", action="store_true",
+                        help="參數掃描（資產組合 × 估計年數 × rebalance 週期 × 持有年限），可中斷後續跑")
+    parser.add_argument("--serve", action="store_true",
+                        help="以常駐服務執行：POST /jobs 送出回測 / 模擬請求，GET /status 查看佇列與快取")
+    parser.add_argument("--host", default="127.0.0.1", help="--serve 時監聽的位址")
+    parser.add_argument("--port", type=int, default=8765, help="--serve 時監聽的 port")
+    parser.add_argument("--socket", default=None, help="--serve 時改聽此路徑的 Unix socket")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.profile or args.profile_dump:
+        instrumentation.enable()
+    instrumentation.reset()
+
+    if args.profile_dump:
+        instrumentation.run_with_cprofile(main, args.profile_dump, stream=args.stream, keep_paths=args.keep_paths,
+                                           headless=args.headless, sweep=args.sweep, serve=args.serve, host=args.host,
+                                           port=args.port, socket_path=args.socket)
+    else:
+        main(stream=args.stream, keep_paths=args.keep_paths, headless=args.headless, sweep=args.sweep,
+             serve=args.serve, host=args.host, port=args.port, socket_path=args.socket)
+
+    if instrumentation.is_enabled():
+        print(instrumentation.report())
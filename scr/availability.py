@@ -0,0 +1,125 @@
+import numpy as np
+from scr.rolling_moments import append_rows
+
+
+class AvailabilityIndex:
+    def __init__(self, values):
+        """
+        各資產在 ReturnPanel 上哪些日期有資料（報酬不是 NaN）
+        預先算好每檔資產的第一個 / 最後一個有效位置，以及以位元壓縮的有效矩陣
+        （每 8 天一個 byte，n_assets 欄），任意資產子集合的有效日期只要對幾欄做 bitwise AND
+
+        values: (n_days, n_assets) 的報酬率矩陣，NaN 代表當天沒有資料
+        """
+        values = np.asarray(values)
+        self.n_days, self.n_assets = values.shape
+        self.first = np.full(self.n_assets, -1, dtype=np.int64)
+        self.last = np.full(self.n_assets, -1, dtype=np.int64)
+        self.counts = np.zeros(self.n_assets, dtype=np.int64)
+        self._bits_buffer = np.zeros((0, self.n_assets), dtype=np.uint8)
+        self._ranges = {}
+        self._holes = {}
+
+        self._append(~np.isnan(values), 0)
+
+    @property
+    def bits(self):
+        return self._bits_buffer[:(self.n_days + 7) // 8]
+
+    def _append(self, valid, n_old):
+        """
+        把 valid（新增天數 × 資產）接在前 n_old 天之後：更新 first / last / counts 與位元矩陣
+        不足 8 天的最後一個 byte 先解開、併入新的天數後再重新壓縮
+        """
+        if len(valid) == 0:
+            return
+        any_valid = valid.any(axis=0)
+        first_new = n_old + np.argmax(valid, axis=0)
+        last_new = n_old + len(valid) - 1 - np.argmax(valid[::-1], axis=0)
+        self.first = np.where((self.first < 0) & any_valid, first_new, self.first)
+        self.last = np.where(any_valid, last_new, self.last)
+        self.counts += valid.sum(axis=0)
+
+        partial = n_old % 8
+        byte_start = n_old // 8
+        if partial:
+            tail = np.unpackbits(self._bits_buffer[byte_start:byte_start + 1], axis=0, count=partial).astype(bool)
+            valid = np.vstack([tail, valid])
+        self._bits_buffer, _ = append_rows(self._bits_buffer, byte_start, np.packbits(valid, axis=0))
+
+    def extend(self, new_values):
+        """
+        每日更新：panel 尾端加入新的報酬列時一併延長
+        """
+        new_values = np.asarray(new_values).reshape(-1, self.n_assets)
+        self._append(~np.isnan(new_values), self.n_days)
+        self.n_days += len(new_values)
+        self._ranges = {}
+        self._holes = {}
+
+    def _asset_idx(self, asset_idx):
+        return np.arange(self.n_assets) if asset_idx is None else np.asarray(asset_idx, dtype=np.intp)
+
+    def valid_mask(self, asset_idx=None):
+        """
+        asset_idx 這組資產「全部都有資料」的日期（長度 n_days 的 bool 陣列）
+        """
+        asset_idx = self._asset_idx(asset_idx)
+        combined = np.bitwise_and.reduce(self.bits[:, asset_idx], axis=1)
+        return np.unpackbits(combined, count=self.n_days).astype(bool)
+
+    def valid_range(self, asset_idx=None):
+        """
+        asset_idx 這組資產的共同有效區間 [lo, hi)（整數位置）：最晚的第一筆資料到最早的最後一筆資料
+        沒有任何共同有效日時拋出 ValueError
+        區間中個別資產缺值的日期（見 holes）不會把區間截斷，由估計與回測逐日略過，
+        等同只對這組資產做 dropna（缺一天價格只少掉兩天報酬，不會丟掉缺值之前的歷史）
+        同一組資產的結果會保留到下次 extend
+        """
+        asset_idx = self._asset_idx(asset_idx)
+        key = asset_idx.tobytes()
+        if key in self._ranges:
+            return self._ranges[key]
+
+        first, last = self.first[asset_idx], self.last[asset_idx]
+        if (first < 0).any():
+            raise ValueError("部分資產沒有任何資料")
+
+        lo, hi = int(first.max()), int(last.min()) + 1
+        if hi <= lo or len(self.holes(asset_idx)) == hi - lo:
+            raise ValueError("這組資產沒有共同的有效日期")
+        self._ranges[key] = (lo, hi)
+        return lo, hi
+
+    def holes(self, asset_idx=None, start_pos=None, end_pos=None):
+        """
+        共同有效區間內這組資產「有任一檔缺值」的位置（排序好的 int64 陣列），可再限制在 [start_pos, end_pos)
+        各資產中間都沒有缺值時不必解開位元矩陣；同一組資產的結果會保留到下次 extend
+        """
+        asset_idx = self._asset_idx(asset_idx)
+        key = asset_idx.tobytes()
+        if key not in self._holes:
+            first, last = self.first[asset_idx], self.last[asset_idx]
+            if np.all(self.counts[asset_idx] == last - first + 1):
+                holes = np.zeros(0, dtype=np.int64)
+            else:
+                lo, hi = int(first.max()), int(last.min()) + 1
+                holes = np.flatnonzero(~self.valid_mask(asset_idx)[lo:max(hi, lo)]).astype(np.int64) + lo
+            self._holes[key] = holes
+
+        holes = self._holes[key]
+        if start_pos is None and end_pos is None:
+            return holes
+        lo = 0 if start_pos is None else np.searchsorted(holes, start_pos, side='left')
+        hi = len(holes) if end_pos is None else np.searchsorted(holes, end_pos, side='left')
+        return holes[lo:hi]
+
+    def is_complete(self, lo, hi):
+        """
+        [lo, hi) 區間內是否所有資產都有資料（此時可直接對整列報酬做矩陣運算，不必先取資產子集合）
+        """
+        try:
+            full_lo, full_hi = self.valid_range()
+        except ValueError:
+            return False
+        return full_lo <= lo and hi <= full_hi and len(self.holes(None, lo, hi)) == 0
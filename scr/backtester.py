@@ -1,80 +1,320 @@
+import time
 import pandas as pd
 import numpy as np
+from scr.portfolio_optimizer import OptimizationError
+from scr.performance import compute_performance_metrics
+from scr.rebalancing import parse_rebalance_freq, rebalance_offset, drift_block
+from scr import instrumentation
 
 class Backtester:
-    def __init__(self, optimizer, asset_list, rebalance_freq='6M'):
+    # 這組資產至少佔 panel 欄位的這個比例時，才把權重攤成全部欄位、直接乘在連續區塊上
+    # （取子集合欄位要逐列 gather，約為連續讀取的 5 倍成本；資產少時只乘這幾欄比較快）
+    FULL_WIDTH_FRACTION = 0.2
+
+    def __init__(self, optimizer, asset_list, rebalance_freq='6M', drift=False, cost_rate=0.0, fixed_cost=0.0,
+                 initial_capital=1.0, threshold=None, lookback_years=5):
+        """
+        rebalance_freq: 排定的 rebalance 週期（'6M'、'Q'、'1Y'、'2W' ...），每次都重新估參數、求權重
+        lookback_years: 每次 rebalance 往回取幾年的報酬估參數
+        drift: False ➜ 區間內每天都維持目標權重（原本的算法，等同每日再平衡且不計成本）
+               True  ➜ 期初調整到目標權重後各資產隨市場漂移，只在 rebalance 時交易並扣成本
+        cost_rate: 交易成本佔成交金額的比例（例如 0.001 = 10 bps），含期初建倉
+        fixed_cost: 每次交易的固定成本，單位與 initial_capital 相同
+        threshold: 兩次排定的 rebalance 之間，任一資產權重偏離目標超過此值時提前調回目標（不重新估參數）
+        """
+        parse_rebalance_freq(rebalance_freq)
+        if not drift and (cost_rate or fixed_cost or threshold is not None):
+            raise ValueError("交易成本與門檻再平衡需要 drift=True")
+
         self.optimizer = optimizer
         self.asset_list = asset_list
         self.rebalance_freq = rebalance_freq
-        self.returns = optimizer.returns[asset_list]
+        self.drift = drift
+        self.cost_rate = cost_rate
+        self.fixed_cost = fixed_cost
+        self.initial_capital = initial_capital
+        self.threshold = threshold
+        self.lookback_years = lookback_years
+        self.asset_idx = optimizer.get_asset_positions(asset_list)
+
+    def options(self):
+        """
+        建構參數（不含 optimizer / asset_list），平行運算時在 worker 端建立相同設定的 Backtester
+        """
+        return {
+            'rebalance_freq': self.rebalance_freq,
+            'drift': self.drift,
+            'cost_rate': self.cost_rate,
+            'fixed_cost': self.fixed_cost,
+            'initial_capital': self.initial_capital,
+            'threshold': self.threshold,
+            'lookback_years': self.lookback_years
+        }
+
+    def valid_range(self):
+        """
+        這組資產在 panel 上的共同有效區間 [lo, hi)，回測與估參數都只用這一段（不複製 panel）
+        區間中這組資產有缺值的日子，估參數時整列略過，回測報酬矩陣在這些日子為 NaN（績效指標視為缺值）
+        """
+        return self.optimizer.get_valid_range(asset_idx=self.asset_idx)
+
+    @property
+    def panel(self):
+        """
+        直接使用 optimizer 的 ReturnPanel（不另外複製這組資產的報酬），optimizer 延長或重建後自動跟上
+        """
+        return self.optimizer.panel
 
     def run_backtest(self, start_date, end_date, allow_short=False, equal_weight=False):
         """
         回測主流程
-        每個 rebalance 週期重新計算權重
+        每個 rebalance 週期重新計算權重（單一起始日版本，內部交給批次引擎處理）
         """
-        # 初始化
-        current_date = pd.to_datetime(start_date)
+        start_date = pd.to_datetime(start_date)
         end_date = pd.to_datetime(end_date)
-        all_returns = []
 
-        # 只取有資料的部分
-        returns_df = self.returns.loc[start_date:end_date]
+        strategy = "equal" if equal_weight else "max_sharpe"
+        matrices, start_pos = self._run_batch(pd.DatetimeIndex([start_date]), pd.DatetimeIndex([end_date]),
+                                              strategies=(strategy,), allow_short=allow_short)
 
-        while current_date < end_date:
-            # 決定下一次rebalance的時間
-            next_rebalance_date = current_date + pd.DateOffset(months=6)
+        # 去掉補齊用的 NaN 與這組資產缺值的日子，還原成有日期 index 的序列
+        row = matrices[strategy][0]
+        valid = np.flatnonzero(~np.isnan(row))
+        if len(valid) == 0:
+            return pd.Series(dtype=float)
+        index = self.panel.index[start_pos[0] + valid]
+        return pd.Series(row[valid], index=index)
 
-            if next_rebalance_date > end_date:
-                next_rebalance_date = end_date
+    def run_backtest_batch(self, start_dates, holding_years=3, allow_short=False, equal_weight=False):
+        """
+        批次回測：一次處理多個起始日
+        回傳 (trials × days) 的投資組合日報酬矩陣，每一列對應一個起始日，長度不足的部分補 NaN
+        """
+        strategy = "equal" if equal_weight else "max_sharpe"
+        return self.run_strategies_batch(start_dates, holding_years=holding_years, strategies=(strategy,),
+                                         allow_short=allow_short)[strategy]
 
-            # 抓這一段期間內的資料
-            period_returns = returns_df.loc[current_date:next_rebalance_date]
+    def run_strategies_batch(self, start_dates, holding_years=3,
+                             strategies=("max_sharpe", "min_variance", "risk_parity"), allow_short=False):
+        """
+        多策略批次回測：每個估計區間只估一次 (μ, Σ)，所有策略共用同一個 FrontierSolver
+        strategies 的寫法見 PortfolioOptimizer.optimize_strategy
+        回傳 {strategy: (trials × days) 報酬矩陣}
+        """
+        start_dates = pd.DatetimeIndex(pd.to_datetime(start_dates))
+        end_dates = start_dates + pd.DateOffset(years=holding_years)
 
-            if len(period_returns) == 0:
-                break
+        matrices, _ = self._run_batch(start_dates, end_dates, strategies=strategies, allow_short=allow_short)
+        return matrices
 
-            # 在current_date這天，重新估參數
-            estimation_end_date = current_date - pd.Timedelta(days=1)
-            estimation_start_date = estimation_end_date - pd.DateOffset(years=5)
+    def _plan_rebalances(self, start_dates, end_dates):
+        """
+        事先把每個 trial 的 rebalance 日換算成 panel 日期上的整數位置
+        回傳 boundaries (trials × (n_periods + 1))、估計區間起點 (trials × n_periods)、rebalance 日期 (trials × n_periods)
+        第 k 段的資料為 [boundaries[:, k], boundaries[:, k + 1])，
+        估計區間為 [estimation_start[:, k], boundaries[:, k])，也就是 rebalance 前一天往回 lookback_years 年
+        所有位置都限制在這組資產的有效區間內：區間之前的日期如同 panel 的開頭，之後如同資料結束
+        """
+        panel = self.panel
+        lo, hi = self.valid_range()
+        end_pos = np.clip(panel.searchsorted(end_dates, side='right'), lo, hi)
 
-            try:
-                mu, sigma = self.optimizer.estimate_parameters(estimation_start_date, estimation_end_date,
-                                                               self.asset_list)
-            except:
-                print(f"估計失敗，跳過 {current_date}")
+        # 各 trial 的 rebalance 日：start, start + freq, start + 2 × freq ...（一次對所有起始日做日期位移）
+        rebalance_dates = [start_dates]
+        while True:
+            next_dates = start_dates + rebalance_offset(self.rebalance_freq, len(rebalance_dates))
+            if (next_dates >= end_dates).all():
                 break
+            rebalance_dates.append(next_dates)
 
-            # 根據設定決定權重
-            if equal_weight:
-                weights = self.optimizer.get_equal_weight_portfolio(self.asset_list)
-            else:
-                weights = self.optimizer.optimize_portfolio(mu, sigma, allow_short=allow_short)
+        boundaries = np.column_stack([panel.searchsorted(dates, side='left') for dates in rebalance_dates] + [end_pos])
+        # 超過結束日的 rebalance 直接併到最後一段
+        boundaries = np.clip(boundaries, lo, end_pos[:, None])
 
-            # 計算這段期間的投資組合報酬
-            portfolio_returns = self.calculate_portfolio_return(weights, period_returns)
+        estimation_start = np.column_stack([
+            panel.searchsorted(dates - pd.Timedelta(days=1) - pd.DateOffset(years=self.lookback_years),
+                               side='left')
+            for dates in rebalance_dates
+        ])
+        estimation_start = np.maximum(estimation_start, lo)
 
-            # 存起來
-            all_returns.append(portfolio_returns)
+        rebalance_dates = np.column_stack([dates.values for dates in rebalance_dates])
+        return boundaries, estimation_start, rebalance_dates
 
-            # 移動到下一次rebalance
-            current_date = next_rebalance_date
+    @instrumentation.timed("Backtester.run_backtest")
+    def _run_batch(self, start_dates, end_dates, strategies=("max_sharpe",), allow_short=False):
+        """
+        批次回測核心：把所有 trial 的 rebalance 區間去除重複後估參數、求權重，
+        再把權重套用到連續的 NumPy 區塊上
+        回傳 ({strategy: 報酬矩陣}, 每個 trial 第一天在 panel 中的位置)
+        """
+        panel = self.panel
+        returns_values = panel.values
+        with instrumentation.section("Backtester.run_backtest.plan"):
+            boundaries, estimation_start, rebalance_dates = self._plan_rebalances(start_dates, end_dates)
 
-        # 把所有段落串起來成一條完整序列
-        if all_returns:
-            full_returns = pd.concat(all_returns)
-            full_returns = full_returns.loc[start_date:end_date]  # 確保沒超過
-            return full_returns
-        else:
-            return pd.Series(dtype=float)
+        start_pos = boundaries[:, 0]
+        lengths = boundaries[:, -1] - start_pos
+        n_trials = len(start_dates)
+        max_days = int(lengths.max()) if n_trials > 0 else 0
+
+        # 每個 trial 遇到第一個空區塊（資料用完）就結束
+        active = np.cumprod(boundaries[:, 1:] > boundaries[:, :-1], axis=1).astype(bool)
+
+        # 起始日相近的 trial 會在同一天 rebalance：相同的估計區間只求解一次，所有 trial 共用
+        n_positions = len(returns_values) + 1
+        window_keys = estimation_start.astype(np.int64) * n_positions + boundaries[:, :-1]
+        unique_keys, inverse = np.unique(window_keys[active], return_inverse=True)
+        window_id = np.full(window_keys.shape, -1)
+        window_id[active] = inverse
+
+        with instrumentation.section("Backtester.run_backtest.solve"):
+            strategy_weights, strategy_errors = self._solve_windows(unique_keys // n_positions,
+                                                                    unique_keys % n_positions,
+                                                                    strategies=strategies, allow_short=allow_short)
+
+        # 這組資產佔大部分欄位、且這段期間所有欄位都有資料時，權重攤成全部欄位的長度，
+        # 直接乘在 panel 的連續區塊（view）上；資產只佔少數欄位，或其他資產有 NaN 時（例如還沒上市）只取這組資產的欄位
+        full_width = (len(self.asset_idx) >= self.FULL_WIDTH_FRACTION * len(panel.columns)
+                      and self.optimizer.availability.is_complete(*self.valid_range()))
+
+        # 開啟 instrumentation 時才累計「套用權重」的時間
+        profiling = instrumentation.is_enabled()
+        apply_timer = time.perf_counter() if profiling else 0.0
+        n_blocks = 0
+
+        matrices = {}
+        n_trades = 0
+        total_turnover = 0.0
+        for strategy in strategies:
+            # drift 模式要逐資產累乘，只取這組資產的欄位
+            window_weights = strategy_weights[strategy]
+            if not self.drift and full_width:
+                window_weights = [None if weights is None else panel.expand_weights(weights, self.asset_idx)
+                                  for weights in window_weights]
+            window_errors = strategy_errors[strategy]
+            label = f"[{strategy}] " if len(strategies) > 1 else ""
+            matrix = np.full((n_trials, max_days), np.nan)
+
+            for i in range(n_trials):
+                holdings, nav = None, self.initial_capital
+                for k in range(rebalance_dates.shape[1]):
+                    if not active[i, k]:
+                        break
+
+                    weights = window_weights[window_id[i, k]]
+                    if weights is None:
+                        print(f"{label}{window_errors[window_id[i, k]]}，跳過 {pd.Timestamp(rebalance_dates[i, k]).date()}")
+                        break
+
+                    # 這段期間的投資組合報酬直接寫進矩陣
+                    block_start, block_end = boundaries[i, k], boundaries[i, k + 1]
+                    offset = block_start - start_pos[i]
+                    if self.drift:
+                        block, holdings, nav, trades, turnover = drift_block(
+                            returns_values[block_start:block_end, self.asset_idx], weights, holdings,
+                            cost_rate=self.cost_rate, fixed_cost=self.fixed_cost, nav=nav, threshold=self.threshold)
+                        n_trades += trades
+                        total_turnover += turnover
+                    elif full_width:
+                        block = returns_values[block_start:block_end] @ weights
+                    else:
+                        block = returns_values[block_start:block_end, self.asset_idx] @ weights
+                    matrix[i, offset:offset + block_end - block_start] = block
+                    n_blocks += 1
+
+            matrices[strategy] = matrix
+
+        if profiling:
+            instrumentation.record("Backtester.run_backtest.apply", time.perf_counter() - apply_timer, n_blocks)
+            instrumentation.count("Backtester.rebalances", n_blocks)
+            instrumentation.count("Backtester.unique_windows", len(unique_keys))
+            if self.drift:
+                instrumentation.count("Backtester.trades", n_trades)
+                instrumentation.count("Backtester.turnover_bps", int(round(total_turnover * 1e4)))
+
+        return matrices, start_pos
+
+    def _solve_windows(self, estimation_starts, rebalance_positions, strategies=("max_sharpe",), allow_short=False):
+        """
+        對每個不重複的估計區間 [estimation_starts[j], rebalance_positions[j]) 估一次參數，再求各策略的權重
+        區間依日期排序，每個策略前一個區間的解拿來 warm start 下一個
+        max_sharpe 走 solve_by_position（沿用 OptimizerCache），其他策略共用同一個 FrontierSolver
+        回傳 ({strategy: weights list}, {strategy: 錯誤訊息 list})，失敗的區間 weights 為 None
+        """
+        window_weights = {strategy: [] for strategy in strategies}
+        window_errors = {strategy: [] for strategy in strategies}
+        # 等權重與 max_sharpe 之外的策略才需要先估好 (μ, Σ) 並建 FrontierSolver
+        needs_estimate = any(strategy not in ("max_sharpe", "equal") for strategy in strategies)
+        equal_weights = np.ones(len(self.asset_idx)) / len(self.asset_idx)
+        previous = {}
+        for estimation_start, rebalance_pos in zip(estimation_starts, rebalance_positions):
+            # 估計區間資料不足時所有策略都略過這一期（等權重也一樣，與原本先估參數再決定權重的流程相同）
+            if rebalance_pos - estimation_start < 2:
+                for strategy in strategies:
+                    window_weights[strategy].append(None)
+                    window_errors[strategy].append("估計失敗")
+                continue
+
+            solved, errors = {}, {}
+            if "equal" in strategies:
+                solved["equal"] = equal_weights
+
+            # 在 rebalance 日，用前一天往回 lookback_years 年的資料重新估參數（只有 max_sharpe 時交給 solve_by_position，快取命中就不必估）
+            estimate = None
+            try:
+                if needs_estimate:
+                    estimate = self.optimizer.estimate_covariance_by_position(estimation_start, rebalance_pos,
+                                                                              self.asset_idx)
+                if "max_sharpe" in strategies:
+                    try:
+                        _, _, weights = self.optimizer.solve_by_position(
+                            estimation_start, rebalance_pos, self.asset_list, allow_short=allow_short,
+                            initial_weights=previous.get("max_sharpe"), asset_idx=self.asset_idx, estimate=estimate)
+                        solved["max_sharpe"] = np.asarray(weights)
+                    except (OptimizationError, np.linalg.LinAlgError):
+                        errors["max_sharpe"] = "最適化失敗"
+            except ValueError:
+                errors = {strategy: "估計失敗" for strategy in strategies if strategy not in solved}
+
+            # 其他策略：同一組 (μ, Σ) 共用一個 solver（Cholesky 分解只做一次）
+            solver = None
+            for strategy in strategies:
+                if strategy in solved or strategy in errors:
+                    continue
+                try:
+                    if solver is None:
+                        solver = self.optimizer.frontier_solver(*estimate, initial_weights=previous.get("min_variance"))
+                    solved[strategy] = self.optimizer.optimize_strategy(solver, strategy, allow_short=allow_short,
+                                                                        initial_weights=previous.get(strategy))
+                except (OptimizationError, np.linalg.LinAlgError):
+                    errors[strategy] = "最適化失敗"
+
+            for strategy in strategies:
+                weights = solved.get(strategy)
+                window_weights[strategy].append(weights)
+                window_errors[strategy].append(errors.get(strategy))
+                if weights is not None:
+                    previous[strategy] = weights
+
+        return window_weights, window_errors
 
     def calculate_portfolio_return(self, weights, returns_df):
         """
         給定權重與報酬率資料，計算組合的日報酬率序列
+        drift=True 時為期初建倉後買進持有（含交易成本與門檻再平衡），否則每天維持 weights
         """
         # weights shape: (n_assets,)
         # returns_df shape: (n_days, n_assets)
 
+        if self.drift:
+            portfolio_returns, _, _, _, _ = drift_block(returns_df, weights, cost_rate=self.cost_rate,
+                                                        fixed_cost=self.fixed_cost, nav=self.initial_capital,
+                                                        threshold=self.threshold)
+            if isinstance(returns_df, pd.DataFrame):
+                portfolio_returns = pd.Series(portfolio_returns, index=returns_df.index)
+            return portfolio_returns
+
         # (n_days, n_assets) dot (n_assets,) -> (n_days,)
         portfolio_returns = returns_df @ weights
 
@@ -83,27 +323,6 @@ class Backtester:
     def evaluate_performance(self, portfolio_returns):
         """
         給定投資組合日報酬率，計算各種績效指標
+        portfolio_returns 也可以是 run_backtest_batch 回傳的 (trials × days) 矩陣，此時每個指標為一個 ndarray
         """
-        n_days = len(portfolio_returns)
-        cumulative_return = (1 + portfolio_returns).prod() - 1
-        annualized_return = (1 + cumulative_return) ** (252 / n_days) - 1
-
-        annualized_volatility = portfolio_returns.std() * np.sqrt(252)
-
-        if annualized_volatility != 0:
-            sharpe_ratio = annualized_return / annualized_volatility
-        else:
-            sharpe_ratio = np.nan
-
-        cumulative_nav = (1 + portfolio_returns).cumprod()
-        historical_max = cumulative_nav.cummax()
-        drawdowns = (cumulative_nav - historical_max) / historical_max
-        max_drawdown = drawdowns.min()
-
-        return {
-            'Annualized Return': annualized_return,
-            'Annualized Volatility': annualized_volatility,
-            'Sharpe Ratio': sharpe_ratio,
-            'Max Drawdown': max_drawdown
-        }
-
+        return compute_performance_metrics(portfolio_returns, axis=-1)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.portfolio_optimizer import PortfolioOptimizer
+
+
+def make_prices(n_assets=5, n_days=2800, seed=0, start="2000-01-03"):
+    """
+    測試用的合成價格表：共同因子 + 個別雜訊，各資產期望報酬不同（讓最大 Sharpe 解不是退化的單一資產）
+    """
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0003, 0.009, (n_days, 1))
+    drift = np.linspace(0.0001, 0.0005, n_assets)
+    returns = market * rng.uniform(0.3, 1.2, n_assets) + drift + rng.normal(0, 0.006, (n_days, n_assets))
+    prices = 100 * np.cumprod(1 + returns, axis=0)
+    index = pd.bdate_range(start, periods=n_days, name="Date")
+    return pd.DataFrame(prices, index=index, columns=[f"A{i}" for i in range(n_assets)])
+
+
+def write_price_csv(path, series, null_dates=()):
+    """
+    寫出與資料夾中 Yahoo 格式相同的 CSV（Adj Close 以外的欄位只是填充），null_dates 的價格寫成 null
+    """
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Date,Open,High,Low,Close,Adj Close,Volume\n")
+        for date, price in series.items():
+            adj_close = "null" if date in null_dates else f"{price:.6f}"
+            f.write(f"{date:%Y-%m-%d},{price:.6f},{price:.6f},{price:.6f},{price:.6f},{adj_close},0\n")
+
+
+@pytest.fixture
+def price_csv_writer():
+    """
+    讓測試自己寫出 CSV（conftest 不當一般模組匯入），用法同 write_price_csv
+    """
+    return write_price_csv
+
+
+@pytest.fixture
+def csv_dir(tmp_path, prices):
+    """
+    每個資產一個 CSV，第二個資產晚 30 天上市、第一個資產中間有一天是 null
+    回傳 (資料夾, {代碼: 檔名})
+    """
+    files = {}
+    for i, column in enumerate(prices.columns[:3]):
+        series = prices[column].iloc[30:300] if i == 1 else prices[column].iloc[:300]
+        null_dates = {prices.index[120]} if i == 0 else ()
+        write_price_csv(tmp_path / f"{column}.csv", series, null_dates)
+        files[column] = f"{column}.csv"
+    return tmp_path, files
+
+
+@pytest.fixture
+def prices():
+    return make_prices()
+
+
+@pytest.fixture
+def gap_prices(prices):
+    """
+    第三個資產中間有一天沒有價格（報酬少兩天），其他資產完整
+    """
+    prices = prices.copy()
+    prices.iloc[1500, 2] = np.nan
+    return prices
+
+
+@pytest.fixture
+def optimizer(prices):
+    return PortfolioOptimizer(prices)
+
+
+@pytest.fixture
+def assets(prices):
+    return list(prices.columns)
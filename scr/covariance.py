@@ -0,0 +1,182 @@
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, eigh
+
+
+class DenseCovariance:
+    def __init__(self, matrix):
+        """
+        一般的共變異數矩陣；solve() 用第一次需要時才做的 Cholesky 分解（之後重複使用），不求反矩陣
+        """
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.n_assets = len(self.matrix)
+        self._factor = None
+
+    def solve(self, b):
+        """
+        Σ⁻¹ b（b 可以是向量或 (n_assets × m) 矩陣）；Σ 不是正定時拋出 np.linalg.LinAlgError
+        """
+        if self._factor is None:
+            self._factor = cho_factor(self.matrix)
+        return cho_solve(self._factor, np.asarray(b, dtype=float))
+
+    def scaled(self, factor):
+        return DenseCovariance(self.matrix * factor)
+
+    def __getstate__(self):
+        # 存進快取檔或傳給 worker 時不帶分解結果，需要時再算
+        return {'matrix': self.matrix, 'n_assets': self.n_assets, '_factor': None}
+
+    def subset(self, asset_idx):
+        """
+        asset_idx 這幾檔資產的子矩陣（Σ 的主子矩陣，不重新估計）
+        """
+        return DenseCovariance(self.matrix[np.ix_(asset_idx, asset_idx)])
+
+
+class FactorCovariance:
+    def __init__(self, loadings, specific):
+        """
+        低秩因子模型 Σ = U U' + diag(d)
+        loadings: U (n_assets × k)，已含因子的波動（例如 PCA 的 特徵向量 × sqrt(特徵值)）
+        specific: d (n_assets,)，個別資產的殘差變異數，必須為正
+
+        solve() 用 Woodbury 公式，只分解 k × k 的 I + U'D⁻¹U，成本 O(n·k²)；
+        需要完整矩陣時（例如不放空的 active-set）才由 matrix 展開
+        """
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific = np.asarray(specific, dtype=float)
+        self.n_assets = len(self.specific)
+        self._matrix = None
+        self._factor = None
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = self.loadings @ self.loadings.T
+            self._matrix[np.diag_indices(self.n_assets)] += self.specific
+        return self._matrix
+
+    def solve(self, b):
+        """
+        Σ⁻¹ b = D⁻¹b - D⁻¹U (I + U'D⁻¹U)⁻¹ U'D⁻¹b
+        """
+        b = np.asarray(b, dtype=float)
+        scaled_loadings = self.loadings / self.specific[:, None]
+        if self._factor is None:
+            capacitance = np.eye(self.loadings.shape[1]) + self.loadings.T @ scaled_loadings
+            self._factor = cho_factor(capacitance)
+
+        scaled_b = b / (self.specific if b.ndim == 1 else self.specific[:, None])
+        return scaled_b - scaled_loadings @ cho_solve(self._factor, self.loadings.T @ scaled_b)
+
+    def scaled(self, factor):
+        return FactorCovariance(self.loadings * np.sqrt(factor), self.specific * factor)
+
+    def __getstate__(self):
+        # 只保存 U 與 d（O(n·k)），展開的矩陣與分解都在需要時重建
+        return {'loadings': self.loadings, 'specific': self.specific, 'n_assets': self.n_assets,
+                '_matrix': None, '_factor': None}
+
+    def subset(self, asset_idx):
+        """
+        asset_idx 這幾檔資產的子模型：只取對應的 loadings 列與殘差變異數，仍是因子模型
+        """
+        return FactorCovariance(self.loadings[asset_idx], self.specific[asset_idx])
+
+
+def as_covariance(sigma):
+    """
+    ndarray / DataFrame ➜ DenseCovariance；已經是共變異數物件（有 solve）就直接回傳
+    """
+    if hasattr(sigma, "solve"):
+        return sigma
+    return DenseCovariance(np.asarray(sigma, dtype=float))
+
+
+class SampleEstimator:
+    name = "sample"
+
+    def __call__(self, mean, cov, n_obs, block):
+        """
+        樣本共變異數（ddof=1），與原本的估計方式相同
+        mean / cov: RollingMoments.window() 的結果；block: 呼叫後回傳該區間的日報酬矩陣（用不到時不會讀取）
+        """
+        return DenseCovariance(cov)
+
+
+class ShrinkageEstimator:
+    def __init__(self, method="ledoit_wolf"):
+        """
+        往 μ·I（μ = 平均變異數）收縮的共變異數：Σ = (1 - δ) S + δ μ I
+        method: "ledoit_wolf" ➜ Ledoit-Wolf (2004) 的最適 δ，需要讀一次區間報酬（O(T·n)）
+                "oas"         ➜ Oracle Approximating Shrinkage（Chen et al. 2010），只用 S，不讀原始資料
+        S 沿用 ddof=1 的樣本共變異數
+        """
+        if method not in ("ledoit_wolf", "oas"):
+            raise ValueError(f"不支援的收縮方法：{method}")
+        self.method = method
+        self.name = method
+
+    def __call__(self, mean, cov, n_obs, block):
+        n_assets = len(cov)
+        mu = np.trace(cov) / n_assets
+
+        if self.method == "oas":
+            alpha = np.mean(cov ** 2)
+            numerator = alpha + mu ** 2
+            denominator = (n_obs + 1) * (alpha - mu ** 2 / n_assets)
+            shrinkage = 1.0 if denominator == 0 else min(numerator / denominator, 1.0)
+        else:
+            # π：各期外積與 S 的距離（只需要每一天的 ||x_t||⁴，不必建 T 個外積）
+            centered = block() - mean
+            squared_norms = np.einsum('ij,ij->i', centered, centered)
+            biased = cov * (n_obs - 1) / n_obs
+            biased_mu = np.trace(biased) / n_assets
+            distance = np.sum(biased ** 2) - 2 * biased_mu * np.trace(biased) + n_assets * biased_mu ** 2
+            pi = (np.sum(squared_norms ** 2) / n_obs - np.sum(biased ** 2)) / n_obs
+            shrinkage = 0.0 if distance <= 0 else min(max(pi / distance, 0.0), 1.0)
+
+        shrunk = (1 - shrinkage) * cov
+        shrunk[np.diag_indices(n_assets)] += shrinkage * mu
+        return DenseCovariance(shrunk)
+
+
+class FactorEstimator:
+    def __init__(self, n_factors=5, min_specific=1e-6):
+        """
+        PCA 因子模型：取 S 最大的 n_factors 個特徵值 / 特徵向量當作共同因子，其餘放進對角的個別變異數
+        回傳 FactorCovariance，允許放空的求解走 Woodbury（資產很多時遠比分解 n × n 便宜）
+        min_specific: 個別變異數的下限（相對於平均變異數），確保 Σ 正定
+        """
+        self.n_factors = n_factors
+        self.min_specific = min_specific
+        self.name = f"pca{n_factors}"
+
+    def __call__(self, mean, cov, n_obs, block):
+        n_assets = len(cov)
+        k = max(1, min(self.n_factors, n_assets - 1))
+        values, vectors = eigh(cov, subset_by_index=[n_assets - k, n_assets - 1])
+        loadings = vectors * np.sqrt(np.maximum(values, 0))
+
+        specific = np.diag(cov) - np.sum(loadings ** 2, axis=1)
+        specific = np.maximum(specific, self.min_specific * np.trace(cov) / n_assets)
+        return FactorCovariance(loadings, specific)
+
+
+ESTIMATORS = {
+    "sample": SampleEstimator,
+    "ledoit_wolf": lambda: ShrinkageEstimator("ledoit_wolf"),
+    "oas": lambda: ShrinkageEstimator("oas"),
+    "pca": FactorEstimator,
+}
+
+
+def get_estimator(estimator):
+    """
+    名稱（ESTIMATORS 的 key）或自訂的 estimator 物件（需有 name 屬性並可用 (mean, cov, n_obs, block) 呼叫）
+    """
+    if isinstance(estimator, str):
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"不支援的共變異數估計方法：{estimator}")
+        return ESTIMATORS[estimator]()
+    return estimator
@@ -0,0 +1,265 @@
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+from scr.portfolio_optimizer import OptimizationError
+from scr.covariance import as_covariance
+from scr import instrumentation
+
+
+class FrontierSolver:
+    def __init__(self, mu, sigma, initial_weights=None):
+        """
+        同一組 (μ, Σ) 上一次求多種組合：最小變異、目標報酬、目標波動、風險平價、整條效率前緣
+        Σ（以及不放空時每個自由資產集合的子矩陣）只做一次 Cholesky 分解，所有組合共用
+        sigma 可以是矩陣或 scr.covariance 的共變異數物件；全部資產都自由時（允許放空）直接用它的 solve
+
+        不放空的效率前緣用 critical line 的方式求：對風險容忍度 t 解
+            min ½ w'Σw - t μ'w   s.t.  1'w = 1, w ≥ 0
+        自由資產集合 F 固定時 w(t) = a + t·c 為 t 的線性函數，
+        從 t = 0（最小變異）往上走，每遇到權重碰到 0 或有資產加入就換下一段，直到只剩報酬最高的資產
+
+        initial_weights: 上一期的最小變異權重，持有集合拿來 warm start t = 0 的 active-set
+        """
+        self.mu = np.asarray(mu, dtype=float)
+        self.covariance = as_covariance(sigma)
+        self.sigma = self.covariance.matrix
+        self.n_assets = len(self.mu)
+        self.initial_weights = None if initial_weights is None else np.asarray(initial_weights, dtype=float)
+
+        self._factors = {}  # 自由集合 ➜ (Σ_FF^-1 1, Σ_FF^-1 μ)
+        self._segments = None
+
+    def _coefficients(self, free):
+        """
+        自由集合 F 上的解 w(t) = a + t·c 與 KKT 乘數 ν(t) = p + t·q（F 以外的資產）
+        同一個 F 只分解一次
+        """
+        key = free.tobytes()
+        if key not in self._factors:
+            rhs = np.column_stack([np.ones(free.sum()), self.mu[free]])
+            try:
+                if free.all():
+                    solved = self.covariance.solve(rhs)
+                else:
+                    solved = cho_solve(cho_factor(self.sigma[np.ix_(free, free)]), rhs)
+            except LinAlgError:
+                raise OptimizationError('Optimization failed: covariance matrix is not positive definite') from None
+            self._factors[key] = (solved[:, 0], solved[:, 1])
+            instrumentation.count("FrontierSolver.factorizations")
+        u, v = self._factors[key]
+
+        sum_u, sum_v = u.sum(), v.sum()
+        a = np.zeros(self.n_assets)
+        c = np.zeros(self.n_assets)
+        a[free] = u / sum_u
+        if free.sum() > 1:
+            # 只剩一檔時權重固定為 1（c 理論上為 0，避免捨入誤差造成假的轉折點）
+            c[free] = v - sum_v / sum_u * u
+
+        # ν = Σw - tμ - λ·1，λ(t) = (1 - t·Σv) / Σu
+        p = self.sigma @ a - 1 / sum_u
+        q = self.sigma @ c - self.mu + sum_v / sum_u
+        return a, c, p, q
+
+    def _solve_at(self, t, free=None):
+        """
+        固定 t 的 active-set：與 PortfolioOptimizer._solve_tangency_active_set 相同的架構
+        回傳 (w, free)
+        """
+        n_assets = self.n_assets
+        max_iter = 10 * n_assets + 10
+
+        w = None
+        if free is not None and free.any():
+            a, c, _, _ = self._coefficients(free)
+            candidate = a + t * c
+            if np.all(candidate[free] > 0):
+                w = candidate
+        if w is None:
+            # 單一資產一定可行：取目標函數最小的那一檔
+            best = np.argmin(0.5 * np.diag(self.sigma) - t * self.mu)
+            free = np.zeros(n_assets, dtype=bool)
+            free[best] = True
+            w = free.astype(float)
+
+        for _ in range(max_iter):
+            _, _, p, q = self._coefficients(free)
+            nu = p + t * q
+            tolerance = 1e-12 * max(np.abs(np.diag(self.sigma)).max(), 1e-300)
+            violated = ~free & (nu < -tolerance)
+            if not violated.any():
+                return w, free
+
+            free = free.copy()
+            free[np.argmin(np.where(violated, nu, np.inf))] = True
+
+            for _ in range(max_iter):
+                a, c, _, _ = self._coefficients(free)
+                w_new = a + t * c
+                if np.all(w_new[free] > 0):
+                    w = w_new
+                    break
+
+                blocking = free & (w_new <= 0)
+                alpha = np.min(w[blocking] / (w[blocking] - w_new[blocking]))
+                w = w + alpha * (w_new - w)
+                free = free & (w > 1e-14)
+                w[~free] = 0
+                if not free.any():
+                    raise OptimizationError('Optimization failed: active set became empty')
+            else:
+                raise OptimizationError('Optimization failed: active-set inner loop did not converge')
+
+        raise OptimizationError('Optimization failed: active-set did not converge')
+
+    @instrumentation.timed("FrontierSolver.segments")
+    def segments(self):
+        """
+        不放空效率前緣的所有線段：list of (t_lo, t_hi, a, c)，t 在 [t_lo, t_hi] 時 w = a + t·c
+        最後一段的 t_hi 為 inf（只剩報酬最高的資產，c = 0）
+        """
+        if self._segments is not None:
+            return self._segments
+
+        warm = None if self.initial_weights is None else self.initial_weights > 1e-10
+        _, free = self._solve_at(0.0, warm)
+
+        segments = []
+        t = 0.0
+        for _ in range(4 * self.n_assets + 10):
+            a, c, p, q = self._coefficients(free)
+
+            # 往上走：F 內權重下降到 0 的 t，以及 F 外乘數下降到 0 的 t
+            with np.errstate(divide='ignore', invalid='ignore'):
+                leave = np.where(free & (c < 0), -a / c, np.inf)
+                enter = np.where(~free & (q < 0), -p / q, np.inf)
+            leave = np.maximum(leave, t)
+            enter = np.maximum(enter, t)
+
+            t_next = min(leave.min(), enter.min())
+            segments.append((t, t_next, a, c))
+            if not np.isfinite(t_next):
+                self._segments = segments
+                return segments
+
+            free = free.copy()
+            if leave.min() <= enter.min():
+                free[np.argmin(leave)] = False
+            else:
+                free[np.argmin(enter)] = True
+            t = t_next
+
+        raise OptimizationError('Optimization failed: critical line did not terminate')
+
+    def _unconstrained(self):
+        """
+        允許放空時只有一條線段（全部資產都自由），共用整個 Σ 的 Cholesky 分解
+        """
+        a, c, _, _ = self._coefficients(np.ones(self.n_assets, dtype=bool))
+        return [(0.0, np.inf, a, c)]
+
+    def _lines(self, allow_short):
+        return self._unconstrained() if allow_short else self.segments()
+
+    def min_variance(self, allow_short=False):
+        """
+        最小變異組合（t = 0）
+        """
+        return self._finish(self._lines(allow_short)[0][2])
+
+    def target_return(self, target, allow_short=False):
+        """
+        期望報酬為 target 的效率前緣組合
+        低於最小變異組合的報酬時回傳最小變異組合；不放空且高於單一資產最高報酬時無解
+        """
+        lines = self._lines(allow_short)
+        for t_lo, t_hi, a, c in lines:
+            base, slope = self.mu @ a, self.mu @ c
+            if t_lo == 0 and target <= base:
+                return self._finish(a)
+            if slope > 0 and target <= base + t_hi * slope:
+                return self._finish(a + max((target - base) / slope, t_lo) * c)
+
+        # 前緣終點（報酬最高的資產）：容許捨入誤差
+        end = lines[-1][2]
+        if target <= self.mu @ end + 1e-12 * max(abs(target), 1.0):
+            return self._finish(end)
+        raise OptimizationError(f'Optimization failed: target return {target:.4f} is not attainable')
+
+    def target_volatility(self, target, allow_short=False):
+        """
+        年化波動為 target 的效率前緣組合（報酬最高的那個）
+        低於最小變異組合的波動時回傳最小變異組合；不放空且超過前緣終點時回傳報酬最高的資產
+        """
+        target_variance = target ** 2
+        lines = self._lines(allow_short)
+        for t_lo, t_hi, a, c in lines:
+            # 線段上 var(t) = A + 2Bt + Ct²，t ≥ 0 時單調遞增
+            sigma_a, sigma_c = self.sigma @ a, self.sigma @ c
+            A, B, C = a @ sigma_a, a @ sigma_c, c @ sigma_c
+            if t_lo == 0 and target_variance <= A:
+                return self._finish(a)
+            if C <= 0:
+                continue
+            if target_variance <= A + 2 * B * t_hi + C * t_hi ** 2:
+                t = (-B + np.sqrt(max(B ** 2 - C * (A - target_variance), 0.0))) / C
+                return self._finish(a + min(max(t, t_lo), t_hi) * c)
+        return self._finish(lines[-1][2])
+
+    def frontier(self, n_points=20, allow_short=False, max_return=None):
+        """
+        效率前緣上報酬等距的 n_points 個組合
+        回傳 (期望報酬, 波動, 權重矩陣 (n_points × n_assets))
+        max_return: 前緣的報酬上限，不放空時預設為單一資產最高報酬，允許放空時必須指定
+        """
+        lines = self._lines(allow_short)
+        low = self.mu @ lines[0][2]
+        if max_return is None:
+            if allow_short:
+                raise ValueError("允許放空時前緣沒有上限，請指定 max_return")
+            max_return = self.mu @ lines[-1][2]
+
+        targets = np.linspace(low, max_return, n_points)
+        weights = np.vstack([self.target_return(target, allow_short) for target in targets])
+        volatilities = np.sqrt(np.einsum('ij,jk,ik->i', weights, self.sigma, weights))
+        return weights @ self.mu, volatilities, weights
+
+    @instrumentation.timed("FrontierSolver.risk_parity")
+    def risk_parity(self, budgets=None, initial_weights=None, tol=1e-10, max_iter=1000):
+        """
+        風險平價（各資產的風險貢獻 w_i (Σw)_i 與 budgets 成比例，預設等比例），只有不放空的解
+        以 cyclical coordinate descent 求解 y_i (Σy)_i = b_i，再正規化 w = y / Σy
+        initial_weights: 上一期的風險平價權重，縮放到 y'Σy = 1 後當作起點
+        """
+        n_assets = self.n_assets
+        budgets = np.full(n_assets, 1 / n_assets) if budgets is None else np.asarray(budgets, dtype=float)
+        budgets = budgets / budgets.sum()
+        diagonal = np.diag(self.sigma)
+        if np.any(diagonal <= 0):
+            raise OptimizationError('Optimization failed: non-positive variance')
+
+        if initial_weights is not None and np.all(initial_weights > 0):
+            y = initial_weights / np.sqrt(initial_weights @ self.sigma @ initial_weights)
+        else:
+            y = 1 / np.sqrt(diagonal)
+        sigma_y = self.sigma @ y
+        for iteration in range(max_iter):
+            for i in range(n_assets):
+                # 其他資產對 i 的共變異貢獻（不含自己）
+                others = sigma_y[i] - diagonal[i] * y[i]
+                y_i = (-others + np.sqrt(others ** 2 + 4 * diagonal[i] * budgets[i])) / (2 * diagonal[i])
+                sigma_y += self.sigma[:, i] * (y_i - y[i])
+                y[i] = y_i
+
+            if np.abs(y * sigma_y - budgets).max() <= tol * budgets.max():
+                instrumentation.count("FrontierSolver.risk_parity_iterations", iteration + 1)
+                return y / y.sum()
+
+        raise OptimizationError('Optimization failed: risk parity did not converge')
+
+    @staticmethod
+    def _finish(weights):
+        """
+        去掉線段端點上的捨入誤差（例如 -1e-17），總和維持 1
+        """
+        weights = np.where(np.abs(weights) < 1e-14, 0.0, weights)
+        return weights / weights.sum()
@@ -0,0 +1,153 @@
+"""
+執行時間量測與計數器
+
+預設關閉；設定環境變數 ETF_PROFILE=1 或呼叫 enable() 開啟
+關閉時 timed() 只多一次布林判斷，section() 回傳共用的 nullcontext，不做任何記錄
+ETF_PROFILE_DUMP=檔名 時，main.py 會另外用 cProfile 跑完整流程並輸出 pstats
+"""
+import cProfile
+import contextlib
+import functools
+import os
+import time
+from collections import defaultdict
+
+ENV_ENABLE = "ETF_PROFILE"
+ENV_DUMP = "ETF_PROFILE_DUMP"
+
+_enabled = os.environ.get(ENV_ENABLE, "").lower() not in ("", "0", "false", "no")
+_timings = defaultdict(lambda: [0, 0.0])  # 名稱 ➜ [呼叫次數, 累計秒數]
+_counters = defaultdict(int)
+_run_start = time.perf_counter()
+_NULL_SECTION = contextlib.nullcontext()
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    global _run_start
+    _timings.clear()
+    _counters.clear()
+    _run_start = time.perf_counter()
+
+
+def record(name, elapsed, calls=1):
+    """
+    直接記一筆耗時（給迴圈內自行累計時間的地方使用）
+    """
+    entry = _timings[name]
+    entry[0] += calls
+    entry[1] += elapsed
+
+
+def count(name, n=1):
+    if _enabled:
+        _counters[name] += n
+
+
+def timed(name):
+    """
+    函式裝飾器：開啟時記錄每次呼叫的耗時
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class _Section:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def section(name):
+    """
+    with section("名稱"): ... ，關閉時不做任何事
+    """
+    return _Section(name) if _enabled else _NULL_SECTION
+
+
+def snapshot():
+    """
+    目前累計的資料（可 pickle，平行運算時由 worker 回傳給主 process）
+    """
+    return {
+        'timings': {name: list(entry) for name, entry in _timings.items()},
+        'counters': dict(_counters)
+    }
+
+
+def drain():
+    """
+    取出 snapshot 並清空（worker 每個任務結束時呼叫）
+    """
+    data = snapshot()
+    _timings.clear()
+    _counters.clear()
+    return data
+
+
+def merge(data):
+    """
+    把 worker 的 snapshot 合併進來
+    """
+    for name, (calls, elapsed) in data['timings'].items():
+        record(name, elapsed, calls)
+    for name, value in data['counters'].items():
+        _counters[name] += value
+
+
+def report():
+    """
+    產生這次執行的耗時明細（依累計時間排序）
+    """
+    wall_time = time.perf_counter() - _run_start
+    lines = [f"{'section':<56}{'calls':>10}{'total (s)':>12}{'mean (ms)':>12}{'% wall':>9}"]
+    for name, (calls, elapsed) in sorted(_timings.items(), key=lambda item: -item[1][1]):
+        mean_ms = elapsed / calls * 1000 if calls else 0.0
+        lines.append(f"{name:<56}{calls:>10d}{elapsed:>12.4f}{mean_ms:>12.4f}{elapsed / wall_time * 100:>8.1f}%")
+
+    if _counters:
+        lines.append("")
+        lines.append(f"{'counter':<56}{'value':>10}")
+        for name, value in sorted(_counters.items()):
+            lines.append(f"{name:<56}{value:>10d}")
+
+    lines.append("")
+    lines.append(f"wall time: {wall_time:.4f}s（平行 worker 的時間會疊加，總和可能超過 100%）")
+    return "\n".join(lines)
+
+
+def run_with_cprofile(fn, dump_path, *args, **kwargs):
+    """
+    用 cProfile 執行 fn，並把結果輸出成 pstats 檔（可用 python -m pstats 或 snakeviz 開啟）
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(dump_path)
+        print(f"cProfile 結果已存至 {dump_path}")
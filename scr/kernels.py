@@ -0,0 +1,158 @@
+"""
+路徑相依計算的核心迴圈：淨值 / 最大回撤、權重漂移與門檻再平衡
+
+這些計算每一天都依賴前一天的結果，NumPy 只能用 cumprod / maximum.accumulate 產生整段的暫存矩陣，
+門檻再平衡每觸發一次還要對剩下的天數重算一次 cumprod
+有安裝 numba 時，import 時就改用編譯過的逐日迴圈（一次走完、不配置暫存矩陣）；沒有安裝時沿用 NumPy 版本
+設定環境變數 ETF_NO_JIT=1 可強制使用 NumPy 版本
+
+兩種實作的比對見 scr/test_kernels.py（沒有 numba 時迴圈版本以純 Python 執行，只比對邏輯）
+"""
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENV_DISABLE = "ETF_NO_JIT"
+
+USE_JIT = numba is not None and os.environ.get(ENV_DISABLE, "").lower() in ("", "0", "false", "no")
+
+
+def _jit(fn):
+    """
+    有 numba 時編譯（結果快取到磁碟，下次 import 不必重新編譯）；沒有時保留純 Python 函式，只供測試比對使用
+    """
+    if numba is None:
+        return fn
+    return numba.njit(cache=True)(fn)
+
+
+@_jit
+def _nav_drawdown_loop(filled):
+    n_rows, n_days = filled.shape
+    total_growth = np.ones(n_rows)
+    max_drawdown = np.full(n_rows, np.nan)
+    for i in range(n_rows):
+        nav = 1.0
+        peak = -np.inf
+        worst = np.inf
+        for t in range(n_days):
+            nav *= 1 + filled[i, t]
+            if nav > peak:
+                peak = nav
+            drawdown = (nav - peak) / peak
+            if drawdown < worst:
+                worst = drawdown
+        total_growth[i] = nav
+        if n_days > 0:
+            max_drawdown[i] = worst
+    return total_growth, max_drawdown
+
+
+def _nav_drawdown_numpy(filled):
+    cumulative_nav = np.cumprod(1 + filled, axis=-1)
+    total_growth = cumulative_nav[..., -1]
+    historical_max = np.maximum.accumulate(cumulative_nav, axis=-1)
+    max_drawdown = ((cumulative_nav - historical_max) / historical_max).min(axis=-1)
+    return total_growth, max_drawdown
+
+
+def nav_drawdown(filled, use_jit=None):
+    """
+    每條報酬序列（沿最後一軸，不可有 NaN、長度至少 1 天）的總成長倍數與最大回撤
+    回傳 (total_growth, max_drawdown)，形狀為 filled.shape[:-1]
+    use_jit: None 依 import 時的選擇；True / False 強制指定（測試比對用）
+    """
+    if not (USE_JIT if use_jit is None else use_jit):
+        return _nav_drawdown_numpy(filled)
+
+    filled = np.asarray(filled, dtype=np.float64)
+    shape = filled.shape[:-1]
+    total_growth, max_drawdown = _nav_drawdown_loop(np.ascontiguousarray(filled.reshape(-1, filled.shape[-1])))
+    return total_growth.reshape(shape), max_drawdown.reshape(shape)
+
+
+@_jit
+def _drift_loop(returns, target, holdings, has_holdings, cost_rate, fixed_cost, nav, threshold, has_threshold,
+                rebalance):
+    n_days, n_assets = returns.shape
+    portfolio_returns = np.empty(n_days)
+    growth = np.empty(n_assets)
+
+    position = 0
+    n_trades = 0
+    total_turnover = 0.0
+    while position < n_days:
+        # 這一段期初的權重：接續上一段時沿用漂移後的 holdings（不交易），否則調整到 target
+        turnover = 0.0
+        if position == 0 and not rebalance:
+            base = holdings.copy()
+        else:
+            base = target
+            for i in range(n_assets):
+                turnover += abs(target[i] - holdings[i]) if has_holdings else abs(target[i])
+        cost = 0.0
+        if turnover > 0:
+            cost = min(cost_rate * turnover + fixed_cost / nav, 1.0)
+            n_trades += 1
+            total_turnover += turnover
+
+        # 期初每 1 元淨值裡各資產的成長，逐日累乘；超過門檻的那天也計入這一段，隔天才調回 target
+        growth[:] = 1.0
+        previous = 1.0
+        t = position
+        while t < n_days:
+            value = 0.0
+            for i in range(n_assets):
+                growth[i] *= 1 + returns[t, i]
+                value += growth[i] * base[i]
+            scaled = value * (1 - cost)
+            portfolio_returns[t] = scaled - 1 if t == position else scaled / previous - 1
+            previous = scaled
+            t += 1
+
+            if has_threshold:
+                deviation = 0.0
+                for i in range(n_assets):
+                    deviation = max(deviation, abs(growth[i] * base[i] / value - target[i]))
+                if deviation > threshold:
+                    break
+
+        value = 0.0
+        for i in range(n_assets):
+            value += growth[i] * base[i]
+        for i in range(n_assets):
+            holdings[i] = growth[i] * base[i] / value
+        has_holdings = True
+        nav *= previous
+        position = t
+
+    return portfolio_returns, holdings, nav, n_trades, total_turnover
+
+
+def drift_loop(returns, target, holdings=None, cost_rate=0.0, fixed_cost=0.0, nav=1.0, threshold=None,
+               rebalance=True):
+    """
+    scr.rebalancing.drift_block 的逐日迴圈版本，參數與回傳值相同
+    """
+    if not rebalance and holdings is None:
+        raise ValueError("rebalance=False 需要進入區塊前的 holdings")
+
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    target = np.ascontiguousarray(target, dtype=np.float64)
+    has_holdings = holdings is not None
+    holdings_buffer = np.array(holdings, dtype=np.float64) if has_holdings else np.zeros(len(target))
+
+    portfolio_returns, holdings_buffer, nav, n_trades, total_turnover = _drift_loop(
+        returns, target, holdings_buffer, has_holdings, float(cost_rate), float(fixed_cost), float(nav),
+        0.0 if threshold is None else float(threshold), threshold is not None, bool(rebalance))
+
+    # 空區塊不交易，權重維持進入時的狀態（包括 None）
+    if len(returns) == 0:
+        return portfolio_returns, holdings, nav, n_trades, total_turnover
+    return portfolio_returns, holdings_buffer, nav, n_trades, total_turnover
+
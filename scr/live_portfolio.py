@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+from scr.portfolio_optimizer import OptimizationError
+from scr.rebalancing import parse_rebalance_freq, rebalance_offset, drift_block
+from scr import instrumentation
+
+
+class LivePortfolio:
+    def __init__(self, optimizer, asset_list, start_date, mode="optimal", rebalance_freq='6M', drift=False,
+                 cost_rate=0.0, fixed_cost=0.0, initial_capital=1.0, threshold=None, lookback_years=5,
+                 trading_days=252):
+        """
+        從 start_date 開始實際運作中的投資組合（沒有結束日）
+        規則與 Backtester 相同：start + k × rebalance_freq 時 rebalance，用 rebalance 前一天往回 lookback_years 年估參數，
+        drift / cost_rate / fixed_cost / threshold 的意義見 Backtester，可直接傳入 **backtester.options()
+        每日只處理新增的天數；持倉與淨值跨 update() 延續，績效指標以累計量維護，不保留整段報酬序列
+
+        mode: "optimal" | "equal"
+        """
+        if mode not in ("optimal", "equal"):
+            raise ValueError(f"不支援的 mode：{mode}")
+        parse_rebalance_freq(rebalance_freq)
+        if not drift and (cost_rate or fixed_cost or threshold is not None):
+            raise ValueError("交易成本與門檻再平衡需要 drift=True")
+
+        self.optimizer = optimizer
+        self.asset_list = asset_list
+        self.start_date = pd.to_datetime(start_date)
+        self.mode = mode
+        self.rebalance_freq = rebalance_freq
+        self.drift = drift
+        self.cost_rate = cost_rate
+        self.fixed_cost = fixed_cost
+        self.initial_capital = initial_capital
+        self.threshold = threshold
+        self.lookback_years = lookback_years
+        self.trading_days = trading_days
+        self.asset_idx = optimizer.get_asset_positions(asset_list)
+
+        self.weights = None
+        self.rebalances = []  # list of (rebalance 日, 權重)
+        # 這組資產還沒有資料時，從共同有效區間的第一天開始
+        self.position = max(optimizer.panel.searchsorted(self.start_date, side='left'),
+                            optimizer.get_valid_range(asset_idx=self.asset_idx)[0])
+
+        # drift 模式的狀態：目前各資產權重、淨值，以及下一段是否要先調整到目標權重（剛 rebalance）
+        self.holdings = None
+        self.nav = initial_capital
+        self.n_trades = 0
+        self.turnover = 0.0
+        self._pending_trade = False
+
+        # 累計量：筆數、平均、離差平方和（Welford）、累積對數淨值、歷史高點與最大回撤
+        self.n_days = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.log_nav = 0.0
+        self.peak = -np.inf
+        self.max_drawdown = np.nan
+
+        self.update()
+
+    def options(self):
+        """
+        建構參數（不含 optimizer / asset_list / start_date / mode），與 Backtester.options() 相同的鍵
+        """
+        return {
+            'rebalance_freq': self.rebalance_freq,
+            'drift': self.drift,
+            'cost_rate': self.cost_rate,
+            'fixed_cost': self.fixed_cost,
+            'initial_capital': self.initial_capital,
+            'threshold': self.threshold,
+            'lookback_years': self.lookback_years
+        }
+
+    def next_rebalance_date(self):
+        return self.start_date + rebalance_offset(self.rebalance_freq, len(self.rebalances))
+
+    @instrumentation.timed("LivePortfolio.update")
+    def update(self):
+        """
+        處理上次更新之後新增的交易日：只有跨過 rebalance 日才重新估參數、求權重
+        同一個 rebalance 區間分成幾次 update() 處理時，drift 模式從上次的持倉接著漂移，不重複交易
+        回傳這次處理的天數
+        """
+        panel = self.optimizer.panel
+        values = panel.values
+        first_position = self.position
+        # 新增的日子這組資產若沒有報酬（NaN，只有其他資產有資料），只處理到有效區間的結尾
+        _, valid_end = self.optimizer.get_valid_range(asset_idx=self.asset_idx)
+
+        while self.position < valid_end:
+            rebalance_pos = panel.searchsorted(self.next_rebalance_date(), side='left')
+            if rebalance_pos <= self.position:
+                self._rebalance(self.position)
+                continue
+
+            block_end = min(rebalance_pos, valid_end)
+            block = values[self.position:block_end][:, self.asset_idx]
+            if self.drift:
+                block, self.holdings, self.nav, trades, turnover = drift_block(
+                    block, self.weights, self.holdings, cost_rate=self.cost_rate, fixed_cost=self.fixed_cost,
+                    nav=self.nav, threshold=self.threshold, rebalance=self._resume_needs_trade())
+                self.n_trades += trades
+                self.turnover += turnover
+                # 整段都是缺值日時還沒有交易，留到下一段開頭
+                self._pending_trade = self._pending_trade and np.isnan(block).all()
+            else:
+                block = block @ self.weights
+            self._apply(block)
+            self.position = block_end
+
+        return self.position - first_position
+
+    def _resume_needs_trade(self):
+        """
+        這一段開頭是否要先交易：剛 rebalance，或上次處理到的最後一天剛好觸發門檻（隔天開頭才調回目標）
+        """
+        if self._pending_trade or self.holdings is None:
+            return True
+        return self.threshold is not None and np.abs(self.holdings - self.weights).max() > self.threshold
+
+    def _rebalance(self, position):
+        """
+        在 position（rebalance 日當天或之後的第一個交易日）重新求權重
+        估計失敗時沿用上一期權重；第一次就失敗則直接拋出例外
+        """
+        rebalance_date = self.next_rebalance_date()
+        estimation_start = self.optimizer.panel.searchsorted(
+            rebalance_date - pd.Timedelta(days=1) - pd.DateOffset(years=self.lookback_years), side='left'
+        )
+        estimation_start = max(estimation_start, self.optimizer.get_valid_range(asset_idx=self.asset_idx)[0])
+
+        try:
+            if self.mode == "equal":
+                self.optimizer.estimate_parameters_by_position(estimation_start, position, self.asset_idx)
+                weights = np.asarray(self.optimizer.get_equal_weight_portfolio(self.asset_list))
+            else:
+                _, _, weights = self.optimizer.solve_by_position(estimation_start, position, self.asset_list,
+                                                                 initial_weights=self.weights,
+                                                                 asset_idx=self.asset_idx)
+                weights = np.asarray(weights)
+        except (ValueError, OptimizationError) as e:
+            if self.weights is None:
+                raise
+            print(f"{rebalance_date.date()} rebalance 失敗（{e}），沿用上一期權重")
+            weights = self.weights
+
+        self.weights = weights
+        self.rebalances.append((rebalance_date, weights))
+        self._pending_trade = True
+
+    def _apply(self, portfolio_returns):
+        """
+        把一段新的組合日報酬併入累計量；這組資產缺值的日子（NaN）略過，與 compute_performance_metrics 相同
+        """
+        portfolio_returns = portfolio_returns[~np.isnan(portfolio_returns)]
+        if len(portfolio_returns) == 0:
+            return
+
+        # 平均與離差平方和：Chan 的合併公式
+        batch_count = len(portfolio_returns)
+        batch_mean = portfolio_returns.mean()
+        total = self.n_days + batch_count
+        delta = batch_mean - self.mean
+        self.m2 += ((portfolio_returns - batch_mean) ** 2).sum() + delta ** 2 * self.n_days * batch_count / total
+        self.mean += delta * batch_count / total
+        self.n_days = total
+
+        # 最大回撤：與 compute_performance_metrics 相同，以第一天之後的淨值為歷史高點起點
+        log_path = self.log_nav + np.cumsum(np.log1p(portfolio_returns))
+        peaks = np.maximum.accumulate(np.maximum(log_path, self.peak))
+        drawdown = np.expm1(log_path - peaks).min()
+        self.max_drawdown = drawdown if np.isnan(self.max_drawdown) else min(self.max_drawdown, drawdown)
+        self.peak = peaks[-1]
+        self.log_nav = log_path[-1]
+
+    def metrics(self):
+        """
+        目前為止的績效（定義同 compute_performance_metrics），O(1)
+        """
+        if self.n_days == 0:
+            return {'Annualized Return': np.nan, 'Annualized Volatility': np.nan, 'Sharpe Ratio': np.nan,
+                    'Max Drawdown': np.nan}
+
+        annualized_return = float(np.expm1(self.log_nav * self.trading_days / self.n_days))
+        if self.n_days < 2:
+            annualized_volatility = sharpe_ratio = np.nan
+        else:
+            annualized_volatility = float(np.sqrt(self.m2 / (self.n_days - 1) * self.trading_days))
+            sharpe_ratio = annualized_return / annualized_volatility if annualized_volatility != 0 else np.nan
+
+        return {
+            'Annualized Return': annualized_return,
+            'Annualized Volatility': annualized_volatility,
+            'Sharpe Ratio': sharpe_ratio,
+            'Max Drawdown': float(self.max_drawdown)
+        }
+
+
+class DailyUpdater:
+    def __init__(self, loader, optimizer, live_portfolios=()):
+        """
+        每日更新流程：讀入新價格 ➜ 延長 optimizer 的狀態 ➜ 更新運作中的投資組合
+        Backtester / Simulator 直接讀 optimizer.panel，不需要另外更新
+        loader 需設定 cache_dir（增量更新依賴二進位價格快取）
+        """
+        self.loader = loader
+        self.optimizer = optimizer
+        self.live_portfolios = list(live_portfolios)
+
+    @instrumentation.timed("DailyUpdater.run")
+    def run(self):
+        """
+        回傳 {'new_days': 新增的報酬天數, 'full_rebuild': 是否整批重建, 'live': 各投資組合的最新績效}
+        """
+        new_prices = self.loader.update()
+
+        if new_prices is None:
+            # 歷史資料有變動：整批重算，運作中的投資組合也從頭重跑
+            self.optimizer.rebuild(self.loader.price_df)
+            new_days = len(self.optimizer.panel)
+            self.live_portfolios = [
+                LivePortfolio(self.optimizer, live.asset_list, live.start_date, mode=live.mode,
+                              trading_days=live.trading_days, **live.options())
+                for live in self.live_portfolios
+            ]
+        else:
+            new_days = len(self.optimizer.extend(new_prices, price_data=self.loader.price_df))
+            for live in self.live_portfolios:
+                live.update()
+
+        return {
+            'new_days': new_days,
+            'full_rebuild': new_prices is None,
+            'live': [live.metrics() for live in self.live_portfolios]
+        }
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from scr.rolling_moments import append_rows
+from scr.return_panel import ReturnPanel
+
+
+def _log_growth(returns):
+    """
+    log(1 + r)，NaN（沒有資料）當作 0
+    """
+    log_returns = np.log1p(returns, dtype=np.float64)
+    log_returns[np.isnan(log_returns)] = 0.0
+    return log_returns
+
+
+class NavIndex:
+    def __init__(self, panel, trading_days=252):
+        """
+        預先計算每檔資產的累積對數報酬（前綴和），對齊 panel 的日期
+        log_nav[p] 為前 p 天的 Σ log(1 + r)，因此任意區間 [start_pos, end_pos) 的累積報酬
+        都是 exp(log_nav[end_pos] - log_nav[start_pos]) - 1，只需 O(1)
+
+        panel: ReturnPanel（與 optimizer 共用，不另外保留報酬矩陣）；也接受日報酬率 DataFrame
+        沒有資料的日子（NaN）視為報酬 0，區間必須落在該組資產的有效區間內才有意義
+        """
+        if isinstance(panel, pd.DataFrame):
+            panel = ReturnPanel.from_frame(panel)
+        self.panel = panel
+        self.columns = panel.columns
+        self.trading_days = trading_days
+
+        values = panel.values
+        self.log_nav = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(_log_growth(values), axis=0, out=self.log_nav[1:])
+
+        self._mix_prefix = {}
+
+        # extend() 用的預留容量
+        self._log_nav_buffer = self.log_nav
+        self._mix_prefix_buffer = {}
+
+    @property
+    def dates(self):
+        return self.panel.index
+
+    def extend(self, new_returns):
+        """
+        在尾端加入新的日報酬（每日更新用）：前綴和只往後接新的天數
+        已建好的 constant-mix 前綴和也一併延長
+        new_returns: 新增日期的報酬率（欄位順序需與建立時相同）；panel 本身由 optimizer 負責 append
+        """
+        values = np.asarray(new_returns, dtype=np.float64).reshape(-1, len(self.columns))
+        if len(values) == 0:
+            return
+
+        n_days = len(self.log_nav) - 1
+
+        log_rows = self.log_nav[-1] + np.cumsum(_log_growth(values), axis=0)
+        self._log_nav_buffer, n_rows = append_rows(self._log_nav_buffer, n_days + 1, log_rows)
+        self.log_nav = self._log_nav_buffer[:n_rows]
+
+        for key, prefix in self._mix_prefix.items():
+            asset_idx = np.frombuffer(key[0], dtype=np.intp)
+            weights = np.frombuffer(key[1], dtype=np.float64)
+            rows = prefix[-1] + np.cumsum(_log_growth(values[:, asset_idx] @ weights))
+            buffer, n_rows = append_rows(self._mix_prefix_buffer.get(key, prefix), len(prefix), rows)
+            self._mix_prefix_buffer[key] = buffer
+            self._mix_prefix[key] = buffer[:n_rows]
+
+    def positions(self, start_date, end_date):
+        """
+        日期區間 [start_date, end_date]（兩端皆含）➜ 整數位置 [start_pos, end_pos)
+        start_date / end_date 可以是單一日期或日期陣列
+        """
+        start_pos = self.panel.searchsorted(start_date, side='left')
+        end_pos = self.panel.searchsorted(end_date, side='right')
+        return start_pos, end_pos
+
+    def nav(self, position, asset_idx=None):
+        """
+        第 position 天開始前的各資產淨值（起點為 1）
+        """
+        log_nav = self.log_nav[position]
+        if asset_idx is not None:
+            log_nav = log_nav[..., asset_idx]
+        return np.exp(log_nav)
+
+    def asset_cumulative_return(self, start_pos, end_pos, asset_idx=None, exclude=None):
+        """
+        各資產在 [start_pos, end_pos) 的累積報酬，O(1)
+        start_pos / end_pos 為陣列時回傳 (windows × assets)
+        exclude: 單一區間內要略過的位置（這組資產有缺值的日子），各資產在這些日子的報酬都不計入
+        """
+        log_growth = self.log_nav[end_pos] - self.log_nav[start_pos]
+        if asset_idx is not None:
+            log_growth = log_growth[..., asset_idx]
+        if exclude is not None and len(exclude) > 0:
+            columns = slice(None) if asset_idx is None else asset_idx
+            log_growth = log_growth - _log_growth(self.panel.values[exclude][:, columns]).sum(axis=0)
+        return np.exp(log_growth) - 1
+
+    def buy_and_hold_return(self, start_pos, end_pos, weights, asset_idx=None, exclude=None):
+        """
+        期初依 weights 配置、期間不再平衡的組合累積報酬，O(assets)
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        growth = self.asset_cumulative_return(start_pos, end_pos, asset_idx, exclude=exclude) + 1
+        return growth @ (weights / weights.sum()) - 1
+
+    def constant_mix_prefix(self, weights, asset_idx=None):
+        """
+        每日再平衡回 weights 的組合（例如 returns.mean(axis=1) 的等權重序列）的累積對數報酬前綴和
+        同一組 (資產, 權重) 只計算一次；任一檔資產缺值的日子組合報酬為 NaN，當作 0（等同略過這一天）
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        asset_idx = np.arange(len(self.columns)) if asset_idx is None else np.asarray(asset_idx, dtype=np.intp)
+        key = (asset_idx.tobytes(), weights.tobytes())
+
+        if key not in self._mix_prefix:
+            values = self.panel.values[:len(self.log_nav) - 1]
+            prefix = np.zeros(len(values) + 1)
+            np.cumsum(_log_growth(values[:, asset_idx] @ weights), out=prefix[1:])
+            self._mix_prefix[key] = prefix
+        return self._mix_prefix[key]
+
+    def constant_mix_return(self, start_pos, end_pos, weights, asset_idx=None):
+        """
+        每日再平衡組合在 [start_pos, end_pos) 的累積報酬，建好前綴和後為 O(1)
+        """
+        prefix = self.constant_mix_prefix(weights, asset_idx)
+        return np.exp(prefix[end_pos] - prefix[start_pos]) - 1
+
+    def annualize(self, cumulative_return, n_days):
+        """
+        累積報酬 ➜ 年化報酬
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (1 + cumulative_return) ** (self.trading_days / np.asarray(n_days)) - 1
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+# 求解器（估計方式、最適化演算法）改變、舊結果不再可信時遞增，磁碟上的舊快取會整批作廢
+SOLVER_VERSION = 3
+
+
+def data_fingerprint(panel, n_days=None):
+    """
+    報酬資料的指紋：前 n_days 天的日期與每一欄報酬各自的 sha1
+    只在尾端加入新的天數（每日更新）時，前 n_days 天的指紋不變，既有的快取仍然有效；
+    歷史資料被修正（CSV 重新發布）時指紋改變
+    """
+    n_days = len(panel) if n_days is None else n_days
+    values = panel.values[:n_days]
+    return {
+        'n_days': int(n_days),
+        'dates': hashlib.sha1(panel.dates[:n_days].tobytes()).hexdigest(),
+        'columns': {column: hashlib.sha1(np.ascontiguousarray(values[:, i]).tobytes()).hexdigest()
+                    for i, column in enumerate(panel.columns)}
+    }
+
+
+class OptimizerCache:
+    def __init__(self, max_size=10000, path=None, track_new=False):
+        """
+        以估計區間為 key 的最適化結果快取（LRU）
+        key: (資產 tuple, 估計起始日, 估計結束日, allow_short[, 共變異數估計方法])
+        value: (mu, 共變異數物件, weights)
+
+        max_size: 最多保留幾筆，超過時淘汰最久沒用到的
+        path: 若有指定，建立時會自動讀取既有的快取檔，save() 時寫回
+        track_new: 是否記錄新增的項目，供 pop_new_entries() 取出
+
+        快取檔附帶 SOLVER_VERSION 與存檔時的報酬資料指紋：版本不同時讀取時就捨棄；
+        資料指紋要等 bind() 拿到目前的報酬才能比對（PortfolioOptimizer 建立時自動呼叫），不符時整批捨棄
+        """
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self.track_new = track_new
+        self._new_keys = []
+        self._panel = None
+        self._loaded_fingerprint = None
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def make_key(asset_list, start_date, end_date, allow_short, estimator="sample"):
+        # 樣本共變異數維持原本的 key，既有的快取檔不會失效
+        if estimator == "sample":
+            return tuple(asset_list), start_date, end_date, bool(allow_short)
+        return tuple(asset_list), start_date, end_date, bool(allow_short), estimator
+
+    def get(self, key):
+        """
+        取出快取結果，沒有的話回傳 None
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.track_new and key not in self._entries:
+            self._new_keys.append(key)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        回傳命中統計
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': self.hits / total if total > 0 else 0.0
+        }
+
+    def pop_new_entries(self):
+        """
+        取出上次呼叫之後新增的快取項目（平行運算時 worker 用來把結果帶回主 process）
+        """
+        entries = [(key, self._entries[key]) for key in self._new_keys if key in self._entries]
+        self._new_keys = []
+        return entries
+
+    def clear(self):
+        self._entries.clear()
+        self._new_keys = []
+        self.hits = 0
+        self.misses = 0
+        self._loaded_fingerprint = None
+
+    def bind(self, panel):
+        """
+        指定快取結果對應的報酬資料（ReturnPanel）
+        從磁碟讀入的項目若是以不同的歷史資料算出（存檔時的前 n 天與目前不同），整批捨棄
+        """
+        self._panel = panel
+        stored = self._loaded_fingerprint
+        self._loaded_fingerprint = None
+        if stored is None:
+            return
+
+        if stored['n_days'] <= len(panel):
+            current = data_fingerprint(panel, stored['n_days'])
+            if current['dates'] == stored['dates'] and all(
+                    current['columns'].get(column, digest) == digest for column, digest in stored['columns'].items()):
+                return
+
+        print("報酬資料與快取檔建立時不同，捨棄舊的最適化快取")
+        self.clear()
+
+    def save(self, path=None):
+        """
+        把快取內容寫到磁碟，下次執行 main.py 可以直接沿用
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("沒有指定快取檔案路徑")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 先寫暫存檔再換名，避免中途中斷留下壞掉的快取
+        tmp_path = path + ".tmp"
+        payload = {
+            'version': SOLVER_VERSION,
+            'data': data_fingerprint(self._panel) if self._panel is not None else None,
+            'entries': list(self._entries.items())
+        }
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path, "rb") as f:
+                items = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"快取檔讀取失敗，改用空快取：{e}")
+            return
+
+        # 舊格式（沒有版本與資料指紋）或求解器版本不同：結果無法確認，不讀入
+        if not isinstance(items, dict) or items.get('version') != SOLVER_VERSION or items.get('data') is None:
+            print("快取檔的求解器版本或資料指紋不符，改用空快取")
+            return
+
+        for key, value in items['entries']:
+            self.put(key, value)
+        self._loaded_fingerprint = items['data']
+        self._new_keys = []
@@ -0,0 +1,194 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# 每個 worker process 各自持有的狀態，由 _init_worker 建立
+_worker_state = {}
+
+
+class SharedReturns:
+    def __init__(self, panel):
+        """
+        把 ReturnPanel 的報酬率矩陣放進共享記憶體，worker 只需拿到名稱與形狀就能直接讀取，
+        不用把整張 DataFrame pickle 給每個任務；型別（float64 / float32）沿用 panel
+        """
+        values = panel.values
+        self.shape = values.shape
+        self.dtype = values.dtype.str
+        self.dates = panel.dates.copy()
+        self.columns = list(panel.columns)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        buffer = np.ndarray(self.shape, dtype=values.dtype, buffer=self.shm.buf)
+        buffer[:] = values
+
+    def spec(self):
+        """
+        傳給 worker 的描述資訊（可 pickle）
+        """
+        return {
+            'name': self.shm.name,
+            'shape': self.shape,
+            'dtype': self.dtype,
+            'dates': self.dates,
+            'columns': self.columns
+        }
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach_returns(spec):
+    """
+    在 worker 端把共享記憶體還原成 ReturnPanel（不複製資料）
+    回傳 (panel, shm)，shm 需要保留參考，否則記憶體會被釋放
+    """
+    from scr.return_panel import ReturnPanel
+
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    values = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+    values.flags.writeable = False
+    panel = ReturnPanel(values, spec['dates'], spec['columns'], dtype=values.dtype)
+    return panel, shm
+
+
+def _attach_optimizer(spec, cache_size, cache_path, profiling, covariance):
+    """
+    worker 端共用的初始化：接上共享的報酬矩陣，建立 optimizer（含 rolling moments 與快取）
+    """
+    from scr import instrumentation
+    from scr.portfolio_optimizer import PortfolioOptimizer
+    from scr.optimizer_cache import OptimizerCache
+
+    instrumentation.enable(profiling)
+    instrumentation.reset()
+
+    panel, shm = attach_returns(spec)
+    cache = OptimizerCache(max_size=cache_size, path=cache_path, track_new=True) if cache_size else None
+    _worker_state['shm'] = shm
+    _worker_state['optimizer'] = PortfolioOptimizer(None, cache=cache, returns=panel, covariance=covariance)
+    return _worker_state['optimizer']
+
+
+def _init_worker(spec, asset_list, backtester_options, cache_size, cache_path, profiling=False, covariance="sample"):
+    """
+    ProcessPoolExecutor 的 initializer：每個 worker 只建一次 optimizer / backtester
+    backtester_options: 主 process Backtester.options()（rebalance 週期、drift、交易成本等）
+    cache_size 為 0 代表不使用快取；cache_path 有值時先載入已存在磁碟的快取
+    profiling: 主 process 有開 instrumentation 時，worker 也一併開啟
+    covariance: 主 process optimizer 的共變異數 estimator
+    """
+    from scr.backtester import Backtester
+
+    optimizer = _attach_optimizer(spec, cache_size, cache_path, profiling, covariance)
+    _worker_state['backtester'] = Backtester(optimizer, asset_list, **backtester_options)
+    _worker_state['asset_list'] = asset_list
+
+
+def _run_task(task):
+    """
+    在 worker 中跑一個 (mode, holding_years, 起始日區塊) 的模擬
+    起始日由主 process 決定，worker 不會用到亂數，結果與 worker 數量無關
+    keep_paths: 是否一併回傳每個 trial 的日報酬路徑
+    回傳 (simulate_dates 的 outcomes, 新增的快取項目, instrumentation 記錄)
+    """
+    from scr.simulator import Simulator
+    from scr import instrumentation
+
+    mode, holding_years, start_dates, keep_paths = task
+
+    simulator = Simulator(_worker_state['optimizer'], _worker_state['backtester'], _worker_state['asset_list'],
+                          n_trials=len(start_dates))
+    outcomes = simulator.simulate_dates(pd.DatetimeIndex(start_dates), mode=mode, holding_years=holding_years,
+                                        keep_paths=keep_paths)
+
+    cache = _worker_state['optimizer'].cache
+    new_entries = cache.pop_new_entries() if cache is not None else []
+    return outcomes, new_entries, instrumentation.drain()
+
+
+def _init_sweep_worker(spec, cache_size, cache_path, profiling=False, covariance="sample"):
+    """
+    SweepRunner 的 initializer：只建 optimizer，Backtester 依任務的 (資產, 估計年數, rebalance 週期) 建立後保留
+    """
+    _attach_optimizer(spec, cache_size, cache_path, profiling, covariance)
+    _worker_state['backtesters'] = {}
+
+
+def _run_sweep_task(task):
+    """
+    在 worker 中跑一個 scr.sweep.run_sweep_unit 的工作單元
+    回傳 (各 job 的 outcomes, 新增的快取項目, instrumentation 記錄)
+    """
+    from scr.sweep import run_sweep_unit
+    from scr import instrumentation
+
+    optimizer = _worker_state['optimizer']
+    results = run_sweep_unit(optimizer, _worker_state['backtesters'], task)
+
+    new_entries = optimizer.cache.pop_new_entries() if optimizer.cache is not None else []
+    return results, new_entries, instrumentation.drain()
+
+
+def _init_subset_worker(spec, estimates, allow_short, trading_days, profiling=False):
+    """
+    SubsetSearch 的 initializer：接上共享的報酬矩陣，資產池的 (μ, Σ) 只在這裡傳一次
+    求解只需要 optimize_portfolio，用空的 panel 建 optimizer，不必在每個 worker 重建 rolling moments
+    """
+    from scr import instrumentation
+    from scr.portfolio_optimizer import PortfolioOptimizer
+    from scr.return_panel import ReturnPanel
+
+    instrumentation.enable(profiling)
+    instrumentation.reset()
+
+    panel, shm = attach_returns(spec)
+    _worker_state['shm'] = shm
+    _worker_state['values'] = panel.values
+    _worker_state['optimizer'] = PortfolioOptimizer(None, returns=ReturnPanel(np.empty((0, 0)), [], []))
+    _worker_state['estimates'] = estimates
+    _worker_state['subset_options'] = {'allow_short': allow_short, 'trading_days': trading_days}
+
+
+def _run_subset_task(subsets):
+    """
+    在 worker 中評估一批候選子集合（scr.subset_search.evaluate_subsets）
+    回傳 (績效 dict, instrumentation 記錄)
+    """
+    from scr.subset_search import evaluate_subsets
+    from scr import instrumentation
+
+    metrics = evaluate_subsets(_worker_state['optimizer'], _worker_state['values'], _worker_state['estimates'],
+                               subsets, **_worker_state['subset_options'])
+    return metrics, instrumentation.drain()
+
+
+def _init_service_worker(spec, cache_size, cache_path, profiling=False, covariance="sample"):
+    """
+    JobService 的 initializer：optimizer 只建一次，Backtester 依 job 的 (資產, rebalance 週期, 估計年數) 建立後保留
+    """
+    _attach_optimizer(spec, cache_size, cache_path, profiling, covariance)
+    _worker_state['backtesters'] = {}
+
+
+def _run_service_job(job):
+    """
+    在 worker 中執行一個 scr.service.run_job 的 job
+    回傳 (結果, 新增的快取項目, instrumentation 記錄)
+    """
+    from scr.service import run_job
+    from scr import instrumentation
+
+    optimizer = _worker_state['optimizer']
+    result = run_job(optimizer, _worker_state['backtesters'], job)
+
+    new_entries = optimizer.cache.pop_new_entries() if optimizer.cache is not None else []
+    return result, new_entries, instrumentation.drain()
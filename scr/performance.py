@@ -1,32 +1,87 @@
 import numpy as np
 import pandas as pd
+from scr.kernels import nav_drawdown
+
+
+METRIC_NAMES = ['Annualized Return', 'Annualized Volatility', 'Sharpe Ratio', 'Max Drawdown']
+
+
+def compute_performance_metrics(returns, axis=-1, trading_days=252, risk_free_rate=0):
+    """
+    一次算完年化報酬、年化波動率、Sharpe Ratio 與最大回撤
+    returns: 1-D 的日報酬序列，或 2-D 的 (trials × days) 矩陣（沿 axis 計算）
+             NaN 視為缺值（例如長度不一的 trial 補齊的部分），等同 dropna 後再計算
+    回傳 dict：1-D 輸入為純量，2-D 輸入為每個 trial 一個值的 ndarray
+    """
+    values = np.moveaxis(np.asarray(returns, dtype=np.float64), axis, -1)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    n_days = valid.sum(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 累積淨值只走一次：總報酬取最後一天，最大回撤取與歷史高點的差距（有 numba 時不建立整段淨值矩陣）
+        if values.shape[-1] > 0:
+            total_growth, max_drawdown = nav_drawdown(filled)
+        else:
+            total_growth = np.ones(values.shape[:-1])
+            max_drawdown = np.full(values.shape[:-1], np.nan)
+
+        annualized_return = total_growth ** (trading_days / n_days) - 1
+
+        mean = filled.sum(axis=-1) / n_days
+        deviations = np.where(valid, values - mean[..., None], 0.0)
+        variance = (deviations ** 2).sum(axis=-1) / (n_days - 1)
+        annualized_volatility = np.sqrt(variance) * np.sqrt(trading_days)
+
+        sharpe_ratio = np.where(annualized_volatility != 0,
+                                (annualized_return - risk_free_rate) / annualized_volatility, np.nan)
+
+    empty = n_days == 0
+    annualized_return = np.where(empty, np.nan, annualized_return)
+    max_drawdown = np.where(empty, np.nan, max_drawdown)
+    annualized_volatility = np.where(n_days < 2, np.nan, annualized_volatility)
+    sharpe_ratio = np.where(n_days < 2, np.nan, sharpe_ratio)
+
+    metrics = {
+        'Annualized Return': annualized_return,
+        'Annualized Volatility': annualized_volatility,
+        'Sharpe Ratio': sharpe_ratio,
+        'Max Drawdown': max_drawdown
+    }
+    if values.ndim == 1:
+        metrics = {name: float(value) for name, value in metrics.items()}
+    return metrics
 
 
 class PerformanceEvaluator:
     def __init__(self, returns_series):
         self.returns = returns_series.dropna()
         self.n_days = len(self.returns)
+        self._metrics = None
+
+    def _compute_metrics(self):
+        """
+        所有指標共用一次 compute_performance_metrics 的結果
+        """
+        if self._metrics is None:
+            values = np.asarray(self.returns, dtype=np.float64)
+            if values.ndim == 2 and values.shape[1] == 1:
+                values = values[:, 0]
+            if values.ndim != 1:
+                raise ValueError(f"returns 應為單一序列，目前形狀為 {values.shape}")
+            self._metrics = compute_performance_metrics(values)
+        return self._metrics
 
     def compute_annualized_return(self):
-        cumulative_return = (1 + self.returns).prod() - 1
-        annualized_return = (1 + cumulative_return) ** (252 / self.n_days) - 1
-        return annualized_return
+        return self._compute_metrics()['Annualized Return']
 
     def compute_annualized_volatility(self):
-        annualized_volatility = self.returns.std() * np.sqrt(252)
-        return annualized_volatility
+        return self._compute_metrics()['Annualized Volatility']
 
     def compute_sharpe_ratio(self, risk_free_rate=0):
         ann_return = self.compute_annualized_return()
         ann_vol = self.compute_annualized_volatility()
 
-        # 安全轉換為純 float 數字
-        if isinstance(ann_vol, pd.Series):
-            if len(ann_vol) == 1:
-                ann_vol = ann_vol.iloc[0]
-            else:
-                raise ValueError(f"ann_vol 為多個值的 Series，長度 = {len(ann_vol)}，應該是一個單一值")
-
         if ann_vol != 0:
             sharpe_ratio = (ann_return - risk_free_rate) / ann_vol
         else:
@@ -35,22 +90,13 @@ class PerformanceEvaluator:
         return sharpe_ratio
 
     def compute_max_drawdown(self):
-        cumulative_nav = (1 + self.returns).cumprod()
-        historical_max = cumulative_nav.cummax()
-        drawdowns = (cumulative_nav - historical_max) / historical_max
-        max_drawdown = drawdowns.min()
-        return max_drawdown
+        return self._compute_metrics()['Max Drawdown']
 
     def summary(self):
         """
         一次輸出完整的績效指標
         """
-        return {
-            'Annualized Return': self.compute_annualized_return(),
-            'Annualized Volatility': self.compute_annualized_volatility(),
-            'Sharpe Ratio': self.compute_sharpe_ratio(),
-            'Max Drawdown': self.compute_max_drawdown()
-        }
+        return dict(self._compute_metrics())
 
 
 
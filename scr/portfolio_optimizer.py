@@ -1,91 +1,433 @@
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
+from scr.rolling_moments import RollingMoments
+from scr.nav_index import NavIndex
+from scr.return_panel import ReturnPanel
+from scr.availability import AvailabilityIndex
+from scr.covariance import as_covariance, get_estimator
+from scr import instrumentation
+
+
+class OptimizationError(RuntimeError):
+    """
+    最適化求解失敗（不收斂或問題無解）
+    """
+
 
 class PortfolioOptimizer:
-    def __init__(self, price_data):
+    def __init__(self, price_data, cache=None, returns=None, dtype=None, covariance="sample"):
         """
         初始化：接收已整合好的價格資料 DataFrame（Date 為 index，欄位為 ETF）
+        cache: 可選的 OptimizerCache，相同估計區間的最適化結果會直接沿用
+        returns: 可直接傳入已算好的日報酬率 DataFrame 或 ReturnPanel（例如平行運算時從共享記憶體還原），此時 price_data 可為 None
+        dtype: 報酬率矩陣的型別，None 為 float64（傳入 returns 時沿用其型別）；資產很多時可用 np.float32
+        covariance: 共變異數估計方法，"sample" | "ledoit_wolf" | "oas" | "pca" 或自訂 estimator（見 scr.covariance）
         """
         self.price_data = price_data
-        self.returns = self.compute_returns()
+        self.cache = cache
+        self.dtype = dtype
+        self.covariance_estimator = get_estimator(covariance)
+        self._build_state(returns if returns is not None else self.compute_returns())
 
+    def _build_state(self, returns):
+        """
+        由日報酬率建立共用的 ReturnPanel 與所有衍生狀態
+        self.returns 只是 panel 的 DataFrame 包裝（不另外複製資料）
+        self.availability 記錄各資產的有效日期，每組資產只在自己的共同有效區間內估計與回測（略過區間中的缺值日）
+        """
+        if isinstance(returns, ReturnPanel):
+            self.panel = returns
+        else:
+            self.panel = ReturnPanel.from_frame(returns, dtype=self.dtype)
+        self.returns = self.panel.to_frame()
+        self.moments = RollingMoments(self.panel.values)
+        self.nav_index = NavIndex(self.panel)
+        self.availability = AvailabilityIndex(self.panel.values)
+        if self.cache is not None:
+            # 從磁碟讀入的快取若是以不同的歷史資料算出，在這裡整批捨棄
+            self.cache.bind(self.panel)
 
     def get_common_date_range(self, etf_list):
         """
-        找出所有選定ETF共同擁有資料的起始日與結束日
+        找出所有選定ETF共同擁有資料（報酬）的起始日與結束日（中間個別缺值的日子不影響）
         """
-        selected_prices = self.price_df[etf_list]
-        # 找出每一檔ETF的有效日期
-        valid_dates = selected_prices.dropna().index
-        # 交集區間
-        start_date = valid_dates.min()
-        end_date = valid_dates.max()
-        return start_date, end_date
+        start_pos, end_pos = self.get_valid_range(etf_list)
+        index = self.panel.index
+        return index[start_pos], index[end_pos - 1]
+
+    def get_valid_range(self, asset_list=None, asset_idx=None):
+        """
+        這組資產在 panel 上的共同有效區間 [start_pos, end_pos)（整數位置），區間中的缺值日見 availability.holes
+        asset_idx: 已換算好的欄位位置（有給就不必查 asset_list）；兩者皆為 None 代表全部資產
+        """
+        if asset_idx is None and asset_list is not None:
+            asset_idx = self.get_asset_positions(asset_list)
+        return self.availability.valid_range(asset_idx)
 
     def compute_returns(self):
         """
         計算日報酬率
+        只去掉所有資產都沒有報酬的日期；個別資產上市前（或缺值）的報酬保留為 NaN，
+        不會因為一檔較新的 ETF 就把其他資產的歷史一起截掉，各組資產的有效區間由 availability 決定
         """
-        return self.price_data.pct_change(fill_method=None).dropna()
-        return returns
+        return self.price_data.pct_change(fill_method=None).dropna(how='all')
 
+    def rebuild(self, price_data):
+        """
+        價格表整批換掉時（例如歷史資料被修正），重新計算 returns 與所有衍生的狀態
+        歷史改變後舊的最適化結果不再可信，快取一併清空
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        self.price_data = price_data
+        self._build_state(self.compute_returns())
+
+    @instrumentation.timed("PortfolioOptimizer.extend")
+    def extend(self, new_prices, price_data=None):
+        """
+        每日更新：只用新增的價格列延長 returns、rolling moments 與 NavIndex，不重算歷史
+        new_prices: 日期在目前最後一天之後的價格列（欄位同 price_data）
+        price_data: 已包含新資料的完整價格表（例如 ETFDataLoader.update() 後的 price_df），
+                    None 時把 new_prices 接在原本的 price_data 後面
+        回傳新增的日報酬 DataFrame（與 compute_returns 相同：前一列價格算報酬，去掉全部為 NaN 的列）
+        """
+        if self.price_data is None:
+            raise ValueError("沒有價格資料（以 returns 建立的 optimizer 無法增量更新）")
+        if len(new_prices) == 0:
+            return self.returns.iloc[:0]
+        if new_prices.index[0] <= self.price_data.index[-1]:
+            raise ValueError("新增的價格必須在現有資料的最後一天之後")
+
+        # 與 pct_change(fill_method=None).dropna(how='all') 相同，只是只算新增的幾列
+        prices = np.vstack([self.price_data.iloc[-1].to_numpy(dtype=np.float64),
+                            new_prices[self.price_data.columns].to_numpy(dtype=np.float64)])
+        new_returns = pd.DataFrame(prices[1:] / prices[:-1] - 1, index=new_prices.index,
+                                   columns=self.price_data.columns).dropna(how='all')
+        new_returns = new_returns[self.panel.columns]
+
+        self.price_data = price_data if price_data is not None else pd.concat([self.price_data, new_prices])
+        self.panel.append(new_returns.to_numpy(), new_returns.index)
+        self.returns = self.panel.to_frame()
+        self.moments.extend(new_returns.to_numpy())
+        self.nav_index.extend(new_returns.to_numpy())
+        self.availability.extend(new_returns.to_numpy())
+        return new_returns
+
+    @instrumentation.timed("PortfolioOptimizer.estimate_parameters")
     def estimate_parameters(self, start_date, end_date, asset_list=None):
         """
         從 returns 中挑出指定區間、指定資產，計算年化期望報酬率與共變異數
         """
-        if asset_list is not None:
-            selected_returns = self.returns[asset_list].loc[start_date:end_date]
-        else:
-            selected_returns = self.returns.loc[start_date:end_date]
+        if asset_list is None:
+            asset_list = self.panel.columns
 
-        mu = selected_returns.mean() * 252
-        sigma = selected_returns.cov() * 252
+        asset_idx = self.get_asset_positions(asset_list)
+        start_pos, end_pos = self.get_window_positions(start_date, end_date, asset_idx)
+        mu, sigma = self.estimate_parameters_by_position(start_pos, end_pos, asset_idx)
+
+        mu = pd.Series(mu, index=asset_list)
+        sigma = pd.DataFrame(sigma, index=asset_list, columns=asset_list)
 
         return mu, sigma
 
+    @instrumentation.timed("PortfolioOptimizer.estimate_parameters_by_position")
+    def estimate_parameters_by_position(self, start_pos, end_pos, asset_idx=None):
+        """
+        以整數位置指定區間 [start_pos, end_pos)，直接從 rolling moments 取出年化的 mu 與 sigma（ndarray）
+        """
+        mu, covariance = self.estimate_covariance_by_position(start_pos, end_pos, asset_idx)
+        return mu, covariance.matrix
+
+    def estimate_covariance_by_position(self, start_pos, end_pos, asset_idx=None):
+        """
+        同 estimate_parameters_by_position，但共變異數以物件回傳（DenseCovariance / FactorCovariance），
+        求解時可直接用它快取的 Cholesky / Woodbury 分解，不必展開或求反矩陣
+        區間內這組資產有缺值的日子整列略過（等同對這組資產 dropna 後再估計）
+        """
+        holes = self.availability.holes(asset_idx, start_pos, end_pos)
+        mean, cov = self.moments.window(start_pos, end_pos, asset_idx, exclude=holes)
+        covariance = self.covariance_estimator(
+            mean, cov, end_pos - start_pos - len(holes),
+            lambda: np.delete(self.panel.window(start_pos, end_pos, asset_idx), holes - start_pos, axis=0))
+        return mean * 252, covariance.scaled(252)
+
+    def solve_by_position(self, start_pos, end_pos, asset_list, allow_short=False, initial_weights=None,
+                          asset_idx=None, estimate=None):
+        """
+        估計 [start_pos, end_pos) 區間的參數並求最適權重
+        有設定 cache 時，以 (資產, 估計起訖日, allow_short, 估計方法) 為 key 沿用先前的結果
+        initial_weights: 上一期權重，cache 沒命中時拿來 warm start
+        asset_idx: 已換算好的資產欄位位置（迴圈中重複呼叫時可省去查詢）
+        estimate: 已估好的 (mu, covariance)（estimate_covariance_by_position 的結果），cache 沒命中時直接使用
+        回傳 (mu, covariance, weights)；covariance 為共變異數物件，需要完整矩陣時再取 covariance.matrix
+        （因子模型不必為了快取展開成 n × n）
+        """
+        key = None
+        if self.cache is not None and end_pos - start_pos >= 2:
+            index = self.panel.index
+            key = self.cache.make_key(asset_list, index[start_pos], index[end_pos - 1], allow_short,
+                                      estimator=self.covariance_estimator.name)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if asset_idx is None:
+            asset_idx = self.get_asset_positions(asset_list)
+        mu, covariance = estimate or self.estimate_covariance_by_position(start_pos, end_pos, asset_idx)
+        weights = self.optimize_portfolio(mu, covariance, allow_short=allow_short, initial_weights=initial_weights)
+
+        if key is not None:
+            self.cache.put(key, (mu, covariance, weights))
+
+        return mu, covariance, weights
+
+    def get_window_return(self, start_date, end_date, asset_list=None, weights=None, annualize=False):
+        """
+        區間 [start_date, end_date] 的買進持有報酬（查 NavIndex，O(1)）
+        weights 為 None 時回傳各資產自己的報酬（Series），否則回傳期初依 weights 配置的組合報酬
+        """
+        if asset_list is None:
+            asset_list = self.panel.columns
+
+        asset_idx = self.get_asset_positions(asset_list)
+        start_pos, end_pos = self.get_window_positions(start_date, end_date, asset_idx)
+        holes = self.availability.holes(asset_idx, start_pos, end_pos)
+
+        if weights is None:
+            window_return = pd.Series(self.nav_index.asset_cumulative_return(start_pos, end_pos, asset_idx,
+                                                                             exclude=holes),
+                                      index=asset_list)
+        else:
+            window_return = self.nav_index.buy_and_hold_return(start_pos, end_pos, weights, asset_idx,
+                                                               exclude=holes)
+
+        if annualize:
+            window_return = self.nav_index.annualize(window_return, end_pos - start_pos - len(holes))
+        return window_return
+
+    def get_window_positions(self, start_date, end_date, asset_idx=None):
+        """
+        把日期區間 [start_date, end_date]（兩端皆含）換算成 returns 上的整數位置 [start_pos, end_pos)
+        asset_idx: 有給時再限制在這組資產的有效區間內（區間外的報酬為 NaN）
+        """
+        start_pos = self.panel.searchsorted(start_date, side='left')
+        end_pos = self.panel.searchsorted(end_date, side='right')
+        if asset_idx is not None:
+            lo, hi = self.availability.valid_range(asset_idx)
+            start_pos, end_pos = min(max(start_pos, lo), hi), max(min(end_pos, hi), lo)
+        return start_pos, end_pos
 
-    def optimize_portfolio(self, mu, sigma, allow_short=False):
+    def get_asset_positions(self, asset_list):
+        """
+        把資產代碼換算成 returns 欄位的整數位置
+        """
+        return self.panel.positions(asset_list)
+
+
+    @instrumentation.timed("PortfolioOptimizer.optimize_portfolio")
+    def optimize_portfolio(self, mu, sigma, allow_short=False, initial_weights=None, method="active_set"):
         """
         計算最適投資組合權重
+        sigma: 共變異數矩陣，或 scr.covariance 的共變異數物件（允許放空時直接用它的分解求解）
         allow_short: 是否允許放空
+        initial_weights: 上一次 rebalance 的權重，用來 warm start（可省略）
+        method: 不放空時的解法
+            "active_set" ➜ 改寫成 min w'Σw s.t. μ'w = 1, w ≥ 0 的 QP，用 active-set 精確求解後再正規化
+            "slsqp"      ➜ 直接用 SLSQP 最大化 Sharpe Ratio（附解析梯度）
         """
         n_assets = len(mu)
 
+        covariance = as_covariance(sigma)
+        mu = np.asarray(mu, dtype=float)
+
         if allow_short:
-            # 允許放空：直接用公式 Σ^-1 * μ
-            inv_sigma = np.linalg.inv(sigma)
-            raw_weights = inv_sigma @ mu
+            # 允許放空：Σ^-1 * μ，用 Cholesky（因子模型為 Woodbury）解線性方程，不求反矩陣
+            raw_weights = covariance.solve(mu)
             weights = raw_weights / np.sum(raw_weights)  # Normalize to sum to 1
-        else:
-            # 不允許放空：需要用最適化求解
+            return weights
+
+        # 不允許放空
+        sigma = covariance.matrix
+        if initial_weights is not None:
+            initial_weights = np.asarray(initial_weights, dtype=float)
+            if initial_weights.shape != (n_assets,):
+                initial_weights = None
+
+        # QP 改寫只在至少有一個資產期望報酬為正時成立，其餘情況交給 SLSQP
+        if method == "active_set" and np.any(mu > 0):
+            try:
+                return self._solve_tangency_active_set(mu, sigma, initial_weights)
+            except (OptimizationError, np.linalg.LinAlgError):
+                instrumentation.count("optimize_portfolio.active_set_fallbacks")
+        elif method not in ("active_set", "slsqp"):
+            raise ValueError(f"不支援的解法：{method}")
+
+        return self._solve_tangency_slsqp(mu, sigma, initial_weights)
+
+    def _solve_tangency_slsqp(self, mu, sigma, initial_weights=None):
+        """
+        用 SLSQP 最大化 Sharpe Ratio，提供解析梯度，並可從上一期權重 warm start
+        """
+        n_assets = len(mu)
 
-            # 目標函數（最大化 (w' * mu) / sqrt(w' * sigma * w)）
-            # 由於scipy minimize是最小化，所以加上負號
-            def objective(w):
-                portfolio_return = w @ mu
-                portfolio_volatility = np.sqrt(w @ sigma @ w)
-                # 最大化 Sharpe Ratio -> 最小化負的 Sharpe Ratio
-                return - portfolio_return / portfolio_volatility
+        # 目標函數（最大化 (w' * mu) / sqrt(w' * sigma * w)）
+        # 由於scipy minimize是最小化，所以加上負號，同時回傳梯度
+        def objective(w):
+            sigma_w = sigma @ w
+            portfolio_return = w @ mu
+            portfolio_volatility = np.sqrt(w @ sigma_w)
+            # 最大化 Sharpe Ratio -> 最小化負的 Sharpe Ratio
+            value = - portfolio_return / portfolio_volatility
+            gradient = - mu / portfolio_volatility + portfolio_return * sigma_w / portfolio_volatility ** 3
+            return value, gradient
 
-            # 條件：權重總和=1
-            constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1})
+        # 條件：權重總和=1
+        constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)})
 
-            # 每個權重範圍：0 ~ 1
-            bounds = tuple((0, 1) for _ in range(n_assets))
+        # 每個權重範圍：0 ~ 1
+        bounds = tuple((0, 1) for _ in range(n_assets))
 
-            # 初始猜測值：等權重
+        # 初始猜測值：有上一期權重就從那裡開始，否則用等權重
+        if initial_weights is not None and np.all(initial_weights >= 0) and initial_weights.sum() > 0:
+            initial_guess = initial_weights / initial_weights.sum()
+        else:
             initial_guess = np.ones(n_assets) / n_assets
 
-            # 最小化
-            result = minimize(objective, initial_guess, method='SLSQP', bounds=bounds, constraints=constraints)
+        # 最小化
+        result = minimize(objective, initial_guess, jac=True, method='SLSQP', bounds=bounds, constraints=constraints)
 
-            if not result.success:
-                raise BaseException('Optimization failed!')
+        instrumentation.count("optimize_portfolio.slsqp_calls")
+        instrumentation.count("optimize_portfolio.slsqp_iterations", result.nit)
 
-            weights = result.x
+        if not result.success:
+            raise OptimizationError(f'Optimization failed: {result.message}')
 
-        return weights
+        return result.x
+
+    def _solve_tangency_active_set(self, mu, sigma, initial_weights=None, max_iter=None):
+        """
+        不放空的最大 Sharpe 組合：求解 min y'Σy s.t. μ'y = 1, y ≥ 0，再令 w = y / sum(y)
+        primal active-set 法：每一輪只在自由資產集合 F 上解線性方程 Σ_FF y_F = λ μ_F，
+        不可行就往可行方向退回並移出碰到 0 的資產，可行就檢查 KKT 條件、加入違反最多的資產
+        """
+        n_assets = len(mu)
+        max_iter = max_iter or 10 * n_assets + 10
+
+        def solve_free(free):
+            # 自由集合上的子問題：y_F ∝ Σ_FF^-1 μ_F，並縮放到 μ'y = 1
+            y = np.zeros(n_assets)
+            z = np.linalg.solve(sigma[np.ix_(free, free)], mu[free])
+            y[free] = z / (mu[free] @ z)
+            return y
+
+        # 起點：上一期權重的持有集合若仍是可行解就沿用，否則從單一資產 Sharpe 最高者開始
+        y = None
+        if initial_weights is not None:
+            free = (initial_weights > 1e-10)
+            if free.any() and mu[free] @ initial_weights[free] > 0:
+                candidate = solve_free(free)
+                if np.all(candidate[free] > 0):
+                    y = candidate
+        if y is None:
+            volatilities = np.sqrt(np.diag(sigma))
+            best = np.argmax(np.where(mu > 0, mu / volatilities, -np.inf))
+            free = np.zeros(n_assets, dtype=bool)
+            free[best] = True
+            y = np.zeros(n_assets)
+            y[best] = 1 / mu[best]
+
+        for iteration in range(max_iter):
+            # KKT 檢查：Σy = λμ + ν，ν ≥ 0；在子問題最適解上 λ = y'Σy
+            sigma_y = sigma @ y
+            lam = y @ sigma_y
+            nu = sigma_y - lam * mu
+            tolerance = 1e-10 * max(abs(lam) * np.abs(mu).max(), 1e-300)
+            violated = ~free & (nu < -tolerance)
+            if not violated.any():
+                instrumentation.count("optimize_portfolio.active_set_calls")
+                instrumentation.count("optimize_portfolio.active_set_iterations", iteration + 1)
+                return y / y.sum()
+
+            free[np.argmin(np.where(violated, nu, np.inf))] = True
+
+            # 內層迴圈：直到自由集合上的子問題解為正
+            for _ in range(max_iter):
+                y_new = solve_free(free)
+                if np.all(y_new[free] > 0):
+                    y = y_new
+                    break
+
+                # 往 y_new 移動到第一個權重碰到 0 為止，並把它移出自由集合
+                blocking = free & (y_new <= 0)
+                alpha = np.min(y[blocking] / (y[blocking] - y_new[blocking]))
+                y = y + alpha * (y_new - y)
+                free &= y > 1e-14
+                y[~free] = 0
+                if not free.any():
+                    raise OptimizationError('Optimization failed: active set became empty')
+            else:
+                raise OptimizationError('Optimization failed: active-set inner loop did not converge')
+
+        raise OptimizationError('Optimization failed: active-set did not converge')
+
+    def frontier_solver(self, mu, sigma, initial_weights=None):
+        """
+        同一組 (μ, Σ) 的批次求解器（共用 Cholesky 分解），見 scr.frontier.FrontierSolver
+        """
+        from scr.frontier import FrontierSolver
+
+        return FrontierSolver(mu, sigma, initial_weights=initial_weights)
+
+    def optimize_strategy(self, solver, strategy, allow_short=False, initial_weights=None):
+        """
+        在 solver 的 (μ, Σ) 上求單一策略的權重
+        strategy: "max_sharpe" | "min_variance" | "risk_parity" | "equal"
+                  或 ("target_volatility", 年化波動) / ("target_return", 年化報酬)
+        initial_weights: 同一策略上一期的權重（max_sharpe / risk_parity 用來 warm start）
+        """
+        name, target = (strategy, None) if isinstance(strategy, str) else strategy
+
+        if name == "max_sharpe":
+            return np.asarray(self.optimize_portfolio(solver.mu, solver.covariance, allow_short=allow_short,
+                                                      initial_weights=initial_weights))
+        if name == "min_variance":
+            return solver.min_variance(allow_short=allow_short)
+        if name == "risk_parity":
+            return solver.risk_parity(initial_weights=initial_weights)
+        if name == "equal":
+            return np.ones(solver.n_assets) / solver.n_assets
+        if name == "target_volatility":
+            return solver.target_volatility(target, allow_short=allow_short)
+        if name == "target_return":
+            return solver.target_return(target, allow_short=allow_short)
+        raise ValueError(f"不支援的策略：{strategy}")
+
+    @instrumentation.timed("PortfolioOptimizer.optimize_portfolios")
+    def optimize_portfolios(self, mu, sigma, strategies=("max_sharpe", "min_variance", "risk_parity"),
+                            allow_short=False, initial_weights=None):
+        """
+        同一組 (μ, Σ) 一次求多種組合，回傳 {strategy: weights}
+        initial_weights: {strategy: 上一期權重}（可省略）
+        """
+        initial_weights = initial_weights or {}
+        solver = self.frontier_solver(mu, sigma, initial_weights=initial_weights.get("min_variance"))
+        return {strategy: self.optimize_strategy(solver, strategy, allow_short=allow_short,
+                                                 initial_weights=initial_weights.get(strategy))
+                for strategy in strategies}
+
+    def efficient_frontier(self, mu, sigma, n_points=20, allow_short=False, max_return=None):
+        """
+        效率前緣上報酬等距的 n_points 個組合，回傳 DataFrame（Return, Volatility 與各資產權重）
+        mu 為 Series 時以其 index 作為權重欄位名稱
+        """
+        solver = self.frontier_solver(mu, sigma)
+        returns, volatilities, weights = solver.frontier(n_points, allow_short=allow_short, max_return=max_return)
+        columns = list(mu.index) if isinstance(mu, pd.Series) else list(range(weights.shape[1]))
+        frontier = pd.DataFrame(weights, columns=columns)
+        frontier.insert(0, 'Volatility', volatilities)
+        frontier.insert(0, 'Return', returns)
+        return frontier
 
     def get_equal_weight_portfolio(self, asset_list):
         """
@@ -1,40 +1,161 @@
+import csv
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
+from scr.price_store import PriceStore
+from scr import instrumentation
 
 class ETFDataLoader:
-    def __init__(self, file_path_dict, data_dir=""):
+    DATE_FORMAT = '%Y-%m-%d'
+    READ_OPTIONS = dict(usecols=['Date', 'Adj Close'], dtype={'Date': str, 'Adj Close': 'float64'},
+                        na_values=['null'])
+
+    def __init__(self, file_path_dict, data_dir="", cache_dir=None, max_workers=None, chunksize=None):
         """
         file_path_dict: dict, {ETF代碼: 檔案檔名（不含路徑）}
         data_dir: 字串，所有csv檔所在資料夾的路徑
+        cache_dir: 二進位價格快取的資料夾，None 代表每次都重新讀 CSV
+        max_workers: 同時讀取 CSV 的 thread 數量，None 交給 ThreadPoolExecutor 決定
+        chunksize: 單檔歷史很長時，每次串流讀入的列數；None 代表整檔一次讀入
         """
         self.file_path_dict = file_path_dict
         self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.chunksize = chunksize
         self.price_df = self.load_data()
 
-    def load_data(self):
+    def get_source_paths(self):
         """
-        整合所有ETF的Adj Close收盤價，合併成一張表
+        組合每檔ETF的CSV完整路徑，並確認檔案存在
         """
-        price_data = []
-
+        source_paths = {}
         for etf_code, filename in self.file_path_dict.items():
             full_path = os.path.join(self.data_dir, filename)  # <<<<< 這裡重要，組合完整路徑！
 
             if not os.path.exists(full_path):
                 raise FileNotFoundError(f"找不到檔案：{full_path}")
 
-            df = pd.read_csv(full_path)
-            df = df[['Date', 'Adj Close']].copy()
-            df.rename(columns={'Adj Close': etf_code}, inplace=True)
-            df['Date'] = pd.to_datetime(df['Date'])
-            df.set_index('Date', inplace=True)
-            price_data.append(df)
+            source_paths[etf_code] = full_path
+        return source_paths
+
+    @instrumentation.timed("ETFDataLoader.load_data")
+    def load_data(self):
+        """
+        整合所有ETF的Adj Close收盤價，合併成一張表
+        有設定 cache_dir 時，優先以 memory-map 開啟二進位快取；來源 CSV 有變動才重新讀取並寫回快取
+        """
+        source_paths = self.get_source_paths()
+
+        if self.cache_dir is None:
+            return self.load_csv(source_paths)
+
+        store = PriceStore(self.cache_dir)
+        if store.is_valid(source_paths):
+            with instrumentation.section("ETFDataLoader.load_data.store_read"):
+                return store.load()
+
+        merged_price_df = self.load_csv(source_paths)
+        with instrumentation.section("ETFDataLoader.load_data.store_write"):
+            store.write(merged_price_df, source_paths)
+        return merged_price_df
+
+    @instrumentation.timed("ETFDataLoader.update")
+    def update(self):
+        """
+        每日更新：只讀取各 CSV 在上次寫入快取之後「附加在尾端」的列，接到二進位快取後面
+        回傳新增的價格列（日期都在原本最後一天之後，沒有新資料時為空表）
+        CSV 被改寫、資料補在舊日期、或快取不存在時，改為整批重新載入並回傳 None
+        """
+        if self.cache_dir is None:
+            raise ValueError("增量更新需要設定 cache_dir")
+
+        source_paths = self.get_source_paths()
+        store = PriceStore(self.cache_dir)
+        manifest = store.read_manifest()
+        if manifest is None or manifest.get('columns') != list(source_paths.keys()):
+            self.price_df = self.load_data()
+            return None
+
+        signatures = {}
+        new_prices = {}
+        for etf_code, path in source_paths.items():
+            appended, signatures[etf_code] = store.appended_bytes(etf_code, path)
+            if appended is None:
+                self.price_df = self.load_data()
+                return None
+            for date, price in self.parse_appended_rows(path, appended):
+                new_prices.setdefault(date, {})[etf_code] = price
+
+        if not new_prices:
+            return self.price_df.iloc[:0]
+
+        new_rows = pd.DataFrame.from_dict(new_prices, orient='index', columns=list(self.price_df.columns))
+        new_rows.index = pd.to_datetime(new_rows.index, format=self.DATE_FORMAT).rename('Date')
+        new_rows = new_rows.sort_index().astype('float64')
+
+        if new_rows.index[0] <= self.price_df.index[-1]:
+            # 舊日期的資料有變動（例如某檔晚一天才補上），歷史報酬會跟著改變，只能整批重建
+            self.price_df = self.load_data()
+            return None
+
+        with instrumentation.section("ETFDataLoader.update.store_append"):
+            store.append(new_rows, signatures)
+            self.price_df = store.load()
+        return new_rows
+
+    def parse_appended_rows(self, full_path, appended):
+        """
+        解析 CSV 尾端新增的幾列（每天通常只有一列，直接用 csv 模組，不必啟動整個 read_csv）
+        欄位位置沿用檔案第一行的欄位名稱；回傳 list of (日期字串, Adj Close)，'null' 轉為 NaN
+        """
+        lines = appended.decode("utf-8").splitlines()
+        if not any(line.strip() for line in lines):
+            return []
+
+        with open(full_path, "r", encoding="utf-8", newline="") as f:
+            header = next(csv.reader(f))
+        date_col, price_col = header.index('Date'), header.index('Adj Close')
+
+        rows = []
+        for fields in csv.reader(line for line in lines if line.strip()):
+            price = fields[price_col]
+            rows.append((fields[date_col], float('nan') if price in self.READ_OPTIONS['na_values'] else float(price)))
+        return rows
+
+    @instrumentation.timed("ETFDataLoader.load_data.csv")
+    def load_csv(self, source_paths):
+        """
+        直接從 CSV 讀取並以 Date 合併，各檔案以 thread pool 同時讀取
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            price_data = list(executor.map(self.read_price_csv, source_paths.keys(), source_paths.values()))
 
         # 以Date為key進行outer join合併
         merged_price_df = pd.concat(price_data, axis=1, join='outer')
         merged_price_df.sort_index(inplace=True)
         return merged_price_df
 
+    def read_price_csv(self, etf_code, full_path):
+        """
+        只讀 Date 與 Adj Close 兩欄，固定 dtype 並以明確的日期格式解析
+        設定 chunksize 時改為分段串流讀取，每段解析完再合併
+        """
+        read_options = self.READ_OPTIONS
+
+        if self.chunksize is None:
+            df = self._parse_price_frame(pd.read_csv(full_path, **read_options), etf_code)
+        else:
+            chunks = [self._parse_price_frame(chunk, etf_code)
+                      for chunk in pd.read_csv(full_path, chunksize=self.chunksize, **read_options)]
+            df = pd.concat(chunks)
+        return df
+
+    def _parse_price_frame(self, df, etf_code):
+        df = df.rename(columns={'Adj Close': etf_code})
+        df['Date'] = pd.to_datetime(df['Date'], format=self.DATE_FORMAT)
+        return df.set_index('Date')
+
 if __name__ == "__main__":
     etf_files = {
         'VTSMX': 'VTSMX.csv',
@@ -0,0 +1,210 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class PriceStore:
+    STORE_VERSION = 1
+
+    def __init__(self, store_dir):
+        """
+        合併後 Adj Close 價格表的二進位快取
+        prices.npy: (n_days, n_etfs) 的 float64 矩陣（缺值為 NaN），可用 memory-map 開啟
+        dates.npy:  int64 的日期（ns）
+        manifest.json: 欄位順序與每個來源 CSV 的大小、mtime、sha1，用來判斷快取是否過期
+        """
+        self.store_dir = store_dir
+        self.prices_path = os.path.join(store_dir, "prices.npy")
+        self.dates_path = os.path.join(store_dir, "dates.npy")
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+
+    @staticmethod
+    def file_signature(path, with_hash=True):
+        stat = os.stat(path)
+        signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if with_hash:
+            signature['sha1'] = PriceStore.file_hash(path)
+        return signature
+
+    @staticmethod
+    def file_hash(path, block_size=1 << 20):
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self, source_paths):
+        """
+        source_paths: {ETF代碼: CSV 完整路徑}
+        欄位相同、且每個 CSV 的大小與 mtime 都沒變 ➜ 有效
+        mtime 變了但內容 hash 相同（例如只是重新複製檔案）➜ 仍有效，順便更新 manifest
+        """
+        manifest = self.read_manifest()
+        if manifest is None or manifest.get('version') != self.STORE_VERSION:
+            return False
+        if manifest.get('columns') != list(source_paths.keys()):
+            return False
+        if not (os.path.exists(self.prices_path) and os.path.exists(self.dates_path)):
+            return False
+
+        refreshed = False
+        for etf_code, path in source_paths.items():
+            recorded = manifest['sources'].get(etf_code)
+            if recorded is None or recorded['path'] != os.path.abspath(path):
+                return False
+
+            current = self.file_signature(path, with_hash=False)
+            if current['size'] == recorded['size'] and current['mtime_ns'] == recorded['mtime_ns']:
+                continue
+
+            if current['size'] != recorded['size'] or self.file_hash(path) != recorded['sha1']:
+                return False
+
+            recorded['mtime_ns'] = current['mtime_ns']
+            refreshed = True
+
+        if refreshed:
+            self._write_manifest(manifest)
+        return True
+
+    def appended_bytes(self, etf_code, path):
+        """
+        與 manifest 記錄相比，來源 CSV 在尾端新增的內容
+        回傳 (新增的 bytes, 目前的檔案簽章)：b"" ➜ 沒有變動；None ➜ 不是單純附加（改寫過或變短），需要整批重建
+        檔案只讀一次：前段算出的 sha1 與記錄比對後，接著讀完尾端就得到整個檔案的新 sha1
+        """
+        manifest = self.read_manifest()
+        recorded = manifest['sources'].get(etf_code) if manifest is not None else None
+        if recorded is None or recorded['path'] != os.path.abspath(path):
+            return None, None
+
+        current = self.file_signature(path, with_hash=False)
+        if current['size'] == recorded['size'] and current['mtime_ns'] == recorded['mtime_ns']:
+            return b"", recorded
+        if current['size'] < recorded['size']:
+            return None, None
+
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            remaining = recorded['size']
+            while remaining > 0:
+                block = f.read(min(1 << 20, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            if digest.hexdigest() != recorded['sha1']:
+                return None, None
+
+            appended = f.read()
+        digest.update(appended)
+
+        signature = dict(path=os.path.abspath(path), size=recorded['size'] + len(appended),
+                         mtime_ns=current['mtime_ns'], sha1=digest.hexdigest())
+        return appended, signature
+
+    def append(self, new_rows, signatures):
+        """
+        把日期在最後一天之後的新價格列接在 prices.npy / dates.npy 尾端（直接改寫檔頭的形狀，不重寫整個檔案）
+        signatures: {ETF代碼: appended_bytes() 回傳的檔案簽章}，寫進 manifest
+        """
+        manifest = self.read_manifest()
+        new_rows = new_rows[manifest['columns']]
+
+        prices = np.ascontiguousarray(new_rows.to_numpy(dtype=np.float64))
+        dates = new_rows.index.values.astype('datetime64[ns]').view(np.int64)
+        self._append_npy(self.prices_path, prices)
+        self._append_npy(self.dates_path, dates)
+
+        manifest['sources'].update(signatures)
+        self._write_manifest(manifest)
+
+    @staticmethod
+    def _append_npy(path, rows):
+        """
+        在既有的 .npy 檔尾端附加列：檔頭長度不變時只改寫檔頭並附加資料，否則整個重寫
+        """
+        npy_format = np.lib.format
+        with open(path, "r+b") as f:
+            version = npy_format.read_magic(f)
+            if version == (1, 0):
+                read_header, write_header = npy_format.read_array_header_1_0, npy_format.write_array_header_1_0
+            else:
+                read_header, write_header = npy_format.read_array_header_2_0, npy_format.write_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            data_offset = f.tell()
+
+            if fortran_order or dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+                raise ValueError(f"{path} 的格式與新增資料不符")
+
+            # write_array_header_* 會連同 magic string 一起寫出
+            header = io.BytesIO()
+            write_header(header, {'descr': npy_format.dtype_to_descr(dtype), 'fortran_order': False,
+                                  'shape': (shape[0] + len(rows),) + shape[1:]})
+
+            if len(header.getvalue()) == data_offset:
+                f.seek(0, os.SEEK_END)
+                f.write(rows.tobytes())
+                f.seek(0)
+                f.write(header.getvalue())
+                return
+
+        # 檔頭長度改變（很少見）：整個檔案重寫
+        existing = np.load(path)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, np.concatenate([existing, rows]))
+        os.replace(tmp_path, path)
+
+    def load(self, mmap=True):
+        """
+        讀取價格表，預設以 memory-map 開啟（不把整個矩陣讀進記憶體）
+        """
+        prices = np.load(self.prices_path, mmap_mode='r' if mmap else None)
+        dates = np.load(self.dates_path)
+        columns = self.read_manifest()['columns']
+
+        index = pd.DatetimeIndex(dates.astype('datetime64[ns]'), name='Date')
+        return pd.DataFrame(prices, index=index, columns=columns, copy=False)
+
+    def write(self, price_df, source_paths):
+        """
+        把合併好的價格表寫進快取，並記錄來源 CSV 的簽章
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        prices = np.ascontiguousarray(price_df.to_numpy(dtype=np.float64))
+        dates = price_df.index.values.astype('datetime64[ns]').view(np.int64)
+
+        # 先寫暫存檔再換名，避免讀到寫一半的快取
+        for path, array in ((self.prices_path, prices), (self.dates_path, dates)):
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+
+        manifest = {
+            'version': self.STORE_VERSION,
+            'columns': list(price_df.columns),
+            'sources': {
+                etf_code: dict(path=os.path.abspath(path), **self.file_signature(path))
+                for etf_code, path in source_paths.items()
+            }
+        }
+        self._write_manifest(manifest)
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,119 @@
+import re
+
+import numpy as np
+import pandas as pd
+from scr import kernels
+
+_FREQ_UNITS = {'D': ('days', 1), 'W': ('weeks', 1), 'M': ('months', 1), 'Q': ('months', 3), 'Y': ('years', 1)}
+
+
+def parse_rebalance_freq(freq):
+    """
+    rebalance 週期字串 ➜ (DateOffset 的單位, 每期幾個單位)
+    例如 '6M' ➜ ('months', 6)、'Q' ➜ ('months', 3)、'1Y' ➜ ('years', 1)、'2W' ➜ ('weeks', 2)
+    """
+    match = re.fullmatch(r'\s*(\d*)\s*([DWMQY])\s*', str(freq).upper())
+    if match is None:
+        raise ValueError(f"不支援的 rebalance_freq：{freq}")
+    count = int(match.group(1) or 1)
+    if count <= 0:
+        raise ValueError(f"不支援的 rebalance_freq：{freq}")
+    unit, multiplier = _FREQ_UNITS[match.group(2)]
+    return unit, count * multiplier
+
+
+def rebalance_offset(freq, k):
+    """
+    第 k 次 rebalance 相對於起始日的位移（start + k 期，而不是逐期累加，避免月底日期漂移）
+    """
+    unit, count = parse_rebalance_freq(freq)
+    return pd.DateOffset(**{unit: count * k})
+
+
+def drift_block(returns, target, holdings=None, cost_rate=0.0, fixed_cost=0.0, nav=1.0, threshold=None,
+                rebalance=True):
+    """
+    一段 rebalance 區間的組合日報酬：期初調整到 target 後各資產跟著市場漂移（買進持有），不是每天調回 target
+    以區塊的累積乘積計算，不逐日迴圈；有設定 threshold 時，權重偏離 target 超過門檻的隔天調回 target，
+    迴圈次數只跟觸發次數有關
+
+    returns: (days × assets) 的日報酬區塊
+    target: 目標權重
+    holdings: 進入區塊前（漂移後）的權重，None 代表從現金建倉
+    cost_rate: 交易成本，成交金額（以淨值比例計的 turnover）的比例
+    fixed_cost: 每次 rebalance 的固定成本（與 nav 同單位）
+    nav: 進入區塊前的淨值，用來把固定成本換算成比例
+    threshold: 任一資產權重與 target 的差距超過此值就提前 rebalance，None 代表只在排定日交易
+    rebalance: False ➜ 區塊開頭不交易，由 holdings 接著漂移（同一個 rebalance 區間分成幾段計算時使用，
+               例如 LivePortfolio 每日只處理新增的天數）；此時 holdings 不可為 None
+
+    回傳 (日報酬 ndarray, 區塊結束時漂移後的權重, 結束時淨值, 交易次數, turnover 總和)
+    有安裝 numba 時改用 scr.kernels 的逐日迴圈（結果相同，不必每次觸發門檻就重算 cumprod）
+    區塊中任一資產缺值（NaN）的日子視為不存在：不漂移、不交易，回傳的日報酬為 NaN（等同先 dropna）
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    missing = np.isnan(returns).any(axis=1)
+    if missing.any():
+        portfolio_returns = np.full(len(returns), np.nan)
+        portfolio_returns[~missing], holdings, nav, n_trades, turnover = drift_block(
+            returns[~missing], target, holdings, cost_rate=cost_rate, fixed_cost=fixed_cost, nav=nav,
+            threshold=threshold, rebalance=rebalance)
+        return portfolio_returns, holdings, nav, n_trades, turnover
+
+    if kernels.USE_JIT:
+        return kernels.drift_loop(returns, target, holdings, cost_rate=cost_rate, fixed_cost=fixed_cost, nav=nav,
+                                  threshold=threshold, rebalance=rebalance)
+    return drift_block_numpy(returns, target, holdings, cost_rate=cost_rate, fixed_cost=fixed_cost, nav=nav,
+                             threshold=threshold, rebalance=rebalance)
+
+
+def drift_block_numpy(returns, target, holdings=None, cost_rate=0.0, fixed_cost=0.0, nav=1.0, threshold=None,
+                      rebalance=True):
+    """
+    drift_block 的 NumPy 版本：以區塊的累積乘積計算，迴圈次數只跟門檻觸發次數有關
+    """
+    if not rebalance and holdings is None:
+        raise ValueError("rebalance=False 需要進入區塊前的 holdings")
+
+    returns = np.asarray(returns, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    n_days = len(returns)
+    portfolio_returns = np.empty(n_days)
+
+    position = 0
+    n_trades = 0
+    total_turnover = 0.0
+    while position < n_days:
+        # 這一段期初的權重：接續上一段時沿用漂移後的 holdings（不交易），否則調整到 target
+        if position == 0 and not rebalance:
+            base = np.asarray(holdings, dtype=np.float64)
+            turnover = 0.0
+        else:
+            base = target
+            turnover = np.abs(target).sum() if holdings is None else np.abs(target - holdings).sum()
+        cost = 0.0
+        if turnover > 0:
+            cost = min(cost_rate * turnover + fixed_cost / nav, 1.0)
+            n_trades += 1
+            total_turnover += turnover
+
+        # 期初每 1 元淨值裡各資產的成長：growth[t, i] = Π(1 + r)，組合價值 = growth @ base
+        growth = np.cumprod(1 + returns[position:], axis=0)
+        value = growth @ base
+
+        length = len(value)
+        if threshold is not None:
+            drifted = growth * base / value[:, None]
+            breached = np.flatnonzero(np.abs(drifted - target).max(axis=1) > threshold)
+            if len(breached) > 0:
+                length = breached[0] + 1
+
+        value = value[:length] * (1 - cost)
+        portfolio_returns[position] = value[0] - 1
+        portfolio_returns[position + 1:position + length] = value[1:] / value[:-1] - 1
+
+        holdings = growth[length - 1] * base / (growth[length - 1] @ base)
+        nav *= value[-1]
+        position += length
+
+    return portfolio_returns, holdings, nav, n_trades, total_turnover
@@ -1,30 +1,125 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
+from scr import instrumentation
+
+METRICS = ["Annualized Return", "Annualized Volatility", "Sharpe Ratio", "Max Drawdown"]
+CHART_MANIFEST = ".chart_manifest.json"
+CHART_VERSION = 1  # 改了圖表畫法就加一，讓舊的 PNG 全部重畫
+
+
+def load_plotting(headless=False):
+    """
+    需要畫圖時才匯入 matplotlib / seaborn
+    headless=True 時使用 Agg backend（不需要顯示器，plt.show() 不會卡住）
+    """
+    import matplotlib
+    if headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+def render_chart(spec):
+    """
+    依 spec 畫一張圖並存檔（可在 worker process 中執行，因此只依賴 spec 內的資料）
+    spec: {'kind': 'bar' | 'box', 'data': DataFrame, 'path': 輸出路徑, 其餘為各圖的參數}
+    直接畫在獨立的 Figure + Agg canvas 上，不經過 pyplot，也不切換呼叫端的 backend
+    """
+    import seaborn as sns
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    data = spec['data']
+
+    if spec['kind'] == 'bar':
+        # data 已是每個 (Mode, Years) 一列的平均表，每根柱子只有一個值，不需要 bootstrap 信賴區間
+        fig = Figure(figsize=(8, 5))
+        ax = fig.subplots()
+        sns.barplot(data=data, x="Mode", y=spec['metric'], hue="Years", order=spec['order'], errorbar=None, ax=ax)
+        ax.set_title(f"{spec['metric']} by Strategy and Holding Years")
+        ax.grid(True)
+    elif spec['kind'] == 'box':
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        sns.boxplot(data=data, x="Label", y=spec['metric'], order=spec['order'], ax=ax)
+        ax.set_title(f"{spec['metric']} by Strategy and Holding Period")
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.grid(True)
+    else:
+        raise ValueError(f"不支援的圖表類型：{spec['kind']}")
+
+    FigureCanvasAgg(fig)
+    fig.tight_layout()
+    fig.savefig(spec['path'])
+    return spec['path']
+
+
+def _init_chart_worker():
+    """
+    畫圖 worker 的 initializer：worker 沒有顯示器，整個 process 都改用 Agg backend
+    """
+    load_plotting(headless=True)
+
+
+def chart_hash(spec):
+    """
+    圖表輸入的 hash：資料內容 + 參數，任何一項改變才需要重畫
+    數值先四捨五入到小數 10 位，快取命中與否造成的浮點誤差（~1e-16）不會觸發重畫
+    """
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(spec['data'].round(10), index=False).values.tobytes())
+    params = {key: value for key, value in spec.items() if key not in ('data', 'path')}
+    digest.update(json.dumps({'version': CHART_VERSION, 'columns': list(spec['data'].columns), **params},
+                             sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
 
 class ResultReporter:
-    def __init__(self, summary_df):
+    def __init__(self, summary_df, headless=False):
+        """
+        headless=True ➜ 使用 Agg backend，plot_* 只畫不顯示（適合沒有螢幕的伺服器 / CI）
+        """
         self.df = summary_df.copy()
+        self.headless = headless
+        self._summary = None
+
+    def _show(self, plt):
+        if self.headless:
+            plt.close()
+        else:
+            plt.show()
+
+    def summary_table(self):
+        """
+        每個 (Mode, Years) 的平均績效，只計算一次，表格與所有 bar chart 共用
+        """
+        if self._summary is None:
+            self._summary = self.df.groupby(["Mode", "Years"])[METRICS].mean().reset_index()
+        return self._summary
 
     def plot_avg_metrics_by_year(self):
-        import seaborn as sns
-        import matplotlib.pyplot as plt
+        plt, sns = load_plotting(self.headless)
 
-        metrics = ["Annualized Return", "Annualized Volatility", "Sharpe Ratio", "Max Drawdown"]
+        summary = self.summary_table()
+        order = list(pd.unique(self.df["Mode"]))
         fig, axs = plt.subplots(2, 2, figsize=(12, 8))
         axs = axs.flatten()
 
-        for i, metric in enumerate(metrics):
-            sns.barplot(data=self.df, x="Mode", y=metric, hue="Years", ax=axs[i])
+        for i, metric in enumerate(METRICS):
+            sns.barplot(data=summary, x="Mode", y=metric, hue="Years", order=order, errorbar=None, ax=axs[i])
             axs[i].set_title(f"{metric} by Mode and Years")
             axs[i].grid(True)
 
         plt.tight_layout()
-        plt.show()
+        self._show(plt)
 
     def plot_boxplot_by_year(self, metric):
-        import seaborn as sns
-        import matplotlib.pyplot as plt
+        plt, sns = load_plotting(self.headless)
 
         if metric not in self.df.columns:
             print(f"指標 {metric} 不存在")
@@ -34,11 +129,10 @@ class ResultReporter:
         sns.boxplot(data=self.df, x="Mode", y=metric, hue="Years")
         plt.title(f"{metric} by Strategy and Holding Years")
         plt.grid(True)
-        plt.show()
+        self._show(plt)
 
     def plot_boxplot_by_label(self, metric):
-        import seaborn as sns
-        import matplotlib.pyplot as plt
+        plt, sns = load_plotting(self.headless)
 
         plt.figure(figsize=(10, 6))
         sns.boxplot(x="Label", y=metric, data=self.df)
@@ -46,10 +140,10 @@ class ResultReporter:
         plt.xticks(rotation=45)
         plt.grid(True)
         plt.tight_layout()
-        plt.show()
+        self._show(plt)
 
     def plot_trial_lines_by_year(self, metric="Annualized Return"):
-        import matplotlib.pyplot as plt
+        plt, _ = load_plotting(self.headless)
 
         plt.figure(figsize=(10, 6))
         for (mode, year), group in self.df.groupby(["Mode", "Years"]):
@@ -60,11 +154,34 @@ class ResultReporter:
         plt.ylabel(metric)
         plt.legend()
         plt.grid(True)
-        plt.show()
+        self._show(plt)
 
-    def export_all_outputs(self, output_dir="output"):
-        import os
+    def chart_specs(self, output_dir):
+        """
+        export_all_outputs 要輸出的所有圖表，每張圖只帶它需要的最小資料
+        """
+        summary = self.summary_table()
+        mode_order = list(pd.unique(self.df["Mode"]))
 
+        specs = []
+        for metric in METRICS:
+            filename = f"{metric.lower().replace(' ', '_')}_barplot.png"
+            specs.append({'kind': 'bar', 'metric': metric, 'order': mode_order,
+                          'data': summary[["Mode", "Years", metric]],
+                          'path': os.path.join(output_dir, filename)})
+
+        specs.append({'kind': 'box', 'metric': "Sharpe Ratio", 'order': list(pd.unique(self.df["Label"])),
+                      'data': self.df[["Label", "Sharpe Ratio"]],
+                      'path': os.path.join(output_dir, "sharpe_ratio_boxplot.png")})
+        return specs
+
+    @instrumentation.timed("ResultReporter.export_all_outputs")
+    def export_all_outputs(self, output_dir="output", workers=1, force=False):
+        """
+        匯出表格與 PNG（一律畫在 Agg canvas 上，不會開視窗，也不改變目前 process 的 backend）
+        workers: 平行畫圖的 process 數量，1 代表在目前的 process 依序畫
+        force: False 時輸入資料沒變（hash 相同且檔案存在）的圖表直接沿用，不重畫
+        """
         os.makedirs(output_dir, exist_ok=True)
 
         # 1. 加上 Label 欄位（如未建立）
@@ -72,34 +189,54 @@ class ResultReporter:
             self.df["Label"] = self.df["Mode"] + "_" + self.df["Years"].astype(str) + "Y"
 
         # 2. 匯出原始模擬資料
-        self.df.to_csv(os.path.join(output_dir, "simulation_summary.csv"), index=False)
-
-        # 3. 匯出平均績效表格
-        grouped = self.df.groupby(["Mode", "Years"])[
-            ["Annualized Return", "Annualized Volatility", "Sharpe Ratio", "Max Drawdown"]
-        ].mean().round(4).reset_index()
-        grouped.to_csv(os.path.join(output_dir, "summary_table.csv"), index=False)
-
-        # 4. 儲存每個指標的 bar chart（Mode x Years）
-        metrics = ["Annualized Return", "Annualized Volatility", "Sharpe Ratio", "Max Drawdown"]
-        for metric in metrics:
-            plt.figure(figsize=(8, 5))
-            sns.barplot(data=self.df, x="Mode", y=metric, hue="Years")
-            plt.title(f"{metric} by Strategy and Holding Years")
-            plt.grid(True)
-            plt.tight_layout()
-            filename = f"{metric.lower().replace(' ', '_')}_barplot.png"
-            plt.savefig(os.path.join(output_dir, filename))
-            plt.close()
-
-        # 5. 儲存 Sharpe Ratio boxplot（Label）
-        plt.figure(figsize=(10, 6))
-        sns.boxplot(data=self.df, x="Label", y="Sharpe Ratio")
-        plt.title("Sharpe Ratio by Strategy and Holding Period")
-        plt.xticks(rotation=45)
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, "sharpe_ratio_boxplot.png"))
-        plt.close()
-
-        print(f"✅ 所有圖表與表格已儲存至 {output_dir}/")
+        with instrumentation.section("ResultReporter.export.tables"):
+            self.df.to_csv(os.path.join(output_dir, "simulation_summary.csv"), index=False)
+
+            # 3. 匯出平均績效表格
+            self.summary_table().round(4).to_csv(os.path.join(output_dir, "summary_table.csv"), index=False)
+
+        # 4. bar chart（Mode x Years）與 Sharpe Ratio boxplot（Label），只重畫輸入有變的圖
+        manifest_path = os.path.join(output_dir, CHART_MANIFEST)
+        manifest = {}
+        if not force and os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+
+        pending = []
+        for spec in self.chart_specs(output_dir):
+            filename = os.path.basename(spec['path'])
+            digest = chart_hash(spec)
+            if manifest.get(filename) == digest and os.path.exists(spec['path']):
+                continue
+            manifest[filename] = digest
+            pending.append(spec)
+
+        with instrumentation.section("ResultReporter.export.charts"):
+            if workers > 1 and len(pending) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                         initializer=_init_chart_worker) as executor:
+                    list(executor.map(render_chart, pending))
+            else:
+                for spec in pending:
+                    render_chart(spec)
+
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+        print(f"✅ 所有圖表與表格已儲存至 {output_dir}/（重畫 {len(pending)} 張圖）")
+
+    @staticmethod
+    def export_streaming_summary(summary, output_dir="output"):
+        """
+        串流模式（Simulator.stream_grid）下沒有完整的模擬表，改由 GroupSummary 的線上統計量匯出
+        summary_table.csv 與一般模式格式相同；summary_distribution.csv 另含標準差與近似分位數
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        summary.means_table().to_csv(os.path.join(output_dir, "summary_table.csv"), index=False)
+        summary.to_frame().round(6).to_csv(os.path.join(output_dir, "summary_distribution.csv"), index=False)
+        print(f"✅ 串流統計已儲存至 {output_dir}/")
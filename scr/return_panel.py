@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from scr.rolling_moments import append_rows
+
+
+def to_int64_dates(dates):
+    """
+    日期（單一或陣列）➜ int64 奈秒；pandas 的 DatetimeIndex 可能是 s / ms / us 解析度，統一換成 ns
+    """
+    if np.ndim(dates) == 0:
+        return pd.Timestamp(dates).as_unit('ns').value
+    return np.asarray(pd.DatetimeIndex(dates).as_unit('ns').asi8, dtype=np.int64)
+
+
+class ReturnPanel:
+    def __init__(self, values, dates, columns, dtype=np.float64):
+        """
+        日報酬率的精簡核心：連續（C-order）的 NumPy 矩陣 + 排序好的 int64 日期（ns）+ 欄位對照表
+        optimizer / backtester / simulator 共用同一份，依整數位置切片時都是 view，不會複製資料
+
+        values: (n_days, n_assets)，NaN 代表該資產當天沒有資料（例如還沒上市），見 scr.availability
+        dates: 與 values 對齊的日期（任何可轉成 datetime64[ns] 的格式）
+        dtype: np.float64（預設）或 np.float32（資產數很多時省一半記憶體，估計參數時仍以 float64 計算）
+        """
+        values = np.ascontiguousarray(values, dtype=dtype)
+        dates = to_int64_dates(dates)
+        if values.ndim != 2 or len(values) != len(dates):
+            raise ValueError(f"values 形狀 {values.shape} 與日期數量 {len(dates)} 不符")
+        if len(dates) > 1 and (np.diff(dates) <= 0).any():
+            raise ValueError("日期必須嚴格遞增")
+
+        self.columns = list(columns)
+        self.column_map = {column: i for i, column in enumerate(self.columns)}
+        self.n_days = len(values)
+
+        # append() 用的預留容量；values / dates 為 buffer 前段的 view
+        self._values_buffer = values
+        self._dates_buffer = dates
+        self._index = None
+
+    @classmethod
+    def from_frame(cls, returns, dtype=None):
+        """
+        由 DataFrame 建立；dtype 為 None 時沿用 DataFrame 的型別（float32 / float64）
+        已經是連續 float 矩陣時不會複製
+        """
+        if dtype is None:
+            dtype = np.float32 if (returns.dtypes == np.float32).all() else np.float64
+        return cls(returns.to_numpy(dtype=dtype), returns.index, returns.columns, dtype=dtype)
+
+    @property
+    def values(self):
+        return self._values_buffer[:self.n_days]
+
+    @property
+    def dates(self):
+        return self._dates_buffer[:self.n_days]
+
+    @property
+    def dtype(self):
+        return self._values_buffer.dtype
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.dates.nbytes
+
+    @property
+    def index(self):
+        """
+        pandas 的 DatetimeIndex（第一次用到才建立，append 後重建）
+        """
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self.dates.view('datetime64[ns]'), name='Date')
+        return self._index
+
+    def __len__(self):
+        return self.n_days
+
+    def positions(self, asset_list):
+        """
+        資產代碼 ➜ 欄位的整數位置
+        """
+        try:
+            return np.array([self.column_map[asset] for asset in asset_list], dtype=np.intp)
+        except KeyError:
+            missing = [asset for asset in asset_list if asset not in self.column_map]
+            raise KeyError(f"找不到資產：{missing}") from None
+
+    def searchsorted(self, dates, side='left'):
+        """
+        日期（單一或陣列）➜ 在 dates 上的整數位置
+        """
+        if np.ndim(dates) == 0:
+            return int(np.searchsorted(self.dates, to_int64_dates(dates), side=side))
+        return np.searchsorted(self.dates, to_int64_dates(dates), side=side)
+
+    def window(self, start_pos, end_pos, asset_idx=None):
+        """
+        [start_pos, end_pos) 區間的報酬矩陣
+        asset_idx 為 None 時是 view（不複製）；指定資產子集合時才會複製該區間
+        """
+        block = self.values[start_pos:end_pos]
+        return block if asset_idx is None else block[:, asset_idx]
+
+    def expand_weights(self, weights, asset_idx):
+        """
+        把 asset_idx 資產的權重攤成全部欄位長度的向量（其餘為 0）
+        之後 window(a, b) @ 全長權重 就不必先複製資產子集合
+        """
+        full_weights = np.zeros(len(self.columns), dtype=np.float64)
+        full_weights[asset_idx] = weights
+        return full_weights
+
+    def append(self, values, dates):
+        """
+        在尾端加入新的日報酬（每日更新用），容量不足時加倍，既有的 view 不受影響
+        """
+        values = np.asarray(values, dtype=self.dtype).reshape(-1, len(self.columns))
+        dates = to_int64_dates(dates)
+        if len(values) != len(dates):
+            raise ValueError("新增的報酬與日期數量不符")
+        if len(values) == 0:
+            return
+        if self.n_days > 0 and dates[0] <= self.dates[-1]:
+            raise ValueError("新增的日期必須在現有資料的最後一天之後")
+
+        self._values_buffer, _ = append_rows(self._values_buffer, self.n_days, values)
+        self._dates_buffer, self.n_days = append_rows(self._dates_buffer, self.n_days, dates)
+        self._index = None
+
+    def to_frame(self, asset_list=None):
+        """
+        包成 DataFrame（沒有指定資產時不複製資料）
+        """
+        if asset_list is None:
+            return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+        return pd.DataFrame(self.values[:, self.positions(asset_list)], index=self.index, columns=list(asset_list))
@@ -0,0 +1,143 @@
+import numpy as np
+
+
+def append_rows(buffer, n_used, rows):
+    """
+    把 rows 接在 buffer 前 n_used 列之後，容量不足時加倍（攤提後每列 O(1)，不必每天複製整段歷史）
+    回傳 (buffer, 新的列數)；有效資料為 buffer[:新的列數]
+    """
+    n_new = n_used + len(rows)
+    if n_new > len(buffer):
+        grown = np.empty((max(n_new, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:n_used] = buffer[:n_used]
+        buffer = grown
+    buffer[n_used:n_new] = rows
+    return buffer, n_new
+
+
+class RollingMoments:
+    def __init__(self, returns, max_bytes=256 * 2 ** 20):
+        """
+        一次性預先計算整張報酬率矩陣的累積和與累積外積和
+        之後任意 [start, end) 區間的平均數與共變異數都只要 O(assets²)
+
+        returns: (n_days, n_assets) 的 DataFrame 或 ndarray
+                 NaN（資產還沒有資料）在累積和裡當作 0，只有落在該組資產有效區間內的查詢才有意義，
+                 區間中的缺值日要以 window(..., exclude=) 整列扣掉（見 scr.availability.AvailabilityIndex）
+        max_bytes: 累積外積和最多佔用的記憶體，超過時改成每 stride 天存一個 checkpoint
+        """
+        values = np.asarray(returns, dtype=np.float64)
+        self.n_days, self.n_assets = values.shape
+
+        # 先扣掉全期平均（只算有資料的天數）再累加，避免長期累加時 E[x²] - E[x]² 的數值誤差
+        valid = ~np.isnan(values)
+        self.shift = np.where(valid, values, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        self.centered = np.where(valid, values - self.shift, 0.0)
+
+        # 累積外積和太大時，每 stride 天才存一次，查詢時再補上零頭
+        full_bytes = (self.n_days + 1) * self.n_assets ** 2 * 8
+        self.stride = max(1, int(np.ceil(full_bytes / max_bytes)))
+
+        self._s1 = np.zeros((self.n_days + 1, self.n_assets))
+        np.cumsum(self.centered, axis=0, out=self._s1[1:])
+
+        s2 = np.zeros((1, self.n_assets, self.n_assets))
+        self._s2 = np.concatenate([s2, self._outer_checkpoints(0, self.n_days, s2[0])])
+
+        # extend() 用的預留容量（_s1 / centered / _s2 都是這些 buffer 的前段 view）
+        self._centered_buffer = self.centered
+        self._s1_buffer = self._s1
+        self._s2_buffer = self._s2
+
+    def _outer_checkpoints(self, lo, hi, running):
+        """
+        分批計算 [lo, hi) 的累積外積和 Σ x_t x_tᵀ（接在 running = 前 lo 天的總和之後）
+        只回傳落在 stride 倍數位置的 checkpoint
+        """
+        n = self.n_assets
+        chunk_rows = max(1, 2 ** 22 // max(1, n * n))
+        checkpoints = []
+
+        for chunk_lo in range(lo, hi, chunk_rows):
+            chunk_hi = min(chunk_lo + chunk_rows, hi)
+            block = self.centered[chunk_lo:chunk_hi]
+            cumulative = np.cumsum(block[:, :, None] * block[:, None, :], axis=0) + running
+
+            positions = np.arange(chunk_lo + 1, chunk_hi + 1)
+            checkpoints.append(cumulative[positions % self.stride == 0])
+            running = cumulative[-1]
+
+        if not checkpoints:
+            return np.zeros((0, n, n))
+        return np.concatenate(checkpoints)
+
+    def extend(self, new_returns):
+        """
+        在尾端加入新的日報酬（每日更新用），只計算新增的天數，不重算歷史
+        shift 沿用建立時的值（只用來改善數值穩定度，不影響結果）；stride 也維持不變
+        """
+        values = np.asarray(new_returns, dtype=np.float64).reshape(-1, self.n_assets)
+        if len(values) == 0:
+            return
+
+        lo = self.n_days
+        # 接在前 lo 天之後的累積外積和：最後一個 checkpoint 加上零頭
+        running = self._outer_prefix(lo, None)
+
+        centered = np.where(np.isnan(values), 0.0, values - self.shift)
+        self._centered_buffer, self.n_days = append_rows(self._centered_buffer, lo, centered)
+        self.centered = self._centered_buffer[:self.n_days]
+
+        s1_rows = self._s1[lo] + np.cumsum(self.centered[lo:], axis=0)
+        self._s1_buffer, n_rows = append_rows(self._s1_buffer, lo + 1, s1_rows)
+        self._s1 = self._s1_buffer[:n_rows]
+
+        checkpoints = self._outer_checkpoints(lo, self.n_days, running)
+        self._s2_buffer, n_rows = append_rows(self._s2_buffer, len(self._s2), checkpoints)
+        self._s2 = self._s2_buffer[:n_rows]
+
+    def _outer_prefix(self, position, asset_idx):
+        """
+        取出前 position 天的累積外積和（只取 asset_idx 的子矩陣，None 代表全部資產、不必複製子矩陣）
+        """
+        checkpoint = position // self.stride
+        if asset_idx is None:
+            total = self._s2[checkpoint]
+            remainder = self.centered[checkpoint * self.stride:position]
+        else:
+            total = self._s2[checkpoint][np.ix_(asset_idx, asset_idx)]
+            remainder = self.centered[checkpoint * self.stride:position, asset_idx]
+        if len(remainder) > 0:
+            total = total + remainder.T @ remainder
+        return total
+
+    def window(self, start_pos, end_pos, asset_idx=None, exclude=None):
+        """
+        計算 [start_pos, end_pos) 區間的日平均報酬與樣本共變異數（ddof=1）
+        asset_idx: 資產欄位的整數位置，None 代表全部資產
+        exclude: 區間內要略過的位置（這組資產有缺值的日子），整列從累積和中扣掉，等同先 dropna 再計算
+        """
+        if asset_idx is not None:
+            asset_idx = np.asarray(asset_idx)
+            # 依序涵蓋全部資產時等同 None，走不複製子矩陣的路徑
+            if len(asset_idx) == self.n_assets and np.array_equal(asset_idx, np.arange(self.n_assets)):
+                asset_idx = None
+        columns = slice(None) if asset_idx is None else asset_idx
+
+        n_obs = end_pos - start_pos - (0 if exclude is None else len(exclude))
+        if n_obs < 2:
+            raise ValueError(f"估計區間資料不足（{n_obs} 天），無法計算共變異數")
+
+        window_sum = self._s1[end_pos, columns] - self._s1[start_pos, columns]
+        window_outer = self._outer_prefix(end_pos, asset_idx) - self._outer_prefix(start_pos, asset_idx)
+        if exclude is not None and len(exclude) > 0:
+            # 缺值本身在累積和裡是 0，只需扣掉同一天其他資產的值
+            rows = self.centered[exclude][:, columns]
+            window_sum = window_sum - rows.sum(axis=0)
+            window_outer = window_outer - rows.T @ rows
+
+        centered_mean = window_sum / n_obs
+        cov = (window_outer - n_obs * np.outer(centered_mean, centered_mean)) / (n_obs - 1)
+        cov = (cov + cov.T) / 2
+
+        return centered_mean + self.shift[columns], cov
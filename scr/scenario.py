@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from scr.performance import compute_performance_metrics, METRIC_NAMES
+from scr import instrumentation
+
+
+class ScenarioGenerator:
+    # compute_performance_metrics 對 (paths × days) 矩陣約需要 10 份同大小的暫存，再加上索引與報酬本身
+    _BYTES_PER_CELL = 8 * 12
+
+    def __init__(self, optimizer, asset_list, block_length=20, method="stationary", seed=None,
+                 memory_budget_mb=256, paths_per_seed=64, lookback_years=5, trading_days=252):
+        """
+        以 block bootstrap 從 optimizer 的歷史報酬重新抽樣出大量合成路徑（Monte Carlo 情境）
+        只從這組資產都有資料的共同區間抽樣（略過區間中的缺值日）
+
+        block_length: 區塊平均長度（交易日），保留報酬的短期自我相關與波動群聚
+        method: "stationary" ➜ Politis-Romano stationary bootstrap，區塊長度為幾何分配，超過資料尾端時接回開頭
+                "block"      ➜ 固定長度的 moving block bootstrap，不跨過資料尾端
+        seed: 亂數種子（int 或 np.random.SeedSequence）；每 paths_per_seed 條路徑各有一個子種子，
+              結果與 memory_budget_mb 無關
+        memory_budget_mb: 一次評估多少條路徑，以 (paths × days) 暫存矩陣的大小估算
+        lookback_years: 以策略名稱指定時，用資料最後 lookback_years 年估計 (μ, Σ) 求權重
+
+        抽的只有日期索引（paths × days 的整數陣列），不建立任何路徑的 DataFrame；
+        策略在情境內維持固定權重（與 Backtester 預設相同，每天調回目標權重），
+        所以每個策略先算一次歷史組合日報酬 R @ w，再依索引取值就是所有路徑的日報酬
+        """
+        if method not in ("stationary", "block"):
+            raise ValueError(f"不支援的 bootstrap 方法：{method}")
+        if block_length < 1:
+            raise ValueError("block_length 必須至少為 1")
+
+        self.optimizer = optimizer
+        self.asset_list = asset_list
+        self.asset_idx = optimizer.get_asset_positions(asset_list)
+        self.block_length = block_length
+        self.method = method
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.memory_budget_mb = memory_budget_mb
+        self.paths_per_seed = paths_per_seed
+        self.lookback_years = lookback_years
+        self.trading_days = trading_days
+
+    def sample_indices(self, rng, n_paths, n_days):
+        """
+        一次抽出 n_paths 條路徑的歷史日期位置（這組資產有效區間內、略過缺值日後的第幾天），
+        回傳 (n_paths × n_days) 的整數陣列
+        """
+        lo, hi = self.optimizer.get_valid_range(asset_idx=self.asset_idx)
+        n_obs = hi - lo - len(self.optimizer.availability.holes(self.asset_idx))
+        if self.method == "block":
+            length = min(self.block_length, n_obs)
+            n_blocks = -(-n_days // length)
+            starts = rng.integers(0, n_obs - length + 1, size=(n_paths, n_blocks))
+            return (starts[:, :, None] + np.arange(length)).reshape(n_paths, -1)[:, :n_days]
+
+        # stationary：每天以 1 / block_length 的機率開新區塊，新區塊從隨機日期開始，否則接續前一天的下一個交易日
+        new_block = rng.random((n_paths, n_days)) < 1 / self.block_length
+        new_block[:, 0] = True
+        starts = np.zeros((n_paths, n_days), dtype=np.int64)
+        starts[new_block] = rng.integers(0, n_obs, size=int(new_block.sum()))
+
+        # 每一天所屬區塊的起始欄位 ➜ 位置 = 區塊起點 + 已經走了幾天（循環接回開頭）
+        days = np.arange(n_days)
+        block_day = np.maximum.accumulate(np.where(new_block, days, 0), axis=1)
+        return (np.take_along_axis(starts, block_day, axis=1) + days - block_day) % n_obs
+
+    def strategy_weights(self, strategies, allow_short=False):
+        """
+        策略 ➜ 權重：可以是 {名稱: 權重} 的 dict，或 PortfolioOptimizer.optimize_strategy 的策略寫法
+        後者用資料最後 lookback_years 年估 (μ, Σ)，所有策略共用同一個 FrontierSolver
+        回傳 {標籤: 權重 ndarray}
+        """
+        if isinstance(strategies, dict):
+            return {label: np.asarray(weights, dtype=float) for label, weights in strategies.items()}
+
+        panel = self.optimizer.panel
+        lo, end_pos = self.optimizer.get_valid_range(asset_idx=self.asset_idx)
+        start_date = panel.index[end_pos - 1] - pd.DateOffset(years=self.lookback_years)
+        start_pos = max(panel.searchsorted(start_date, side='left'), lo)
+        mu, covariance = self.optimizer.estimate_covariance_by_position(start_pos, end_pos, self.asset_idx)
+        solver = self.optimizer.frontier_solver(mu, covariance)
+
+        weights = {}
+        for strategy in strategies:
+            label = strategy if isinstance(strategy, str) else "_".join(str(part) for part in strategy)
+            weights[label] = self.optimizer.optimize_strategy(solver, strategy, allow_short=allow_short)
+        return weights
+
+    def _chunk_paths(self, n_days):
+        """
+        一次評估幾條路徑：記憶體預算內最多幾個 paths_per_seed 的整數倍（至少一組）
+        """
+        budget_paths = int(self.memory_budget_mb * 2 ** 20 // (n_days * self._BYTES_PER_CELL))
+        return max(budget_paths // self.paths_per_seed, 1) * self.paths_per_seed
+
+    def iter_chunks(self, weights, n_paths, n_days, keep_paths=False):
+        """
+        依記憶體預算分批產生路徑並評估所有策略
+        逐批產出 (第一條路徑的編號, {標籤: 績效 dict（每條路徑一個值的 ndarray）}, {標籤: 日報酬矩陣 or None})
+        """
+        labels = list(weights)
+        # 歷史組合日報酬：(days × strategies)，只取這組資產的有效區間（去掉缺值日），每個策略只乘一次
+        lo, hi = self.optimizer.get_valid_range(asset_idx=self.asset_idx)
+        holes = self.optimizer.availability.holes(self.asset_idx)
+        asset_returns = np.delete(self.optimizer.panel.window(lo, hi, self.asset_idx), holes - lo, axis=0)
+        portfolio_returns = asset_returns @ np.column_stack([weights[label] for label in labels])
+
+        chunk = self._chunk_paths(n_days)
+        for first in range(0, n_paths, chunk):
+            size = min(chunk, n_paths - first)
+
+            # 每 paths_per_seed 條路徑一個子種子，分批方式改變時抽出的路徑不變
+            index_blocks = []
+            for seed_block in range(first // self.paths_per_seed, -(-(first + size) // self.paths_per_seed)):
+                # 保留原本的 spawn_key：由 SeedSequence.spawn() 產生的兄弟種子各自得到不同的路徑
+                rng = np.random.default_rng(np.random.SeedSequence(
+                    self.seed_sequence.entropy, spawn_key=self.seed_sequence.spawn_key + (seed_block,)))
+                count = min(self.paths_per_seed, n_paths - seed_block * self.paths_per_seed)
+                index_blocks.append(self.sample_indices(rng, count, n_days))
+            indices = np.concatenate(index_blocks)
+
+            metrics = {}
+            paths = {}
+            for column, label in enumerate(labels):
+                # 所有策略用同一批索引（common random numbers），策略之間的差異不受抽樣雜訊影響
+                path_returns = portfolio_returns[:, column][indices]
+                metrics[label] = compute_performance_metrics(path_returns, axis=1, trading_days=self.trading_days)
+                paths[label] = path_returns if keep_paths else None
+            yield first, metrics, paths
+
+    @instrumentation.timed("ScenarioGenerator.run")
+    def run(self, strategies=("max_sharpe", "min_variance", "risk_parity", "equal"), n_paths=10000,
+            horizon_years=3, allow_short=False):
+        """
+        產生 n_paths 條 horizon_years 年的合成路徑，回傳每條路徑 × 策略的績效表
+        （各績效指標 + Strategy、Years、Path）
+        """
+        weights = self.strategy_weights(strategies, allow_short=allow_short)
+        n_days = int(horizon_years * self.trading_days)
+
+        frames = {label: [] for label in weights}
+        for first, metrics, _ in self.iter_chunks(weights, n_paths, n_days):
+            for label, values in metrics.items():
+                df = pd.DataFrame({name: values[name] for name in METRIC_NAMES})
+                df["Strategy"] = label
+                df["Years"] = horizon_years
+                df["Path"] = np.arange(first + 1, first + len(df) + 1)
+                frames[label].append(df)
+
+        return pd.concat([df for label in weights for df in frames[label]], ignore_index=True)
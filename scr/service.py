@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scr.backtester import Backtester
+from scr.rebalancing import parse_rebalance_freq
+from scr.simulator import Simulator
+from scr.performance import compute_performance_metrics, METRIC_NAMES
+from scr import instrumentation
+
+
+# 各種 job 可接受的欄位與預設值；沒有列出的欄位視為錯誤，避免打錯字的參數被默默忽略
+JOB_DEFAULTS = {
+    'backtest': {'assets': None, 'start_date': None, 'end_date': None, 'mode': "optimal", 'rebalance_freq': "6M",
+                 'lookback_years': 5, 'allow_short': False},
+    'simulate': {'assets': None, 'mode': "optimal", 'years': 3, 'trials': 5, 'sampling': "random", 'step': 1,
+                 'seed': 0, 'rebalance_freq': "6M", 'lookback_years': 5},
+}
+
+# 必須是正整數的欄位（seed 可以是 0）；請求裡的 "3"、3.0 都換成 3，相同參數得到相同的快取 key
+INT_FIELDS = {
+    'backtest': {'lookback_years': 1},
+    'simulate': {'years': 1, 'trials': 1, 'step': 1, 'seed': 0, 'lookback_years': 1},
+}
+
+_FREQ_LETTERS = {'days': "D", 'weeks': "W", 'months': "M", 'years': "Y"}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+def _to_int(name, value, minimum):
+    """
+    整數欄位：接受整數、整數值的浮點數或數字字串，其餘（bool、小數、NaN ...）或小於 minimum 時拋出 ValueError
+    """
+    if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, str, np.integer, np.floating)):
+        raise ValueError(f"{name} 必須是整數：{value!r}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} 必須是整數：{value!r}") from None
+    if not np.isfinite(number) or number != int(number):
+        raise ValueError(f"{name} 必須是整數：{value!r}")
+    if number < minimum:
+        raise ValueError(f"{name} 必須至少為 {minimum}：{value!r}")
+    return int(number)
+
+
+def normalize_job(job):
+    """
+    檢查 job 並補上預設值，回傳標準化後的 dict（相同請求不論欄位順序、是否省略預設值都得到相同結果）
+    job: {"type": "backtest" | "simulate", "assets": [...], ...}，欄位見 JOB_DEFAULTS
+    """
+    if not isinstance(job, dict):
+        raise ValueError("job 必須是 JSON 物件")
+    job_type = job.get('type')
+    if job_type not in JOB_DEFAULTS:
+        raise ValueError(f"不支援的 job 類型：{job_type}")
+
+    unknown = set(job) - set(JOB_DEFAULTS[job_type]) - {'type'}
+    if unknown:
+        raise ValueError(f"不支援的欄位：{sorted(unknown)}")
+
+    normalized = {'type': job_type, **JOB_DEFAULTS[job_type]}
+    normalized.update({name: value for name, value in job.items() if value is not None})
+
+    missing = [name for name, value in normalized.items() if value is None]
+    if missing:
+        raise ValueError(f"缺少欄位：{missing}")
+    if (not isinstance(normalized['assets'], list) or not normalized['assets']
+            or not all(isinstance(asset, str) for asset in normalized['assets'])):
+        raise ValueError("assets 必須是非空的資產代碼 list")
+
+    for name, minimum in INT_FIELDS[job_type].items():
+        normalized[name] = _to_int(name, normalized[name], minimum)
+    # '6m'、'Q' 這類寫法統一成 '6M'、'3M'，等價的週期共用同一個快取 key
+    unit, count = parse_rebalance_freq(normalized['rebalance_freq'])
+    normalized['rebalance_freq'] = f"{count}{_FREQ_LETTERS[unit]}"
+
+    if job_type == 'backtest':
+        if normalized['mode'] not in ("optimal", "equal"):
+            raise ValueError(f"不支援的 mode：{normalized['mode']}")
+        start_date, end_date = pd.Timestamp(normalized['start_date']), pd.Timestamp(normalized['end_date'])
+        if end_date <= start_date:
+            raise ValueError("end_date 必須晚於 start_date")
+        normalized['start_date'] = str(start_date.date())
+        normalized['end_date'] = str(end_date.date())
+        if not isinstance(normalized['allow_short'], bool):
+            raise ValueError(f"allow_short 必須是 true / false：{normalized['allow_short']!r}")
+    else:
+        if normalized['mode'] not in ("optimal", "equal", "historical"):
+            raise ValueError(f"不支援的 mode：{normalized['mode']}")
+        if normalized['sampling'] not in ("random", "rolling"):
+            raise ValueError(f"不支援的 sampling：{normalized['sampling']}")
+        # Simulator 在 rolling 模式不看 trials / seed、random 模式不看 step：沒用到的欄位換回預設值，不影響快取 key
+        ignored = ('trials', 'seed') if normalized['sampling'] == "rolling" else ('step',)
+        normalized.update({name: JOB_DEFAULTS['simulate'][name] for name in ignored})
+    return normalized
+
+
+def job_key(job, data_version):
+    """
+    結果快取的 key：標準化後的 job + 資料版本（資料延長或共變異數估計方法改變時舊結果自動失效）
+    """
+    payload = json.dumps({'job': job, 'data': data_version}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _to_json(value):
+    """
+    NumPy 純量 / NaN ➜ JSON 可表示的值（NaN 轉成 null）
+    """
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def run_job(optimizer, backtesters, job):
+    """
+    執行一個已標準化的 job，回傳可轉成 JSON 的 dict
+    backtesters: {(資產 tuple, rebalance 週期, 估計年數): Backtester}，跨 job 重複使用
+    """
+    key = (tuple(job['assets']), job['rebalance_freq'], job['lookback_years'])
+    if key not in backtesters:
+        backtesters[key] = Backtester(optimizer, job['assets'], rebalance_freq=job['rebalance_freq'],
+                                      lookback_years=job['lookback_years'])
+    backtester = backtesters[key]
+
+    if job['type'] == 'backtest':
+        returns = backtester.run_backtest(job['start_date'], job['end_date'], allow_short=job['allow_short'],
+                                          equal_weight=job['mode'] == "equal")
+        if len(returns) == 0:
+            raise ValueError("這段期間沒有可回測的資料")
+        metrics = compute_performance_metrics(returns.to_numpy())
+        return {
+            'metrics': {name: _to_json(metrics[name]) for name in METRIC_NAMES},
+            'days': len(returns),
+            'first_date': str(returns.index[0].date()),
+            'last_date': str(returns.index[-1].date())
+        }
+
+    simulator = Simulator(optimizer, backtester, job['assets'], n_trials=job['trials'], seed=job['seed'],
+                          sampling=job['sampling'], step=job['step'])
+    start_dates = simulator.get_valid_start_dates(holding_years=job['years'])
+    outcomes = simulator.simulate_dates(start_dates, mode=job['mode'], holding_years=job['years'])
+
+    trials = [{'Start Date': str(start_date.date()), **{name: _to_json(metrics[name]) for name in METRIC_NAMES}}
+              for start_date, metrics, _ in outcomes]
+    mean = {name: _to_json(np.nanmean([metrics[name] for _, metrics, _ in outcomes])) if outcomes else None
+            for name in METRIC_NAMES}
+    return {'trials': trials, 'mean': mean}
+
+
+class JobService:
+    def __init__(self, optimizer, workers=1, queue_size=64, max_results=1024):
+        """
+        常駐的本機批次服務：價格、報酬、rolling moments 與最適化快取只載入一次，之後的請求直接使用
+
+        workers: 同時執行的 job 數；1 ➜ 在背景 thread 直接用這個 optimizer（快取一直保持溫熱），
+                 > 1 ➜ ProcessPoolExecutor，報酬放共享記憶體，worker 新算出的最適化結果併回主 process 的快取
+        queue_size: 等待中的 job 上限，佇列滿時新的請求直接回 503，不會無限堆積
+        max_results: 結果快取（以請求的 hash 為 key，LRU）最多保留幾筆
+
+        相同請求的結果直接從快取回傳；正在執行的相同請求不會重複排進佇列，而是等同一個結果
+        """
+        self.optimizer = optimizer
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_results = max_results
+
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.queue = None
+        self._inflight = {}
+        self._consumers = []
+        self._executor = None
+        self._shared = None
+        self._backtesters = {}
+
+    @property
+    def data_version(self):
+        panel = self.optimizer.panel
+        return {
+            'days': len(panel),
+            'last_date': int(panel.dates[-1]) if len(panel) else None,
+            'columns': list(panel.columns),
+            'covariance': self.optimizer.covariance_estimator.name
+        }
+
+    async def start(self):
+        """
+        建立佇列、執行 job 的 pool 與 consumer task（必須在 event loop 中呼叫）
+        """
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.workers <= 1:
+            # optimizer 與它的快取不是 thread-safe，只用一個 thread 依序執行
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            from scr.parallel import SharedReturns, _init_service_worker
+
+            cache = self.optimizer.cache
+            self._shared = SharedReturns(self.optimizer.panel)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_service_worker,
+                initargs=(self._shared.spec(), cache.max_size if cache is not None else 0,
+                          cache.path if cache is not None else None, instrumentation.is_enabled(),
+                          self.optimizer.covariance_estimator)
+            )
+            # 先讓 worker 啟動：fork 若發生在處理請求途中，子 process 會繼承該連線的 socket，連線關不掉
+            await asyncio.get_running_loop().run_in_executor(self._executor, os.getpid)
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(max(self.workers, 1))]
+
+    async def close(self):
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def _execute(self, job):
+        """
+        回傳 (在 executor 中執行 job 的 callable, 是否為 worker process)
+        """
+        if self.workers <= 1:
+            return partial(run_job, self.optimizer, self._backtesters, job), False
+
+        from scr.parallel import _run_service_job
+
+        return partial(_run_service_job, job), True
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, job, future = await self.queue.get()
+            try:
+                fn, remote = self._execute(job)
+                result = await loop.run_in_executor(self._executor, fn)
+                if remote:
+                    result, new_entries, profile_data = result
+                    instrumentation.merge(profile_data)
+                    if self.optimizer.cache is not None:
+                        for cache_key, value in new_entries:
+                            self.optimizer.cache.put(cache_key, value)
+                self._store(key, result)
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._inflight.pop(key, None)
+                self.queue.task_done()
+
+    def _store(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+
+    async def submit(self, job):
+        """
+        送出一個 job 並等待結果，回傳 (key, 結果, 是否直接取自快取)
+        job 不合法時拋出 ValueError；佇列已滿時拋出 asyncio.QueueFull
+        """
+        job = normalize_job(job)
+        key = job_key(job, self.data_version)
+
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return key, self.results[key], True
+        self.misses += 1
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.queue.put_nowait((key, job, future))
+            self._inflight[key] = future
+
+        # shield：某個請求中斷連線時，不影響共用同一個結果的其他請求
+        return key, await asyncio.shield(future), False
+
+    def status(self):
+        total = self.hits + self.misses
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'queue_size': self.queue_size,
+            'running': len(self._inflight) - (self.queue.qsize() if self.queue is not None else 0),
+            'workers': self.workers,
+            'results': {'size': len(self.results), 'hits': self.hits, 'misses': self.misses,
+                        'hit_rate': self.hits / total if total > 0 else 0.0},
+            'optimizer_cache': self.optimizer.cache.stats() if self.optimizer.cache is not None else None,
+            'data_end': str(self.optimizer.panel.index[-1].date()) if len(self.optimizer.panel) else None
+        }
+
+    async def _route(self, method, path, body):
+        """
+        POST /jobs ➜ 執行（或從快取取出）一個 job；GET /status ➜ 佇列與快取狀態
+        回傳 (HTTP 狀態碼, JSON 物件)
+        """
+        if path == "/status":
+            if method != "GET":
+                return 405, {'error': "只接受 GET"}
+            return 200, self.status()
+        if path != "/jobs":
+            return 404, {'error': f"找不到 {path}"}
+        if method != "POST":
+            return 405, {'error': "只接受 POST"}
+
+        try:
+            key, result, cached = await self.submit(json.loads(body or b"null"))
+        except asyncio.QueueFull:
+            return 503, {'error': "佇列已滿，請稍後再試"}
+        except (ValueError, KeyError) as e:
+            # 包含 JSON 格式錯誤、找不到資產、起始日不足等請求本身的問題（KeyError 的 str 會多一層引號）
+            return 400, {'error': str(e.args[0]) if isinstance(e, KeyError) and e.args else str(e)}
+        except Exception as e:
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        return 200, {'key': key, 'cached': cached, 'result': result}
+
+    async def _handle(self, reader, writer):
+        """
+        最小的 HTTP/1.1 處理：每個連線一個請求，讀 Content-Length 長度的 body，回應後關閉連線
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode('latin-1').partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if len(request_line) < 2:
+                status, payload = 400, {'error': "無法解析的請求"}
+            else:
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self._route(request_line[0].upper(), request_line[1].split("?")[0], body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {'error': "無法解析的請求"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                      f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n").encode() + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        """
+        啟動服務直到被中斷；path 有值時改聽 Unix socket（curl --unix-socket path ...）
+        """
+        await self.start()
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self._handle, path=path)
+                print(f"服務啟動：unix:{path}")
+            else:
+                server = await asyncio.start_server(self._handle, host=host, port=port)
+                print(f"服務啟動：http://{host}:{port}")
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
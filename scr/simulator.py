@@ -1,43 +1,79 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-from scr.performance import PerformanceEvaluator
+from scr.performance import compute_performance_metrics, METRIC_NAMES
+from scr import instrumentation
 
 
 
 class Simulator:
-    def __init__(self, optimizer, backtester, asset_list, n_trials=5):
+    def __init__(self, optimizer, backtester, asset_list, n_trials=5, workers=1, seed=None, chunk_size=32,
+                 sampling="random", step=1):
+        """
+        workers: 平行運算的 process 數量，1 代表在目前的 process 依序執行
+        seed: 亂數種子（int 或 np.random.SeedSequence），相同種子在任何 workers 數量下結果都一樣
+        chunk_size: 平行運算時每個任務負責幾個起始日（固定大小，不隨 workers 改變）
+        sampling: "random" ➜ 隨機抽 n_trials 個起始日
+                  "rolling" ➜ 窮舉所有合法起始日（每 step 個交易日取一個），n_trials 不再使用
+        """
+        if sampling not in ("random", "rolling"):
+            raise ValueError(f"不支援的 sampling：{sampling}")
+
         self.optimizer = optimizer
         self.backtester = backtester
         self.asset_list = asset_list
         self.n_trials = n_trials
-        self.returns = self.optimizer.returns[asset_list]
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.sampling = sampling
+        self.step = step
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
         self.start_dates = None  # 初始化為 None，稍後會由 get_valid_start_dates() 填入
         self.trading_days = 252 # 給全域使用的 252 個交易日
 
-    def get_valid_start_dates(self, holding_years=3, lookback_years=5):
+    def get_valid_start_dates(self, holding_years=3, lookback_years=None):
         """
         找出所有合法的模擬起始日（必須：可回測 holding_years + 可回顧 lookback_years）
+        lookback_years: None 代表沿用 backtester 的估計年數
         """
-        # 1. 所有 ETF 的交集日（returns 內部就是有 dropna 過的報酬率交集）
-        full_dates = self.returns.index
+        if lookback_years is None:
+            lookback_years = self.backtester.lookback_years
 
-        # 2. 抓出：最早日 + 至少要留有過去 5 年資料空間 + 未來持有 N 年空間
+        # 1. 這組 ETF 都有報酬的日期（其他資產的缺值不影響，區間中這組資產的缺值日不當起始日）
+        asset_idx = self.optimizer.get_asset_positions(self.asset_list)
+        lo, hi = self.optimizer.get_valid_range(asset_idx=asset_idx)
+        holes = self.optimizer.availability.holes(asset_idx)
+        full_dates = self.optimizer.panel.index[lo:hi].delete(holes - lo)
+
+        # 2. 抓出：最早日 + 至少要留有過去 lookback_years 年資料空間 + 未來持有 N 年空間
         start_limit = full_dates[0] + pd.DateOffset(years=lookback_years)
         end_limit = full_dates[-1] - pd.DateOffset(years=holding_years)
 
         # 3. 篩選合法起始日
         valid_dates = full_dates[(full_dates >= start_limit) & (full_dates <= end_limit)]
 
+        # rolling 模式：每 step 個交易日一個起始日，全部都跑
+        # 相鄰起始日的 rebalance 區間大量重疊，Backtester 會把相同的估計區間合併求解
+        if self.sampling == "rolling":
+            if len(valid_dates) == 0:
+                raise ValueError("沒有符合條件的起始日，請檢查資料是否完整")
+            self.start_dates = valid_dates[::self.step]
+            return self.start_dates
+
         if len(valid_dates) < self.n_trials:
             raise ValueError("符合條件的起始日太少，請檢查資料是否完整")
 
         # 4. 隨機選擇 N 筆
-        selected_start_dates = np.random.choice(valid_dates, size=self.n_trials, replace=False)
+        selected_start_dates = self.rng.choice(valid_dates.values, size=self.n_trials, replace=False)
         selected_start_dates = pd.to_datetime(sorted(selected_start_dates))
 
         self.start_dates = selected_start_dates
         return selected_start_dates
 
+    @instrumentation.timed("Simulator.run_simulation")
     def run_simulation(self, mode="optimal", holding_years=3):
         """
         mode: "optimal" | "equal" | "historical"
@@ -45,43 +81,92 @@ class Simulator:
         return: list of dicts, 每筆模擬的績效摘要
         """
         if self.start_dates is None:
-            self.get_valid_start_dates(holding_years=holding_years, lookback_years=5)
-
-        results = []
-        for start_date in self.start_dates:
-            start_date = pd.to_datetime(start_date)
-            end_date = start_date + pd.DateOffset(years=holding_years)
-
-            # 模式③：historical ➜ 從過去推績效
-            if mode == "historical":
-                hist_start = start_date - pd.DateOffset(years=holding_years)
-                past_returns = self.returns.loc[hist_start:start_date]
-
-                combined_returns = past_returns.mean(axis=1)  # ✅ 確保是一維
-                expected_days = holding_years * self.trading_days
-                if len(combined_returns) < expected_days * 0.9:
-                    print(f"{start_date.date()} 的過去資料太短（{len(combined_returns)} 天），略過")
-                    continue
+            self.get_valid_start_dates(holding_years=holding_years)
 
-                evaluator = PerformanceEvaluator(combined_returns)
-                results.append(evaluator.summary())
+        if self.workers > 1:
+            outcomes = self._run_parallel([(mode, holding_years)])[0]
+        else:
+            outcomes = self.simulate_dates(self.start_dates, mode=mode, holding_years=holding_years)
 
-            # 模式① or ②：run_backtest
-            else:
-                allow_short = False
-                equal_weight = (mode == "equal")
-                port_returns = self.backtester.run_backtest(
-                    start_date, end_date, allow_short=allow_short, equal_weight=equal_weight
-                )
+        return [metrics for _, metrics, _ in outcomes]
 
-                if len(port_returns) == 0:
-                    print(f"{start_date.date()} 無資料回測失敗，略過")
+    def simulate_dates(self, start_dates, mode="optimal", holding_years=3, keep_paths=False):
+        """
+        對指定的起始日跑一個模式，回傳 list of (起始日, 績效 dict, 日報酬路徑 or None)
+        失敗或資料不足的起始日會略過；keep_paths=True 時附上該 trial 的日報酬 ndarray
+        """
+        outcomes = []
+
+        # 模式① or ②：一次把所有起始日丟進批次回測
+        if mode != "historical":
+            allow_short = False
+            equal_weight = (mode == "equal")
+            return_matrix = self.backtester.run_backtest_batch(
+                start_dates, holding_years=holding_years, allow_short=allow_short, equal_weight=equal_weight
+            )
+
+            # 所有 trial 的績效指標一次向量化算完
+            metrics = compute_performance_metrics(return_matrix, axis=1)
+            valid = ~np.isnan(return_matrix)
+            n_days = np.count_nonzero(valid, axis=1)
+
+            for i, start_date in enumerate(start_dates):
+                if n_days[i] == 0:
+                    print(f"{pd.to_datetime(start_date).date()} 無資料回測失敗，略過")
                     continue
 
-                evaluator = PerformanceEvaluator(port_returns)
-                results.append(evaluator.summary())
+                path = return_matrix[i][valid[i]] if keep_paths else None
+                outcomes.append((pd.Timestamp(start_date), {name: metrics[name][i] for name in METRIC_NAMES}, path))
+
+            return outcomes
+
+        # 模式③：historical ➜ 從過去推績效（等權重、每日再平衡的過去 holding_years 年）
+        start_dates = pd.DatetimeIndex(start_dates)
+        hist_starts = start_dates - pd.DateOffset(years=holding_years)
+        nav_index = self.optimizer.nav_index
+        asset_idx = self.optimizer.get_asset_positions(self.asset_list)
+        start_pos, end_pos = nav_index.positions(hist_starts, start_dates)
+        # 只看這組資產有資料的區間（之前的日期如同資料的開頭）
+        lo, hi = self.optimizer.get_valid_range(asset_idx=asset_idx)
+        start_pos, end_pos = np.clip(start_pos, lo, hi), np.clip(end_pos, lo, hi)
+        # 區間中這組資產的缺值日：等權重組合報酬為 NaN，前綴和當作 0，天數與波動也都略過
+        holes = self.optimizer.availability.holes(asset_idx)
+        n_days = end_pos - start_pos - (np.searchsorted(holes, end_pos) - np.searchsorted(holes, start_pos))
+
+        weights = self.optimizer.get_equal_weight_portfolio(self.asset_list)
+        prefix = nav_index.constant_mix_prefix(weights, asset_idx)
 
-        return results
+        expected_days = holding_years * self.trading_days
+        for i, start_date in enumerate(start_dates):
+            if n_days[i] < expected_days * 0.9:
+                print(f"{start_date.date()} 的過去資料太短（{n_days[i]} 天），略過")
+                continue
+
+            # 報酬：查累積對數報酬前綴和，O(1)
+            cumulative_return = np.exp(prefix[end_pos[i]] - prefix[start_pos[i]]) - 1
+            annualized_return = nav_index.annualize(cumulative_return, n_days[i])
+
+            # 波動：等權重組合的變異數 = w'Σw，直接由 rolling moments 取得
+            window_holes = self.optimizer.availability.holes(asset_idx, start_pos[i], end_pos[i])
+            _, cov = self.optimizer.moments.window(start_pos[i], end_pos[i], asset_idx, exclude=window_holes)
+            annualized_volatility = np.sqrt(weights @ cov @ weights * self.trading_days)
+
+            # 最大回撤：由前綴和還原這段期間的淨值路徑
+            log_path = prefix[start_pos[i]:end_pos[i] + 1]
+            cumulative_nav = np.exp(log_path[1:] - log_path[0])
+            historical_max = np.maximum.accumulate(cumulative_nav)
+            max_drawdown = ((cumulative_nav - historical_max) / historical_max).min()
+
+            metrics = {
+                'Annualized Return': float(annualized_return),
+                'Annualized Volatility': float(annualized_volatility),
+                'Sharpe Ratio': float(annualized_return / annualized_volatility) if annualized_volatility != 0 else np.nan,
+                'Max Drawdown': float(max_drawdown)
+            }
+            path = np.delete(np.expm1(np.diff(log_path)), window_holes - start_pos[i]) if keep_paths else None
+            outcomes.append((start_date, metrics, path))
+
+        return outcomes
 
     def run_and_summarize(self, mode="optimal", holding_years=3):
         raw_results = self.run_simulation(mode=mode, holding_years=holding_years)
@@ -91,4 +176,167 @@ class Simulator:
         df["Trial"] = range(1, len(df) + 1)  # ✅ 新增 Trial 編號
         return df
 
+    def run_grid(self, modes=("optimal", "equal", "historical"), horizons=(3, 5)):
+        """
+        一次跑完 modes × horizons 的所有組合，合併成一張表
+        workers > 1 時所有組合的任務共用同一個 process pool
+        """
+        if self.start_dates is None:
+            # 起始日要同時滿足最長的持有年限
+            self.get_valid_start_dates(holding_years=max(horizons))
+
+        points = [(mode, holding_years) for holding_years in horizons for mode in modes]
+
+        if self.workers > 1:
+            all_results = [[metrics for _, metrics, _ in outcomes] for outcomes in self._run_parallel(points)]
+        else:
+            all_results = [self.run_simulation(mode=mode, holding_years=holding_years)
+                           for mode, holding_years in points]
+
+        frames = []
+        for (mode, holding_years), raw_results in zip(points, all_results):
+            df = pd.DataFrame(raw_results)
+            df["Mode"] = mode
+            df["Years"] = holding_years
+            df["Trial"] = range(1, len(df) + 1)
+            frames.append(df)
+
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_grid(self, modes=("optimal", "equal", "historical"), horizons=(3, 5), batch_size=256, keep_paths=False):
+        """
+        run_grid 的串流版本：逐筆產出 trial 結果，不把整張表留在記憶體
+        每筆為 dict（Mode、Years、Trial、Start Date 與各績效指標）；keep_paths=True 時另含 "Path"（日報酬 ndarray）
+        batch_size: 每次批次回測幾個起始日，記憶體用量約為 batch_size × 持有天數
+        workers > 1 時以 chunk_size 為單位平行計算，同時在途的任務數量有上限
+        """
+        if self.start_dates is None:
+            self.get_valid_start_dates(holding_years=max(horizons))
+
+        points = [(mode, holding_years) for holding_years in horizons for mode in modes]
+
+        if self.workers > 1:
+            batches = self._iter_parallel(points, keep_paths=keep_paths)
+        else:
+            batches = (
+                (point_id, self.simulate_dates(self.start_dates[i:i + batch_size], mode=mode,
+                                               holding_years=holding_years, keep_paths=keep_paths))
+                for point_id, (mode, holding_years) in enumerate(points)
+                for i in range(0, len(self.start_dates), batch_size)
+            )
+
+        trial_counts = [0] * len(points)
+        for point_id, outcomes in batches:
+            mode, holding_years = points[point_id]
+            for start_date, metrics, path in outcomes:
+                trial_counts[point_id] += 1
+                record = {'Mode': mode, 'Years': holding_years, 'Trial': trial_counts[point_id],
+                          'Start Date': start_date}
+                record.update(metrics)
+                if keep_paths:
+                    record['Path'] = path
+                yield record
+
+    def stream_grid(self, modes=("optimal", "equal", "historical"), horizons=(3, 5), writer=None, summary=None,
+                    path_writer=None, batch_size=256):
+        """
+        跑完 modes × horizons，結果邊算邊寫出，記憶體用量與 trial 數無關
+        writer: scr.streaming.TrialWriter，逐批附加寫入每筆 trial 的績效
+        summary: scr.streaming.GroupSummary，以線上演算法累計平均、標準差與分位數
+        path_writer: scr.streaming.PathWriter，有給才保留每筆 trial 的日報酬路徑
+        return: 總 trial 數
+        """
+        buffer = []
+        n_records = 0
+
+        def flush():
+            if writer is not None:
+                writer.write(buffer)
+            if summary is not None:
+                summary.update(buffer)
+            buffer.clear()
+
+        records = self.iter_grid(modes=modes, horizons=horizons, batch_size=batch_size,
+                                 keep_paths=path_writer is not None)
+        for record in records:
+            if path_writer is not None:
+                label = f"{record['Mode']}_{record['Years']}Y_{record['Trial']}"
+                path_writer.write(label, record.pop('Path'))
+
+            buffer.append(record)
+            n_records += 1
+            if len(buffer) >= batch_size:
+                flush()
+
+        if buffer:
+            flush()
+        return n_records
+
+    def _make_tasks(self, points, keep_paths=False):
+        """
+        把每個 (mode, holding_years) 的起始日切成固定大小的區塊
+        起始日已在主 process 抽好，任務本身是確定性的，結果與 workers 數量無關
+        回傳 list of (point 編號, 任務)
+        """
+        chunks = [self.start_dates[i:i + self.chunk_size] for i in range(0, len(self.start_dates), self.chunk_size)]
 
+        tasks = []
+        for point_id, (mode, holding_years) in enumerate(points):
+            for chunk in chunks:
+                tasks.append((point_id, (mode, holding_years, chunk.values, keep_paths)))
+        return tasks
+
+    def _iter_parallel(self, points, keep_paths=False, max_pending=None):
+        """
+        把任務丟給 ProcessPoolExecutor，依原本順序逐一產出 (point 編號, 該區塊的 outcomes)
+        報酬率矩陣透過共享記憶體傳給 worker；在途的任務最多 max_pending 個（預設 workers × 2），
+        消費端處理較慢時不會把所有結果堆在記憶體裡
+        """
+        from scr.parallel import SharedReturns, _init_worker, _run_task
+
+        tasks = self._make_tasks(points, keep_paths=keep_paths)
+        max_pending = max_pending or self.workers * 2
+
+        cache = self.optimizer.cache
+        cache_size = cache.max_size if cache is not None else 0
+        cache_path = cache.path if cache is not None else None
+
+        with SharedReturns(self.optimizer.panel) as shared:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(shared.spec(), self.asset_list, self.backtester.options(), cache_size, cache_path,
+                          instrumentation.is_enabled(), self.optimizer.covariance_estimator)
+            ) as executor:
+                pending = deque()
+                task_iter = iter(tasks)
+
+                for point_id, task in task_iter:
+                    pending.append((point_id, executor.submit(_run_task, task)))
+                    if len(pending) >= max_pending:
+                        break
+
+                while pending:
+                    point_id, future = pending.popleft()
+                    outcomes, new_entries, profile_data = future.result()
+
+                    next_task = next(task_iter, None)
+                    if next_task is not None:
+                        pending.append((next_task[0], executor.submit(_run_task, next_task[1])))
+
+                    # worker 新算出的最適化結果併回主 process 的快取
+                    instrumentation.merge(profile_data)
+                    if cache is not None:
+                        for key, value in new_entries:
+                            cache.put(key, value)
+
+                    yield point_id, outcomes
+
+    def _run_parallel(self, points):
+        """
+        平行跑完所有 points，回傳與 points 對應的 list of outcomes（同 simulate_dates 的格式）
+        """
+        all_outcomes = [[] for _ in points]
+        for point_id, outcomes in self._iter_parallel(points):
+            all_outcomes[point_id].extend(outcomes)
+        return all_outcomes
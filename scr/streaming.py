@@ -0,0 +1,270 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from scr.performance import METRIC_NAMES
+
+
+class OnlineStats:
+    def __init__(self, max_centroids=512):
+        """
+        固定記憶體的線上統計量：筆數、平均、變異數（Chan/Welford 合併公式）、最小、最大
+        分位數用 QuantileSketch 近似
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(max_centroids=max_centroids)
+
+    def update(self, values):
+        """
+        一次併入一批數值（NaN 會被忽略）
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+
+        batch_count = len(values)
+        batch_mean = values.mean()
+        batch_m2 = ((values - batch_mean) ** 2).sum()
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * batch_count / total
+        self.count = total
+
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.sketch.update(values)
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        return self.sketch.quantile(q, lower=self.min, upper=self.max)
+
+
+class QuantileSketch:
+    def __init__(self, max_centroids=512):
+        """
+        可合併的分位數 sketch：最多保留 max_centroids 個 (平均, 權重) 的 centroid
+        每批資料併入後依累積權重等分壓縮，記憶體固定，排名誤差約 1 / max_centroids
+        """
+        self.max_centroids = max_centroids
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def update(self, values):
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        if len(means) > self.max_centroids:
+            # 以每個點的中位排名分桶，同一桶合併成一個 centroid
+            cumulative = np.cumsum(weights)
+            mid_rank = (cumulative - weights / 2) / cumulative[-1]
+            bucket = np.minimum((mid_rank * self.max_centroids).astype(np.int64), self.max_centroids - 1)
+
+            bucket_weights = np.bincount(bucket, weights=weights, minlength=self.max_centroids)
+            bucket_sums = np.bincount(bucket, weights=weights * means, minlength=self.max_centroids)
+            keep = bucket_weights > 0
+            means = bucket_sums[keep] / bucket_weights[keep]
+            weights = bucket_weights[keep]
+
+        self.means, self.weights = means, weights
+
+    def quantile(self, q, lower=None, upper=None):
+        if len(self.means) == 0:
+            return np.nan
+
+        cumulative = np.cumsum(self.weights)
+        total = cumulative[-1]
+        ranks = cumulative - self.weights / 2
+        values = self.means
+
+        # 兩端補上真正的最小值與最大值，讓極端分位數不會被 centroid 平均掉
+        if lower is not None:
+            ranks, values = np.concatenate([[0.0], ranks]), np.concatenate([[lower], values])
+        if upper is not None:
+            ranks, values = np.concatenate([ranks, [total]]), np.concatenate([values, [upper]])
+
+        return float(np.interp(q * total, ranks, values))
+
+
+class GroupSummary:
+    QUANTILES = (0.25, 0.5, 0.75)
+
+    def __init__(self, metrics=METRIC_NAMES, max_centroids=512):
+        """
+        依 (Mode, Years) 分組、以固定記憶體累計每個績效指標的統計量
+        百萬筆 trial 也只保留每組每個指標一個 OnlineStats
+        """
+        self.metrics = list(metrics)
+        self.max_centroids = max_centroids
+        self.groups = {}
+
+    def update(self, records):
+        """
+        records: list of dict（需含 Mode、Years 與各績效指標）或 DataFrame
+        """
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        if df.empty:
+            return
+
+        for (mode, years), group in df.groupby(["Mode", "Years"], sort=False):
+            stats = self.groups.setdefault(
+                (mode, years), {metric: OnlineStats(self.max_centroids) for metric in self.metrics}
+            )
+            for metric in self.metrics:
+                stats[metric].update(group[metric].to_numpy(dtype=np.float64))
+
+    def to_frame(self):
+        """
+        長表：每列為一個 (Mode, Years, Metric)，欄位為 count / mean / std / min / 分位數 / max
+        """
+        rows = []
+        for (mode, years), stats in self.groups.items():
+            for metric in self.metrics:
+                s = stats[metric]
+                row = {'Mode': mode, 'Years': years, 'Metric': metric, 'count': s.count,
+                       'mean': s.mean if s.count else np.nan, 'std': s.std(),
+                       'min': s.min if s.count else np.nan, 'max': s.max if s.count else np.nan}
+                for q in self.QUANTILES:
+                    row[f"q{int(q * 100)}"] = s.quantile(q)
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+    def means_table(self, decimals=4):
+        """
+        與 ResultReporter 的 summary_table.csv 相同格式：每組一列，欄位為各指標平均
+        """
+        rows = []
+        for (mode, years), stats in sorted(self.groups.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            row = {'Mode': mode, 'Years': years}
+            row.update({metric: stats[metric].mean if stats[metric].count else np.nan for metric in self.metrics})
+            rows.append(row)
+        return pd.DataFrame(rows).round(decimals)
+
+
+class TrialWriter:
+    def __init__(self, path, file_format=None):
+        """
+        逐批把 trial 結果附加寫入檔案（append-only），記憶體只保留當批資料
+        file_format: "csv" 或 "parquet"（需安裝 pyarrow，每批寫成一個 row group）；None 依副檔名判斷
+        """
+        self.path = path
+        self.file_format = file_format or ("parquet" if path.endswith(".parquet") else "csv")
+        self.rows_written = 0
+        self._parquet_writer = None
+
+        if self.file_format not in ("csv", "parquet"):
+            raise ValueError(f"不支援的格式：{self.file_format}")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, records):
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        if df.empty:
+            return
+
+        if self.file_format == "csv":
+            df.to_csv(self.path, mode="a", header=self.rows_written == 0, index=False)
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("寫入 parquet 需要安裝 pyarrow，或改用 csv 格式") from e
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PathWriter:
+    def __init__(self, path, dtype=np.float32):
+        """
+        逐筆附加寫入每個 trial 的日報酬路徑（長度不一）
+        {path}.bin 為所有路徑首尾相接的原始數值，{path}.idx 每行一條路徑的 [長度, 標籤]（與 .bin 同步附加），
+        {path}.json 記錄數值型別；長度與標籤不留在記憶體，trial 再多記憶體用量也固定
+        讀取時用 load_paths() 以 memory-map 開啟，不需整批載入
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.n_paths = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({'dtype': self.dtype.str}, f)
+        self._file = open(path + ".bin", "wb")
+        self._index_file = open(path + ".idx", "w", encoding="utf-8")
+
+    def write(self, label, returns):
+        values = np.asarray(returns, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self._index_file.write(json.dumps([len(values), label], ensure_ascii=False) + "\n")
+        self.n_paths += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_paths(path):
+    """
+    讀回 PathWriter 寫出的路徑：回傳 (labels, list of memory-mapped ndarray)
+    """
+    with open(path + ".json", "r", encoding="utf-8") as f:
+        dtype = np.dtype(json.load(f)['dtype'])
+
+    lengths, labels = [], []
+    with open(path + ".idx", "r", encoding="utf-8") as f:
+        for line in f:
+            length, label = json.loads(line)
+            lengths.append(length)
+            labels.append(label)
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    if offsets[-1] == 0:
+        return labels, [np.empty(0, dtype=dtype) for _ in labels]
+
+    values = np.memmap(path + ".bin", dtype=dtype, mode="r")
+    return labels, [values[offsets[i]:offsets[i + 1]] for i in range(len(labels))]
@@ -0,0 +1,229 @@
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scr.backtester import Backtester
+from scr.portfolio_optimizer import OptimizationError
+from scr.performance import compute_performance_metrics, METRIC_NAMES
+from scr import instrumentation
+
+
+class UniverseEstimates:
+    def __init__(self, universe_idx, boundaries, estimates):
+        """
+        整個資產池在每個 rebalance 區間的 (μ, Σ)，只估一次，各候選子集合直接取子向量 / 子矩陣
+        universe_idx: 資產池在 panel 上的欄位位置
+        boundaries: 樣本外各段的 panel 位置，第 k 段為 [boundaries[k], boundaries[k + 1])
+        estimates: 每段一個 (μ, covariance)，由 rebalance 前 lookback_years 年估計（可 pickle，直接傳給 worker）
+        """
+        self.universe_idx = np.asarray(universe_idx, dtype=np.intp)
+        self.boundaries = np.asarray(boundaries, dtype=np.int64)
+        self.estimates = list(estimates)
+
+    def __len__(self):
+        return len(self.estimates)
+
+    @property
+    def n_days(self):
+        return int(self.boundaries[-1] - self.boundaries[0])
+
+
+def evaluate_subsets(optimizer, values, estimates, subsets, allow_short=False, trading_days=252):
+    """
+    樣本外績效：每個子集合在每段開頭以資產池估計的子矩陣求最大 Sharpe 權重，套用到下一段的報酬
+    optimizer: 只用來求解（optimize_portfolio），不需要它的報酬或 rolling moments
+    values: panel 的報酬率矩陣（worker 端為共享記憶體的 view）
+    subsets: 資產池內的位置 tuple 的 list
+    回傳 {指標: 每個子集合一個值的 ndarray}；任一段最適化失敗的子集合各指標為 NaN
+    """
+    boundaries = estimates.boundaries
+    matrix = np.full((len(subsets), estimates.n_days), np.nan)
+
+    for row, subset in enumerate(subsets):
+        local_idx = np.asarray(subset, dtype=np.intp)
+        columns = estimates.universe_idx[local_idx]
+        weights = None
+        try:
+            for k, (mu, covariance) in enumerate(estimates.estimates):
+                # 上一段的權重拿來 warm start，與 Backtester 相同
+                weights = optimizer.optimize_portfolio(mu[local_idx], covariance.subset(local_idx),
+                                                       allow_short=allow_short, initial_weights=weights)
+                block_start, block_end = boundaries[k], boundaries[k + 1]
+                offset = block_start - boundaries[0]
+                matrix[row, offset:offset + block_end - block_start] = values[block_start:block_end, columns] @ weights
+        except (OptimizationError, np.linalg.LinAlgError):
+            matrix[row] = np.nan
+
+    instrumentation.count("SubsetSearch.evaluated", len(subsets))
+    return compute_performance_metrics(matrix, axis=1, trading_days=trading_days)
+
+
+class SubsetSearch:
+    def __init__(self, optimizer, universe=None, k=3, method="beam", beam_width=8, start_date=None, end_date=None,
+                 rebalance_freq="6M", lookback_years=5, allow_short=False, objective="Sharpe Ratio",
+                 workers=1, chunk_size=64, max_candidates=200000, trading_days=252):
+        """
+        從資產池 universe 中挑 k 檔，使樣本外（walk-forward）的 objective 最高
+
+        universe: 候選資產 list，None 為 panel 上所有資產；只在整個資產池都有資料的共同區間內評估，
+                  所有子集合用同一段樣本外期間比較
+        method: "greedy"     ➜ 每次加入一檔讓 objective 最高的資產（beam_width = 1 的 beam search）
+                "beam"       ➜ 每一層保留 beam_width 個最好的子集合，各加入一檔後再比較
+                "exhaustive" ➜ 窮舉所有 C(N, k) 組（超過 max_candidates 時拋出 ValueError）
+        start_date / end_date: 樣本外期間，預設為有效區間開頭 + lookback_years 年到最後一天
+        rebalance_freq / lookback_years / allow_short: 同 Backtester（每段開頭重新求最大 Sharpe 權重）
+        objective: 排序用的績效指標（METRIC_NAMES 之一，越大越好）
+        workers / chunk_size: 候選子集合分批交給 ProcessPoolExecutor 評估，每批 chunk_size 組
+
+        每個 rebalance 區間只對整個資產池估一次 (μ, Σ)，候選子集合直接取 μ[idx] 與 Σ 的主子矩陣，
+        不再對每組重新估計；共變異數 estimator 為 shrinkage / PCA 時，子矩陣來自整個資產池的估計
+        （收縮目標與因子由全部資產決定），與只用這幾檔資產單獨估計的結果不同
+        """
+        if method not in ("greedy", "beam", "exhaustive"):
+            raise ValueError(f"不支援的搜尋方法：{method}")
+        if objective not in METRIC_NAMES:
+            raise ValueError(f"不支援的 objective：{objective}")
+
+        self.optimizer = optimizer
+        self.universe = list(universe) if universe is not None else list(optimizer.panel.columns)
+        self.universe_idx = optimizer.get_asset_positions(self.universe)
+        if not 1 <= k <= len(self.universe):
+            raise ValueError(f"k 必須介於 1 與資產池大小 {len(self.universe)} 之間")
+
+        self.k = k
+        self.method = method
+        self.beam_width = 1 if method == "greedy" else beam_width
+        self.start_date = start_date
+        self.end_date = end_date
+        self.rebalance_freq = rebalance_freq
+        self.lookback_years = lookback_years
+        self.allow_short = allow_short
+        self.objective = objective
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_candidates = max_candidates
+        self.trading_days = trading_days
+
+        self.estimates = None
+        self.scores = {}
+        self.summary = None
+
+    @instrumentation.timed("SubsetSearch.estimate")
+    def estimate_universe(self):
+        """
+        依 Backtester 的規則切出樣本外各段，對整個資產池各估一次 (μ, Σ)
+        """
+        panel = self.optimizer.panel
+        backtester = Backtester(self.optimizer, self.universe, rebalance_freq=self.rebalance_freq,
+                                lookback_years=self.lookback_years)
+        lo, hi = backtester.valid_range()
+        start_date = pd.to_datetime(self.start_date) if self.start_date is not None else \
+            panel.index[lo] + pd.DateOffset(years=self.lookback_years)
+        end_date = pd.to_datetime(self.end_date) if self.end_date is not None else panel.index[hi - 1]
+
+        boundaries, estimation_start, _ = backtester._plan_rebalances(pd.DatetimeIndex([start_date]),
+                                                                      pd.DatetimeIndex([end_date]))
+        boundaries, estimation_start = boundaries[0], estimation_start[0]
+        # 有效區間之外或超過結束日的 rebalance 會變成空區段，只留下非空的區段
+        keep = np.flatnonzero(boundaries[1:] > boundaries[:-1])
+        if len(keep) == 0:
+            raise ValueError("樣本外期間沒有任何交易日")
+
+        estimates = []
+        for k in keep:
+            if boundaries[k] - estimation_start[k] < 2:
+                raise ValueError(f"{panel.index[boundaries[k]].date()} 的估計區間資料不足")
+            estimates.append(self.optimizer.estimate_covariance_by_position(estimation_start[k], boundaries[k],
+                                                                            self.universe_idx))
+
+        self.estimates = UniverseEstimates(self.universe_idx, np.append(boundaries[keep], boundaries[keep[-1] + 1]),
+                                           estimates)
+        return self.estimates
+
+    def _evaluate(self, subsets, executor):
+        """
+        評估尚未算過的子集合，分數存進 self.scores（最適化失敗為 -inf）
+        """
+        pending = [subset for subset in dict.fromkeys(subsets) if subset not in self.scores]
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+
+        if executor is None:
+            values = self.optimizer.panel.values
+            results = (evaluate_subsets(self.optimizer, values, self.estimates, chunk, allow_short=self.allow_short,
+                                        trading_days=self.trading_days) for chunk in chunks)
+        else:
+            from scr.parallel import _run_subset_task
+
+            results = executor.map(_run_subset_task, chunks)
+
+        for chunk, metrics in zip(chunks, results):
+            if executor is not None:
+                metrics, profile_data = metrics
+                instrumentation.merge(profile_data)
+            for i, subset in enumerate(chunk):
+                row = {name: float(metrics[name][i]) for name in METRIC_NAMES}
+                score = row[self.objective]
+                self.scores[subset] = (score if not np.isnan(score) else -np.inf, row)
+
+    def _top(self, subsets, n):
+        return sorted(dict.fromkeys(subsets), key=lambda subset: -self.scores[subset][0])[:n]
+
+    def _search(self, executor):
+        """
+        回傳大小為 k、依 objective 排序的候選子集合
+        """
+        n_assets = len(self.universe)
+        if self.method == "exhaustive":
+            n_candidates = math.comb(n_assets, self.k)
+            if n_candidates > self.max_candidates:
+                raise ValueError(f"C({n_assets}, {self.k}) = {n_candidates} 組超過 max_candidates，請改用 beam")
+            candidates = list(itertools.combinations(range(n_assets), self.k))
+            self._evaluate(candidates, executor)
+            return self._top(candidates, n_candidates)
+
+        # beam search：從單一資產開始，每層把保留下來的子集合各加一檔，同一組合（不論加入順序）只評估一次
+        beam = [()]
+        for _ in range(self.k):
+            candidates = [tuple(sorted(subset + (asset,)))
+                          for subset in beam for asset in range(n_assets) if asset not in subset]
+            self._evaluate(candidates, executor)
+            beam = self._top(candidates, self.beam_width)
+        return beam
+
+    @instrumentation.timed("SubsetSearch.run")
+    def run(self):
+        """
+        執行搜尋，回傳大小為 k 的子集合績效表（Rank、Assets、各績效指標），依 objective 由高到低
+        beam / greedy 只列出最後一層保留的 beam_width 組；self.scores 保留所有評估過的子集合
+        """
+        if self.estimates is None:
+            self.estimate_universe()
+
+        if self.workers <= 1:
+            ranked = self._search(None)
+        else:
+            from scr.parallel import SharedReturns, _init_subset_worker
+
+            with SharedReturns(self.optimizer.panel) as shared:
+                with ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_subset_worker,
+                    initargs=(shared.spec(), self.estimates, self.allow_short, self.trading_days,
+                              instrumentation.is_enabled())
+                ) as executor:
+                    ranked = self._search(executor)
+
+        self.summary = {
+            'universe': len(self.universe),
+            'evaluated': len(self.scores),
+            'combinations': math.comb(len(self.universe), self.k),
+            'periods': len(self.estimates)
+        }
+
+        rows = []
+        for rank, subset in enumerate(ranked, start=1):
+            rows.append({'Rank': rank, 'Assets': "+".join(self.universe[i] for i in subset),
+                         **self.scores[subset][1]})
+        return pd.DataFrame(rows, columns=['Rank', 'Assets'] + METRIC_NAMES)
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scr.backtester import Backtester
+from scr.simulator import Simulator
+from scr.performance import METRIC_NAMES
+from scr import instrumentation
+
+
+def run_sweep_unit(optimizer, backtesters, task):
+    """
+    跑一個工作單元：同一組資產 × 同一個估計年數、同一段起始日，底下所有 (mode, 年限, rebalance 週期)
+    這些 job 共用同一個 optimizer（報酬、rolling moments、最適化快取），估計區間相同的求解只做一次
+    backtesters: {(資產 tuple, 估計年數, rebalance 週期): Backtester}，跨任務重複使用
+    回傳 list of (job 編號, simulate_dates 的 outcomes)
+    """
+    asset_list, lookback_years, jobs, start_dates, backtester_options = task
+    start_dates = pd.DatetimeIndex(start_dates)
+
+    results = []
+    for job_id, mode, holding_years, rebalance_freq in jobs:
+        key = (tuple(asset_list), lookback_years, rebalance_freq)
+        if key not in backtesters:
+            backtesters[key] = Backtester(optimizer, list(asset_list), rebalance_freq=rebalance_freq,
+                                          lookback_years=lookback_years, **backtester_options)
+        simulator = Simulator(optimizer, backtesters[key], list(asset_list), n_trials=len(start_dates))
+        results.append((job_id, simulator.simulate_dates(start_dates, mode=mode, holding_years=holding_years)))
+    return results
+
+
+class SweepRunner:
+    def __init__(self, optimizer, asset_sets, modes=("optimal", "equal", "historical"), horizons=(3, 5),
+                 lookbacks=(5,), rebalance_freqs=("6M",), workers=1, chunk_size=32, sampling="rolling", step=1,
+                 n_trials=5, seed=None, checkpoint_dir=None, **backtester_options):
+        """
+        參數掃描：asset_sets × lookbacks × rebalance_freqs × horizons × modes 的每個組合（grid point）都跑一次模擬
+
+        asset_sets: {名稱: 資產 list}，或 list of 資產 list（名稱為代碼以 + 連接）
+        lookbacks: 估計參數往回取的年數；rebalance_freqs: rebalance 週期（'6M'、'Q' ...）
+        workers / chunk_size / sampling / step / n_trials / seed: 同 Simulator
+        checkpoint_dir: 每完成一個 grid point 就存一份結果，中斷後重跑會略過已完成的 point
+        backtester_options: 其餘 Backtester 參數（drift、cost_rate ...），所有 point 共用
+
+        同一組資產的 point 共用同一組起始日（在這組資產的有效區間內，以最長的持有年限與估計年數決定），
+        所有 point 共用同一個 optimizer 的報酬矩陣、rolling moments 與最適化快取；
+        排程時把同一組資產 × 估計年數的 point 放進同一個任務，不同年限與 rebalance 週期在相同日期的求解直接命中快取。
+        結果與估計年數、rebalance 週期無關的 point（historical，以及不漂移的 equal）只算一次
+        """
+        if isinstance(asset_sets, dict):
+            self.asset_sets = {name: list(assets) for name, assets in asset_sets.items()}
+        else:
+            self.asset_sets = {"+".join(assets): list(assets) for assets in asset_sets}
+
+        self.optimizer = optimizer
+        self.modes = tuple(modes)
+        self.horizons = tuple(horizons)
+        self.lookbacks = tuple(lookbacks)
+        self.rebalance_freqs = tuple(rebalance_freqs)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.sampling = sampling
+        self.step = step
+        self.n_trials = n_trials
+        self.seed = seed
+        self.checkpoint_dir = checkpoint_dir
+        self.backtester_options = backtester_options
+
+        # 先建一次，讓不合法的 rebalance 週期或成本設定在開跑前就報錯
+        for rebalance_freq in self.rebalance_freqs:
+            Backtester(optimizer, next(iter(self.asset_sets.values())), rebalance_freq=rebalance_freq,
+                       **backtester_options)
+
+        self.start_dates = {}
+        self.summary = None
+
+    def points(self):
+        """
+        展開所有 grid point：list of dict（Assets、Lookback、Rebalance、Mode、Years）
+        同一組資產 × 估計年數的 point 排在一起
+        """
+        return [
+            {'Assets': name, 'Lookback': lookback_years, 'Rebalance': rebalance_freq, 'Mode': mode,
+             'Years': holding_years}
+            for name in self.asset_sets
+            for lookback_years in self.lookbacks
+            for rebalance_freq in self.rebalance_freqs
+            for holding_years in self.horizons
+            for mode in self.modes
+        ]
+
+    def get_start_dates(self, asset_list):
+        """
+        這組資產所有 point 共用的起始日：同時滿足最長的持有年限與最長的估計年數
+        """
+        key = tuple(asset_list)
+        if key not in self.start_dates:
+            backtester = Backtester(self.optimizer, list(asset_list), lookback_years=max(self.lookbacks))
+            simulator = Simulator(self.optimizer, backtester, list(asset_list), n_trials=self.n_trials,
+                                  seed=self.seed, sampling=self.sampling, step=self.step)
+            self.start_dates[key] = simulator.get_valid_start_dates(holding_years=max(self.horizons))
+        return self.start_dates[key]
+
+    def _signature(self, point):
+        """
+        決定 point 結果的參數：結果相同的 point 有相同的 signature，只需要算一次
+        historical 只看過去的等權重績效；等權重不漂移時每天的報酬都是 returns @ w，
+        與 rebalance 日、估計區間無關（起始日已保留最長估計年數，不會有估計失敗的差異）
+        """
+        assets = tuple(self.asset_sets[point['Assets']])
+        if point['Mode'] == "historical" or (point['Mode'] == "equal" and not self.backtester_options.get('drift')):
+            return assets, point['Mode'], point['Years'], None, None
+        return assets, point['Mode'], point['Years'], point['Lookback'], point['Rebalance']
+
+    def _context_hash(self):
+        """
+        與 point 無關但會影響結果的所有輸入：報酬資料、起始日、共變異數估計方法、Backtester 參數
+        任何一項改變，舊的 checkpoint 都不再適用
+        """
+        panel = self.optimizer.panel
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(panel.values).tobytes())
+        digest.update(panel.dates.tobytes())
+        for asset_list in self.asset_sets.values():
+            digest.update(self.get_start_dates(asset_list).asi8.tobytes())
+        digest.update(json.dumps({'columns': list(panel.columns), 'covariance': self.optimizer.covariance_estimator.name,
+                                  'backtester': self.backtester_options},
+                                 sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _checkpoint_path(self, context, point):
+        digest = hashlib.sha1(context.encode())
+        digest.update(json.dumps({**point, 'Assets': [point['Assets'], self.asset_sets[point['Assets']]]},
+                                 sort_keys=True).encode())
+        return os.path.join(self.checkpoint_dir, f"{digest.hexdigest()[:20]}.pkl")
+
+    def _save_checkpoint(self, path, df):
+        # 先寫暫存檔再換名，中途中斷不會留下不完整的結果
+        tmp_path = path + ".tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _make_tasks(self, jobs):
+        """
+        把待算的 job 依 (資產, 估計年數) 分組，每組再依這組資產的起始日切成 chunk_size 的區塊
+        jobs: list of (資產 tuple, 估計年數, mode, 年限, rebalance 週期)
+        回傳 (任務 list, 每個 job 需要幾個任務)
+        """
+        groups = {}
+        for job_id, (assets, lookback_years, mode, holding_years, rebalance_freq) in enumerate(jobs):
+            groups.setdefault((assets, lookback_years), []).append((job_id, mode, holding_years, rebalance_freq))
+
+        tasks = []
+        n_chunks = [0] * len(jobs)
+        for (assets, lookback_years), group_jobs in groups.items():
+            start_dates = self.get_start_dates(assets)
+            for i in range(0, len(start_dates), self.chunk_size):
+                tasks.append((list(assets), lookback_years, group_jobs, start_dates[i:i + self.chunk_size].values,
+                              self.backtester_options))
+            for job_id, _, _, _ in group_jobs:
+                n_chunks[job_id] = -(-len(start_dates) // self.chunk_size)
+        return tasks, n_chunks
+
+    def _iter_results(self, tasks, max_pending=None):
+        """
+        依任務順序逐一產出 run_sweep_unit 的結果；workers > 1 時交給 ProcessPoolExecutor，
+        報酬率矩陣放在共享記憶體，worker 新算出的最適化結果併回主 process 的快取
+        """
+        if self.workers <= 1:
+            backtesters = {}
+            for task in tasks:
+                yield run_sweep_unit(self.optimizer, backtesters, task)
+            return
+
+        from scr.parallel import SharedReturns, _init_sweep_worker, _run_sweep_task
+
+        max_pending = max_pending or self.workers * 2
+        cache = self.optimizer.cache
+        cache_size = cache.max_size if cache is not None else 0
+        cache_path = cache.path if cache is not None else None
+
+        with SharedReturns(self.optimizer.panel) as shared:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_sweep_worker,
+                initargs=(shared.spec(), cache_size, cache_path, instrumentation.is_enabled(),
+                          self.optimizer.covariance_estimator)
+            ) as executor:
+                pending = deque()
+                task_iter = iter(tasks)
+
+                for task in task_iter:
+                    pending.append(executor.submit(_run_sweep_task, task))
+                    if len(pending) >= max_pending:
+                        break
+
+                while pending:
+                    results, new_entries, profile_data = pending.popleft().result()
+
+                    next_task = next(task_iter, None)
+                    if next_task is not None:
+                        pending.append(executor.submit(_run_sweep_task, next_task))
+
+                    instrumentation.merge(profile_data)
+                    if cache is not None:
+                        for key, value in new_entries:
+                            cache.put(key, value)
+
+                    yield results
+
+    @staticmethod
+    def _point_frame(point, outcomes):
+        df = pd.DataFrame([metrics for _, metrics, _ in outcomes], columns=METRIC_NAMES)
+        df["Mode"] = point['Mode']
+        df["Years"] = point['Years']
+        df["Trial"] = range(1, len(df) + 1)
+        df["Assets"] = point['Assets']
+        df["Lookback"] = point['Lookback']
+        df["Rebalance"] = point['Rebalance']
+        df["Start Date"] = pd.DatetimeIndex([start_date for start_date, _, _ in outcomes])
+        return df
+
+    @instrumentation.timed("SweepRunner.run")
+    def run(self):
+        """
+        跑完整個 grid，回傳所有 point 合併的表（各績效指標 + Mode、Years、Trial、Assets、Lookback、Rebalance、Start Date）
+        有 checkpoint_dir 時已完成的 point 直接讀檔，其餘 point 每完成一個就寫一份
+        """
+        points = self.points()
+        frames = [None] * len(points)
+
+        context = None
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            context = self._context_hash()
+
+        # 讀回已完成的 point；其餘的依 signature 合併成 job
+        paths = [None] * len(points)
+        job_points = {}
+        for point_id, point in enumerate(points):
+            if context is not None:
+                paths[point_id] = self._checkpoint_path(context, point)
+                if os.path.exists(paths[point_id]):
+                    frames[point_id] = pd.read_pickle(paths[point_id])
+                    continue
+            job_points.setdefault(self._signature(point), []).append(point_id)
+
+        jobs = []
+        for point_ids in job_points.values():
+            point = points[point_ids[0]]
+            jobs.append((tuple(self.asset_sets[point['Assets']]), point['Lookback'], point['Mode'], point['Years'],
+                         point['Rebalance']))
+        point_ids_by_job = list(job_points.values())
+
+        n_resumed = sum(frame is not None for frame in frames)
+        if jobs:
+            tasks, remaining = self._make_tasks(jobs)
+            collected = [[] for _ in jobs]
+
+            for results in self._iter_results(tasks):
+                for job_id, outcomes in results:
+                    collected[job_id].extend(outcomes)
+                    remaining[job_id] -= 1
+                    if remaining[job_id] > 0:
+                        continue
+
+                    # 這個 job 的所有起始日都跑完：展開成對應的每個 point，寫 checkpoint
+                    for point_id in point_ids_by_job[job_id]:
+                        frames[point_id] = self._point_frame(points[point_id], collected[job_id])
+                        if paths[point_id] is not None:
+                            self._save_checkpoint(paths[point_id], frames[point_id])
+                    collected[job_id] = None
+
+        self.summary = {
+            'points': len(points),
+            'resumed': n_resumed,
+            'computed': len(jobs),
+            'deduplicated': len(points) - n_resumed - len(jobs)
+        }
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from scr.availability import AvailabilityIndex
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(4)
+    values = rng.normal(0, 0.01, (100, 4))
+    values[:30, 1] = np.nan      # 晚上市
+    values[55:57, 2] = np.nan    # 中間缺一天價格 ➜ 少兩天報酬
+    values[90:, 3] = np.nan      # 提早下市
+    return values
+
+
+def test_valid_mask_matches_isnan(values):
+    index = AvailabilityIndex(values)
+    np.testing.assert_array_equal(index.valid_mask([0, 2]), ~np.isnan(values[:, [0, 2]]).any(axis=1))
+    np.testing.assert_array_equal(index.valid_mask(), ~np.isnan(values).any(axis=1))
+
+
+def test_interior_holes_do_not_cut_the_range(values):
+    index = AvailabilityIndex(values)
+    assert index.valid_range([0, 2]) == (0, 100)
+    np.testing.assert_array_equal(index.holes([0, 2]), [55, 56])
+    assert index.valid_range() == (30, 90)
+    np.testing.assert_array_equal(index.holes(), [55, 56])
+    # 不含缺值資產的組合沒有缺值日
+    assert index.valid_range([0, 1]) == (30, 100)
+    assert len(index.holes([0, 1])) == 0
+
+
+def test_holes_within_window(values):
+    index = AvailabilityIndex(values)
+    np.testing.assert_array_equal(index.holes([2], 0, 56), [55])
+    np.testing.assert_array_equal(index.holes([2], 56, 100), [56])
+    assert len(index.holes([2], 57, 100)) == 0
+
+
+def test_is_complete_requires_no_holes(values):
+    index = AvailabilityIndex(values)
+    assert index.is_complete(60, 90)
+    assert not index.is_complete(50, 60)
+    assert not index.is_complete(20, 40)
+
+
+def test_no_common_dates_is_rejected():
+    values = np.full((10, 2), np.nan)
+    values[:5, 0] = 0.01
+    values[5:, 1] = 0.01
+    with pytest.raises(ValueError):
+        AvailabilityIndex(values).valid_range()
+
+
+@pytest.mark.parametrize("split", [1, 8, 55, 56, 95])
+def test_extend_matches_rebuild(values, split):
+    index = AvailabilityIndex(values[:split])
+    index.extend(values[split:])
+    rebuilt = AvailabilityIndex(values)
+    for asset_idx in ([0, 2], [0, 1], None):
+        assert index.valid_range(asset_idx) == rebuilt.valid_range(asset_idx)
+        np.testing.assert_array_equal(index.holes(asset_idx), rebuilt.holes(asset_idx))
+    np.testing.assert_array_equal(index.bits, rebuilt.bits)
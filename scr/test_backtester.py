@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.backtester import Backtester
+
+
+def naive_backtest(optimizer, asset_list, start_date, end_date, equal_weight=False, months=6, lookback_years=5):
+    """
+    逐期、直接從 DataFrame 切片估參數的參考版本（不經過 rolling moments、快取與批次引擎）
+    """
+    returns = optimizer.returns[asset_list].dropna()
+    index = returns.index
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    rebalance_dates = [start_date]
+    while start_date + pd.DateOffset(months=months * len(rebalance_dates)) < end_date:
+        rebalance_dates.append(start_date + pd.DateOffset(months=months * len(rebalance_dates)))
+
+    pieces, weights = [], None
+    for k, rebalance_date in enumerate(rebalance_dates):
+        period_end = rebalance_dates[k + 1] if k + 1 < len(rebalance_dates) else None
+        mask = index >= rebalance_date
+        mask &= (index < period_end) if period_end is not None else (index <= end_date)
+        estimation = returns[(index >= rebalance_date - pd.Timedelta(days=1) - pd.DateOffset(years=lookback_years))
+                             & (index < rebalance_date)].to_numpy()
+        if equal_weight:
+            weights = np.ones(len(asset_list)) / len(asset_list)
+        else:
+            mu = estimation.mean(axis=0) * 252
+            sigma = np.cov(estimation, rowvar=False) * 252
+            weights = optimizer.optimize_portfolio(mu, sigma, initial_weights=weights)
+        pieces.append(returns[mask].to_numpy() @ weights)
+    return np.concatenate(pieces)
+
+
+@pytest.mark.parametrize("equal_weight", [False, True])
+def test_run_backtest_matches_naive_reference(optimizer, assets, equal_weight):
+    backtester = Backtester(optimizer, assets)
+    result = backtester.run_backtest("2006-03-15", "2009-03-15", equal_weight=equal_weight)
+    expected = naive_backtest(optimizer, assets, "2006-03-15", "2009-03-15", equal_weight=equal_weight)
+    assert len(result) == len(expected)
+    np.testing.assert_allclose(result.to_numpy(), expected, rtol=1e-9, atol=1e-12)
+
+
+def test_batch_rows_match_single_start_runs(optimizer, assets):
+    start_dates = pd.DatetimeIndex(["2005-02-01", "2005-02-02", "2006-07-10", "2007-01-31"])
+    matrix = Backtester(optimizer, assets).run_backtest_batch(start_dates, holding_years=3)
+
+    for row, start_date in zip(matrix, start_dates):
+        single = Backtester(optimizer, assets).run_backtest(start_date, start_date + pd.DateOffset(years=3))
+        n_days = len(single)
+        np.testing.assert_allclose(row[:n_days], single.to_numpy(), rtol=1e-12, atol=1e-15)
+        assert np.isnan(row[n_days:]).all()
+
+
+def test_batch_shares_rebalance_windows(optimizer, assets):
+    # 相鄰起始日的 rebalance 區間大量重疊，去除重複後求解的次數應遠少於 trials × 期數
+    from scr import instrumentation
+
+    instrumentation.enable()
+    instrumentation.reset()
+    try:
+        start_dates = optimizer.panel.index[1400:1420]
+        Backtester(optimizer, assets).run_backtest_batch(start_dates, holding_years=3)
+        counters = instrumentation.drain()['counters']
+    finally:
+        instrumentation.enable(False)
+        instrumentation.reset()
+    assert counters["Backtester.unique_windows"] < counters["Backtester.rebalances"]
+
+
+@pytest.mark.parametrize("asset_count", [1, 3, 5])
+def test_full_width_and_subset_paths_agree(optimizer, assets, monkeypatch, asset_count):
+    # 權重攤成全部欄位與只乘這組資產的欄位，結果必須相同
+    subset = assets[:asset_count]
+    start_dates = pd.DatetimeIndex(["2006-03-15", "2007-01-31"])
+    monkeypatch.setattr(Backtester, "FULL_WIDTH_FRACTION", 0.0)
+    full_width = Backtester(optimizer, subset).run_backtest_batch(start_dates, holding_years=3)
+    monkeypatch.setattr(Backtester, "FULL_WIDTH_FRACTION", 2.0)
+    columns = Backtester(optimizer, subset).run_backtest_batch(start_dates, holding_years=3)
+    np.testing.assert_allclose(full_width, columns, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("equal_weight", [False, True])
+def test_price_gap_matches_dropna_reference(gap_prices, assets, equal_weight):
+    # 缺值日落在估計區間與持有期間內：只略過那兩天，其餘與對這組資產 dropna 的參考版本相同
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    optimizer = PortfolioOptimizer(gap_prices)
+    result = Backtester(optimizer, assets).run_backtest("2004-03-15", "2008-03-15", equal_weight=equal_weight)
+    expected = naive_backtest(optimizer, assets, "2004-03-15", "2008-03-15", equal_weight=equal_weight)
+    assert not result.index.isin(optimizer.panel.index[[1499, 1500]]).any()
+    np.testing.assert_allclose(result.to_numpy(), expected, rtol=1e-9, atol=1e-12)
+
+
+def test_price_gap_in_drift_mode_is_skipped(gap_prices, assets):
+    # 缺值日不漂移也不交易：等同把那兩天從報酬表拿掉
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    options = dict(drift=True, cost_rate=0.001, threshold=0.02)
+    with_gap = Backtester(PortfolioOptimizer(gap_prices), assets, **options)
+    result = with_gap.run_backtest("2004-03-15", "2008-03-15", equal_weight=True)
+
+    returns = with_gap.optimizer.returns.dropna()
+    dropped = Backtester(PortfolioOptimizer(None, returns=returns), assets, **options)
+    expected = dropped.run_backtest("2004-03-15", "2008-03-15", equal_weight=True)
+    pd.testing.assert_series_equal(result, expected, rtol=1e-12, check_freq=False)
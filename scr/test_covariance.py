@@ -0,0 +1,105 @@
+import pickle
+
+import numpy as np
+import pytest
+from scr.covariance import DenseCovariance, FactorCovariance, FactorEstimator, ShrinkageEstimator, get_estimator
+from scr.portfolio_optimizer import PortfolioOptimizer
+
+
+@pytest.fixture
+def block():
+    rng = np.random.default_rng(11)
+    factor = rng.normal(0, 0.01, (300, 1))
+    return factor * rng.uniform(0.5, 1.5, 8) + rng.normal(0.0002, 0.006, (300, 8))
+
+
+def sklearn_style_shrinkage(block, method):
+    """
+    sklearn 的 ledoit_wolf / oas 寫法（以 ddof=0 的樣本共變異數為基準），回傳 (δ, 收縮後的矩陣)
+    """
+    n_obs, n_assets = block.shape
+    centered = block - block.mean(axis=0)
+    emp_cov = centered.T @ centered / n_obs
+    mu = np.trace(emp_cov) / n_assets
+    if method == "oas":
+        alpha = np.mean(emp_cov ** 2)
+        shrinkage = min((alpha + mu ** 2) / ((n_obs + 1) * (alpha - mu ** 2 / n_assets)), 1.0)
+    else:
+        squared = centered ** 2
+        beta_ = np.sum(squared.T @ squared)
+        delta_ = np.sum(emp_cov ** 2)
+        beta = (beta_ / n_obs - delta_) / (n_assets * n_obs)
+        delta = (delta_ - 2 * mu * np.trace(emp_cov) + n_assets * mu ** 2) / n_assets
+        shrinkage = min(beta, delta) / delta
+    return shrinkage, (1 - shrinkage) * emp_cov + shrinkage * mu * np.eye(n_assets)
+
+
+@pytest.mark.parametrize("method", ["ledoit_wolf", "oas"])
+def test_shrinkage_matches_reference(block, method):
+    n_obs = len(block)
+    covariance = ShrinkageEstimator(method)(block.mean(axis=0), np.cov(block, rowvar=False), n_obs, lambda: block)
+    _, expected = sklearn_style_shrinkage(block, method)
+    # 這裡的 S 是 ddof=1，整體差一個 T / (T - 1) 的比例
+    np.testing.assert_allclose(covariance.matrix, expected * n_obs / (n_obs - 1), rtol=1e-10)
+
+
+def test_factor_model_solve_and_subset(block):
+    cov = np.cov(block, rowvar=False)
+    covariance = FactorEstimator(n_factors=2)(block.mean(axis=0), cov, len(block), None)
+    assert isinstance(covariance, FactorCovariance)
+    np.testing.assert_allclose(np.diag(covariance.matrix), np.diag(cov), rtol=1e-10)
+
+    b = np.arange(1.0, 9.0)
+    np.testing.assert_allclose(covariance.solve(b), np.linalg.solve(covariance.matrix, b), rtol=1e-8)
+    np.testing.assert_allclose(covariance.scaled(252).matrix, covariance.matrix * 252, rtol=1e-12)
+
+    idx = [6, 2, 3]
+    np.testing.assert_allclose(covariance.subset(idx).matrix, covariance.matrix[np.ix_(idx, idx)], rtol=1e-12)
+
+
+def test_dense_solve(block):
+    cov = np.cov(block, rowvar=False)
+    b = np.ones((8, 2))
+    np.testing.assert_allclose(DenseCovariance(cov).solve(b), np.linalg.solve(cov, b), rtol=1e-9)
+
+
+def test_pickle_drops_cached_factorizations(block):
+    cov = np.cov(block, rowvar=False)
+    dense = DenseCovariance(cov)
+    factor = FactorEstimator(n_factors=2)(block.mean(axis=0), cov, len(block), None)
+    b = np.ones(8)
+    for covariance in (dense, factor):
+        expected = covariance.solve(b)
+        covariance.matrix  # 展開並快取
+        restored = pickle.loads(pickle.dumps(covariance))
+        assert restored._factor is None
+        np.testing.assert_allclose(restored.solve(b), expected, rtol=1e-12)
+    assert pickle.loads(pickle.dumps(factor))._matrix is None
+    assert len(pickle.dumps(factor)) < len(pickle.dumps(dense))
+
+
+def test_unknown_estimator_is_rejected():
+    with pytest.raises(ValueError):
+        get_estimator("median")
+    with pytest.raises(ValueError):
+        ShrinkageEstimator("constant_correlation")
+
+
+@pytest.mark.parametrize("estimator", ["sample", "ledoit_wolf", "oas", "pca"])
+def test_solve_by_position_keeps_covariance_object(prices, assets, estimator):
+    optimizer = PortfolioOptimizer(prices, covariance=estimator)
+    mu, covariance, weights = optimizer.solve_by_position(100, 1400, assets, allow_short=True)
+    expected_mu, expected_covariance = optimizer.estimate_covariance_by_position(100, 1400)
+    np.testing.assert_allclose(covariance.matrix, expected_covariance.matrix, rtol=1e-12)
+    raw = expected_covariance.solve(expected_mu)
+    np.testing.assert_allclose(weights, raw / raw.sum(), rtol=1e-9)
+
+
+def test_factor_solve_does_not_expand_matrix(prices, assets):
+    # 允許放空時走 Woodbury：求解與放進快取都不需要展開 n × n 的矩陣
+    from scr.optimizer_cache import OptimizerCache
+
+    optimizer = PortfolioOptimizer(prices, covariance="pca", cache=OptimizerCache())
+    _, covariance, _ = optimizer.solve_by_position(100, 1400, assets, allow_short=True)
+    assert isinstance(covariance, FactorCovariance) and covariance._matrix is None
+    assert optimizer.solve_by_position(100, 1400, assets, allow_short=True)[1] is covariance
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import minimize
+from scr.backtester import Backtester
+from scr.frontier import FrontierSolver
+from scr.portfolio_optimizer import OptimizationError
+
+
+@pytest.fixture
+def moments(optimizer):
+    mu, sigma = optimizer.estimate_parameters_by_position(100, 1400)
+    mu = np.asarray(mu).copy()
+    mu[1] = -0.02  # 讓前緣上有資產進出（不放空的限制會綁住）
+    return mu, np.asarray(sigma)
+
+
+def slsqp_min_variance(sigma, mu=None, target=None):
+    """
+    直接以 SLSQP 求（目標報酬下的）最小變異組合，當作參考答案
+    """
+    n = len(sigma)
+    constraints = [{'type': 'eq', 'fun': lambda w: w.sum() - 1}]
+    if target is not None:
+        constraints.append({'type': 'eq', 'fun': lambda w: w @ mu - target})
+    result = minimize(lambda w: w @ sigma @ w, np.ones(n) / n, jac=lambda w: 2 * sigma @ w, method='SLSQP',
+                      bounds=[(0, 1)] * n, constraints=constraints, options={'ftol': 1e-15, 'maxiter': 1000})
+    return result.x
+
+
+def variance(w, sigma):
+    return w @ sigma @ w
+
+
+def test_min_variance_matches_slsqp(moments):
+    mu, sigma = moments
+    weights = FrontierSolver(mu, sigma).min_variance()
+    assert np.all(weights >= 0) and weights.sum() == pytest.approx(1.0)
+    assert variance(weights, sigma) <= variance(slsqp_min_variance(sigma), sigma) * (1 + 1e-9)
+
+
+def test_min_variance_with_shorting_is_closed_form(moments):
+    mu, sigma = moments
+    expected = np.linalg.solve(sigma, np.ones(len(mu)))
+    np.testing.assert_allclose(FrontierSolver(mu, sigma).min_variance(allow_short=True), expected / expected.sum(),
+                               rtol=1e-10)
+
+
+def test_target_return_is_on_the_frontier(moments):
+    mu, sigma = moments
+    solver = FrontierSolver(mu, sigma)
+    low, high = mu @ solver.min_variance(), mu.max()
+    for target in np.linspace(low, high, 6):
+        weights = solver.target_return(target)
+        assert weights @ mu == pytest.approx(target, rel=1e-9)
+        assert variance(weights, sigma) <= variance(slsqp_min_variance(sigma, mu, target), sigma) * (1 + 1e-7)
+    with pytest.raises(OptimizationError):
+        solver.target_return(high + 0.01)
+
+
+def test_target_volatility_and_frontier(moments):
+    mu, sigma = moments
+    solver = FrontierSolver(mu, sigma)
+    returns, volatilities, weights = solver.frontier(n_points=8)
+    assert np.all(np.diff(returns) > 0) and np.all(np.diff(volatilities) > 0)
+    for target_return, volatility in zip(returns[1:-1], volatilities[1:-1]):
+        weights = solver.target_volatility(volatility)
+        assert np.sqrt(variance(weights, sigma)) == pytest.approx(volatility, rel=1e-9)
+        assert weights @ mu == pytest.approx(target_return, rel=1e-9)
+
+
+def test_max_sharpe_lies_on_the_frontier(optimizer, moments):
+    mu, sigma = moments
+    weights = optimizer.optimize_portfolios(mu, sigma, strategies=("max_sharpe",))["max_sharpe"]
+    np.testing.assert_allclose(FrontierSolver(mu, sigma).target_return(weights @ mu), weights, atol=1e-8)
+
+
+def test_risk_parity_equalizes_contributions(moments):
+    mu, sigma = moments
+    weights = FrontierSolver(mu, sigma).risk_parity()
+    contributions = weights * (sigma @ weights)
+    np.testing.assert_allclose(contributions / contributions.sum(), np.full(len(mu), 1 / len(mu)), rtol=1e-8)
+
+
+def test_strategies_batch_matches_single_strategy_runs(optimizer, assets):
+    start_dates = pd.DatetimeIndex(["2006-03-15", "2007-01-31"])
+    strategies = ("max_sharpe", "min_variance", "risk_parity", "equal", ("target_volatility", 0.1))
+    batch = Backtester(optimizer, assets).run_strategies_batch(start_dates, holding_years=3, strategies=strategies)
+    for strategy in strategies:
+        single = Backtester(optimizer, assets).run_strategies_batch(start_dates, holding_years=3,
+                                                                    strategies=(strategy,))
+        np.testing.assert_allclose(batch[strategy], single[strategy], rtol=1e-9, atol=1e-14)
+
+
+def test_equal_weight_skips_estimation(optimizer, assets, monkeypatch):
+    # 等權重不需要 (μ, Σ)：不估共變異數、不建 FrontierSolver
+    def fail(*args, **kwargs):
+        raise AssertionError("equal 不應估參數或建 solver")
+
+    expected = Backtester(optimizer, assets).run_backtest_batch(pd.DatetimeIndex(["2006-03-15"]), equal_weight=True)
+    monkeypatch.setattr(optimizer, "estimate_covariance_by_position", fail)
+    monkeypatch.setattr(optimizer, "frontier_solver", fail)
+    got = Backtester(optimizer, assets).run_backtest_batch(pd.DatetimeIndex(["2006-03-15"]), equal_weight=True)
+    np.testing.assert_array_equal(got, expected)
+    assert np.isfinite(got).any()
@@ -0,0 +1,76 @@
+import pytest
+from scr import instrumentation
+
+
+@pytest.fixture
+def profiling():
+    instrumentation.enable()
+    instrumentation.reset()
+    yield instrumentation
+    instrumentation.enable(False)
+    instrumentation.reset()
+
+
+@instrumentation.timed("square")
+def square(x):
+    return x * x
+
+
+def test_disabled_records_nothing():
+    instrumentation.enable(False)
+    instrumentation.reset()
+    assert square(3) == 9
+    with instrumentation.section("block"):
+        instrumentation.count("events")
+    assert instrumentation.snapshot() == {'timings': {}, 'counters': {}}
+
+
+def test_timed_section_and_count(profiling):
+    square(2)
+    square(3)
+    with profiling.section("block"):
+        profiling.count("events", 5)
+
+    data = profiling.snapshot()
+    assert data['timings']['square'][0] == 2 and data['timings']['block'][0] == 1
+    assert data['counters'] == {'events': 5}
+    assert "square" in profiling.report() and "events" in profiling.report()
+
+
+def test_timed_records_even_when_the_call_raises(profiling):
+    @profiling.timed("boom")
+    def boom():
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        boom()
+    assert profiling.snapshot()['timings']['boom'][0] == 1
+
+
+def test_drain_then_merge(profiling):
+    square(1)
+    profiling.count("events")
+    worker_data = profiling.drain()
+    assert profiling.snapshot() == {'timings': {}, 'counters': {}}
+
+    profiling.merge(worker_data)
+    profiling.merge(worker_data)
+    data = profiling.snapshot()
+    assert data['timings']['square'][0] == 2 and data['counters']['events'] == 2
+
+
+def test_worker_counters_reach_the_parent(profiling, optimizer, assets):
+    # 平行模擬時 worker 的記錄要合併回主 process，總數與單一 process 相同
+    from scr.backtester import Backtester
+    from scr.simulator import Simulator
+
+    def run(workers):
+        profiling.reset()
+        simulator = Simulator(optimizer, Backtester(optimizer, assets), assets, n_trials=6, seed=1, workers=workers,
+                              chunk_size=3)
+        simulator.run_simulation(holding_years=3)
+        return profiling.snapshot()['counters']
+
+    serial = run(1)
+    assert serial["Backtester.rebalances"] > 0
+    assert run(2)["Backtester.rebalances"] == serial["Backtester.rebalances"]
@@ -0,0 +1,118 @@
+import importlib
+
+import numpy as np
+import pytest
+from scr import kernels
+from scr.performance import METRIC_NAMES, compute_performance_metrics
+from scr.rebalancing import drift_block, drift_block_numpy
+from scr.test_rebalancing import naive_drift
+
+# 編譯版本只在有安裝 numba 時測；沒有時 USE_JIT 一定是 False，不會走到迴圈版本
+USE_JIT = [False, pytest.param(True, marks=pytest.mark.skipif(kernels.numba is None, reason="numba 未安裝"))]
+
+
+@pytest.fixture
+def use_jit(request, monkeypatch):
+    monkeypatch.setattr(kernels, "USE_JIT", request.param)
+    return request.param
+
+
+def naive_nav_drawdown(row):
+    nav, peak, worst = 1.0, -np.inf, np.inf
+    for daily in row:
+        nav *= 1 + daily
+        peak = max(peak, nav)
+        worst = min(worst, (nav - peak) / peak)
+    return nav, worst
+
+
+@pytest.mark.parametrize("use_jit", USE_JIT, indirect=True)
+@pytest.mark.parametrize("shape", [(1,), (5, 1), (4, 300), (2, 3, 50)])
+def test_nav_drawdown_matches_daily_loop(use_jit, shape):
+    filled = np.random.default_rng(0).normal(0.0003, 0.01, shape)
+    total_growth, max_drawdown = kernels.nav_drawdown(filled)
+    assert total_growth.shape == max_drawdown.shape == shape[:-1]
+
+    expected = np.array([naive_nav_drawdown(row) for row in filled.reshape(-1, shape[-1])])
+    np.testing.assert_allclose(total_growth.ravel(), expected[:, 0], rtol=1e-12)
+    np.testing.assert_allclose(max_drawdown.ravel(), expected[:, 1], rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("use_jit", USE_JIT, indirect=True)
+def test_metrics_on_nan_padded_matrix(use_jit):
+    # 長度不一的 trial 尾端補 NaN：每一列都等於 dropna 後單獨計算
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(0.0004, 0.01, (6, 200))
+    for i, length in enumerate([200, 150, 37, 2, 1, 0]):
+        matrix[i, length:] = np.nan
+
+    metrics = compute_performance_metrics(matrix, axis=1)
+    for i, row in enumerate(matrix):
+        row = row[~np.isnan(row)]
+        if len(row) == 0:
+            assert all(np.isnan(metrics[name][i]) for name in METRIC_NAMES)
+            continue
+        growth, drawdown = naive_nav_drawdown(row)
+        assert metrics['Max Drawdown'][i] == pytest.approx(drawdown, rel=1e-12, abs=1e-15)
+        assert metrics['Annualized Return'][i] == pytest.approx(growth ** (252 / len(row)) - 1, rel=1e-10)
+        if len(row) < 2:
+            assert np.isnan(metrics['Annualized Volatility'][i])
+        else:
+            assert metrics['Annualized Volatility'][i] == pytest.approx(row.std(ddof=1) * np.sqrt(252), rel=1e-10)
+
+
+@pytest.mark.parametrize("use_jit", USE_JIT, indirect=True)
+@pytest.mark.parametrize("threshold", [None, 0.05, 0.01])
+@pytest.mark.parametrize("cost_rate, fixed_cost", [(0.0, 0.0), (0.001, 0.5)])
+@pytest.mark.parametrize("start", ["cash", "holdings", "continue"])
+def test_drift_matches_daily_loop(use_jit, threshold, cost_rate, fixed_cost, start):
+    rng = np.random.default_rng(2)
+    returns = rng.normal(0.0003, 0.012, (300, 8))
+    target = rng.dirichlet(np.ones(8))
+    holdings = None if start == "cash" else rng.dirichlet(np.ones(8))
+    kwargs = dict(cost_rate=cost_rate, fixed_cost=fixed_cost, nav=100.0, threshold=threshold,
+                  rebalance=start != "continue")
+
+    got = drift_block(returns, target, holdings, **kwargs)
+    expected = naive_drift(returns, target, holdings, **kwargs)
+    np.testing.assert_allclose(got[0], expected[0], rtol=1e-9, atol=1e-14)
+    np.testing.assert_allclose(got[1], expected[1], rtol=1e-9)
+    assert got[2] == pytest.approx(expected[2], rel=1e-9)
+    assert got[3] == expected[3] and got[4] == pytest.approx(expected[4], rel=1e-9)
+
+
+@pytest.mark.parametrize("use_jit", USE_JIT, indirect=True)
+@pytest.mark.parametrize("holdings", [None, np.array([0.5, 0.3, 0.2])])
+def test_empty_block_returns_entry_state(use_jit, holdings):
+    returns, final, nav, n_trades, turnover = drift_block(np.zeros((0, 3)), np.ones(3) / 3, holdings, nav=7.0,
+                                                          cost_rate=0.001)
+    assert len(returns) == 0 and nav == 7.0 and n_trades == 0 and turnover == 0
+    if holdings is None:
+        assert final is None
+    else:
+        np.testing.assert_array_equal(final, holdings)
+
+
+@pytest.mark.parametrize("threshold", [None, 0.02])
+def test_loop_matches_numpy_without_compiling(threshold):
+    # 沒有 numba 時迴圈版本以純 Python 執行，仍可比對兩種寫法的邏輯
+    rng = np.random.default_rng(3)
+    returns = rng.normal(0.0003, 0.012, (120, 4))
+    target = rng.dirichlet(np.ones(4))
+    holdings = rng.dirichlet(np.ones(4))
+    for start, rebalance in ((None, True), (holdings, True), (holdings, False)):
+        loop = kernels.drift_loop(returns, target, start, cost_rate=0.001, nav=50.0, threshold=threshold,
+                                  rebalance=rebalance)
+        vectorized = drift_block_numpy(returns, target, start, cost_rate=0.001, nav=50.0, threshold=threshold,
+                                       rebalance=rebalance)
+        for a, b in zip(loop, vectorized):
+            np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-15)
+
+
+def test_environment_variable_disables_jit(monkeypatch):
+    monkeypatch.setenv(kernels.ENV_DISABLE, "1")
+    try:
+        assert importlib.reload(kernels).USE_JIT is False
+    finally:
+        monkeypatch.delenv(kernels.ENV_DISABLE)
+        importlib.reload(kernels)
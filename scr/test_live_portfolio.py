@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from scr.backtester import Backtester
+from scr.performance import compute_performance_metrics
+from scr.live_portfolio import DailyUpdater, LivePortfolio
+from scr.portfolio_optimizer import PortfolioOptimizer
+from scr.prepare_data import ETFDataLoader
+
+
+@pytest.mark.parametrize("mode", ["optimal", "equal"])
+def test_incremental_updates_match_one_shot(prices, assets, mode):
+    start_date = prices.index[1400]
+    optimizer = PortfolioOptimizer(prices.iloc[:1800])
+    live = LivePortfolio(optimizer, assets, start_date, mode=mode)
+    for lo, hi in [(1800, 1801), (1801, 2200), (2200, 2800)]:
+        optimizer.extend(prices.iloc[lo:hi])
+        assert live.update() == hi - lo
+
+    one_shot = LivePortfolio(PortfolioOptimizer(prices), assets, start_date, mode=mode)
+    assert live.n_days == one_shot.n_days
+    assert [date for date, _ in live.rebalances] == [date for date, _ in one_shot.rebalances]
+    for name, value in one_shot.metrics().items():
+        assert live.metrics()[name] == pytest.approx(value, rel=1e-9)
+
+
+DRIFT_OPTIONS = dict(rebalance_freq='Q', drift=True, cost_rate=0.001, fixed_cost=2.0, initial_capital=1000.0,
+                     threshold=0.02, lookback_years=3)
+
+
+@pytest.mark.parametrize("mode", ["optimal", "equal"])
+@pytest.mark.parametrize("options", [{}, DRIFT_OPTIONS])
+def test_matches_backtester(optimizer, prices, assets, mode, options):
+    # 同樣的設定跑到資料最後一天，結果必須與回測相同
+    start_date = prices.index[1400]
+    backtester = Backtester(optimizer, assets, **options)
+    expected = backtester.run_backtest(start_date, prices.index[-1], equal_weight=mode == "equal")
+    live = LivePortfolio(optimizer, assets, start_date, mode=mode, **backtester.options())
+
+    assert live.n_days == len(expected)
+    for name, value in compute_performance_metrics(expected.to_numpy()).items():
+        assert live.metrics()[name] == pytest.approx(value, rel=1e-9)
+
+
+def test_price_gap_matches_backtester(gap_prices, assets):
+    # 缺值日落在兩次 update 之間與 rebalance 區間中：略過的天數與回測相同
+    start_date = gap_prices.index[1400]
+    optimizer = PortfolioOptimizer(gap_prices.iloc[:1500])
+    live = LivePortfolio(optimizer, assets, start_date, mode="equal", **DRIFT_OPTIONS)
+    for lo, hi in [(1500, 1501), (1501, 1502), (1502, 2800)]:
+        optimizer.extend(gap_prices.iloc[lo:hi])
+        live.update()
+
+    expected = Backtester(optimizer, assets, **DRIFT_OPTIONS).run_backtest(start_date, gap_prices.index[-1],
+                                                                          equal_weight=True)
+    assert live.n_days == len(expected)
+    for name, value in compute_performance_metrics(expected.to_numpy()).items():
+        assert live.metrics()[name] == pytest.approx(value, rel=1e-9)
+
+
+@pytest.mark.parametrize("mode", ["optimal", "equal"])
+def test_drift_state_carries_across_updates(prices, assets, mode):
+    # 每天 update 一次：持倉與淨值接著上次的狀態，不會每次都重新建倉（等權重會在區間中觸發門檻）
+    start_date = prices.index[1400]
+    optimizer = PortfolioOptimizer(prices.iloc[:2000])
+    live = LivePortfolio(optimizer, assets, start_date, mode=mode, **DRIFT_OPTIONS)
+    for position in range(2000, 2300):
+        optimizer.extend(prices.iloc[position:position + 1])
+        live.update()
+
+    one_shot = LivePortfolio(PortfolioOptimizer(prices.iloc[:2300]), assets, start_date, mode=mode, **DRIFT_OPTIONS)
+    assert live.n_trades == one_shot.n_trades
+    assert live.nav == pytest.approx(one_shot.nav, rel=1e-9)
+    np.testing.assert_allclose(live.holdings, one_shot.holdings, rtol=1e-9)
+    for name, value in one_shot.metrics().items():
+        assert live.metrics()[name] == pytest.approx(value, rel=1e-9)
+
+
+def test_cost_options_need_drift(optimizer, assets, prices):
+    with pytest.raises(ValueError):
+        LivePortfolio(optimizer, assets, prices.index[1400], cost_rate=0.001)
+
+
+def test_unknown_mode_is_rejected(optimizer, assets, prices):
+    with pytest.raises(ValueError):
+        LivePortfolio(optimizer, assets, prices.index[1400], mode="historical")
+
+
+@pytest.fixture
+def csv_files(tmp_path, prices, price_csv_writer):
+    files = {}
+    for column in prices.columns[:3]:
+        price_csv_writer(tmp_path / f"{column}.csv", prices[column].iloc[:2750])
+        files[column] = f"{column}.csv"
+    return tmp_path, files
+
+
+def append_days(data_dir, files, prices, lo, hi):
+    for column, filename in files.items():
+        with open(data_dir / filename, "a", encoding="utf-8") as f:
+            for date, price in prices[column].iloc[lo:hi].items():
+                f.write(f"{date:%Y-%m-%d},{price:.6f},{price:.6f},{price:.6f},{price:.6f},{price:.6f},0\n")
+
+
+def test_daily_updater_appends_new_days(csv_files, prices, tmp_path):
+    data_dir, files = csv_files
+    loader = ETFDataLoader(files, data_dir=str(data_dir), cache_dir=str(tmp_path / "store"))
+    optimizer = PortfolioOptimizer(loader.price_df)
+    assets = list(files)
+    updater = DailyUpdater(loader, optimizer, [LivePortfolio(optimizer, assets, prices.index[1500])])
+
+    append_days(data_dir, files, prices, 2750, 2753)
+    result = updater.run()
+    assert result['new_days'] == 3 and not result['full_rebuild']
+
+    fresh_loader = ETFDataLoader(files, data_dir=str(data_dir))
+    fresh = PortfolioOptimizer(fresh_loader.price_df)
+    np.testing.assert_allclose(optimizer.panel.values, fresh.panel.values, rtol=1e-12)
+    expected = LivePortfolio(fresh, assets, prices.index[1500]).metrics()
+    for name, value in expected.items():
+        assert result['live'][0][name] == pytest.approx(value, rel=1e-9)
+
+    assert updater.run()['new_days'] == 0
+
+
+def test_daily_updater_rebuilds_when_history_changes(csv_files, prices, tmp_path, price_csv_writer):
+    data_dir, files = csv_files
+    loader = ETFDataLoader(files, data_dir=str(data_dir), cache_dir=str(tmp_path / "store"))
+    optimizer = PortfolioOptimizer(loader.price_df)
+    updater = DailyUpdater(loader, optimizer, [LivePortfolio(optimizer, list(files), prices.index[1500],
+                                                             **DRIFT_OPTIONS)])
+
+    restated = prices.copy()
+    restated.iloc[100, 0] *= 1.05
+    price_csv_writer(data_dir / files["A0"], restated["A0"].iloc[:2750])
+    result = updater.run()
+    assert result['full_rebuild']
+
+    expected = PortfolioOptimizer(ETFDataLoader(files, data_dir=str(data_dir)).price_df)
+    np.testing.assert_allclose(optimizer.panel.values, expected.panel.values, rtol=1e-12)
+    rebuilt = updater.live_portfolios[0]
+    assert rebuilt.options() == DRIFT_OPTIONS
+    assert rebuilt.n_days == LivePortfolio(expected, list(files), prices.index[1500], **DRIFT_OPTIONS).n_days
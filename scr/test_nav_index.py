@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.nav_index import NavIndex
+
+
+@pytest.fixture
+def returns(prices):
+    frame = prices.pct_change(fill_method=None).iloc[1:]
+    frame.iloc[:40, 2] = np.nan  # 晚上市的資產
+    return frame
+
+
+@pytest.mark.parametrize("window", [(40, 41), (40, 1000), (1500, 2799)])
+def test_cumulative_returns_match_direct_product(returns, window):
+    index = NavIndex(returns)
+    start_pos, end_pos = window
+    block = returns.to_numpy()[start_pos:end_pos]
+
+    np.testing.assert_allclose(index.asset_cumulative_return(start_pos, end_pos), np.prod(1 + block, axis=0) - 1,
+                               rtol=1e-10)
+
+    weights = np.array([0.1, 0.2, 0.3, 0.15, 0.25])
+    buy_and_hold = (np.prod(1 + block, axis=0) @ weights) - 1
+    assert index.buy_and_hold_return(start_pos, end_pos, weights * 2) == pytest.approx(buy_and_hold, rel=1e-10)
+
+    # 每日再平衡：等同先算出組合日報酬再連乘
+    constant_mix = np.prod(1 + block @ weights) - 1
+    assert index.constant_mix_return(start_pos, end_pos, weights) == pytest.approx(constant_mix, rel=1e-10)
+
+
+def test_vectorized_windows_and_subset(returns):
+    index = NavIndex(returns)
+    start_pos, end_pos = np.array([50, 300]), np.array([200, 900])
+    got = index.asset_cumulative_return(start_pos, end_pos, asset_idx=[4, 0])
+    for row, (a, b) in zip(got, zip(start_pos, end_pos)):
+        np.testing.assert_allclose(row, np.prod(1 + returns.to_numpy()[a:b][:, [4, 0]], axis=0) - 1, rtol=1e-10)
+
+
+def test_positions_are_inclusive(returns):
+    index = NavIndex(returns)
+    start_pos, end_pos = index.positions(returns.index[10], returns.index[20])
+    assert (start_pos, end_pos) == (10, 21)
+    start_pos, end_pos = index.positions(pd.DatetimeIndex(returns.index[[5, 7]]), pd.DatetimeIndex(returns.index[[9, 9]]))
+    np.testing.assert_array_equal(end_pos - start_pos, [5, 3])
+
+
+def test_extend_matches_rebuild(returns):
+    weights = np.full(5, 0.2)
+    index = NavIndex(returns.iloc[:1000])
+    index.constant_mix_prefix(weights)  # 已建好的前綴和要一起延長
+    # panel 由 optimizer 負責 append；這裡直接換成完整的 panel，只檢查前綴和
+    index.panel = NavIndex(returns).panel
+    index.extend(returns.to_numpy()[1000:1001])
+    index.extend(returns.to_numpy()[1001:])
+
+    rebuilt = NavIndex(returns)
+    np.testing.assert_allclose(index.log_nav, rebuilt.log_nav, rtol=1e-12)
+    np.testing.assert_allclose(index.constant_mix_prefix(weights), rebuilt.constant_mix_prefix(weights), rtol=1e-12)
+    assert index.annualize(0.21, 504) == pytest.approx(0.1)
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pytest
+from scr import optimizer_cache
+from scr.optimizer_cache import OptimizerCache
+from scr.portfolio_optimizer import PortfolioOptimizer
+
+
+def test_lru_eviction_and_stats():
+    cache = OptimizerCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # b 最久沒用到，被淘汰
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'size': 2, 'hit_rate': 2 / 3}
+
+
+def test_cached_solution_matches_fresh_solve(prices, assets):
+    cached = PortfolioOptimizer(prices, cache=OptimizerCache())
+    fresh = PortfolioOptimizer(prices)
+    for _ in range(2):
+        _, _, weights = cached.solve_by_position(100, 1400, assets)
+    _, _, expected = fresh.solve_by_position(100, 1400, assets)
+    np.testing.assert_array_equal(weights, expected)
+    assert cached.cache.hits == 1
+
+
+def filled_cache(prices, assets, path):
+    optimizer = PortfolioOptimizer(prices, cache=OptimizerCache(path=path))
+    optimizer.solve_by_position(100, 1400, assets)
+    optimizer.cache.save()
+    return optimizer
+
+
+def test_reload_with_same_data_keeps_entries(prices, assets, tmp_path):
+    path = str(tmp_path / "cache.pkl")
+    filled_cache(prices, assets, path)
+    optimizer = PortfolioOptimizer(prices, cache=OptimizerCache(path=path))
+    assert optimizer.cache.stats()['size'] == 1
+
+
+def test_reload_after_append_keeps_entries(prices, assets, tmp_path):
+    # 每日更新只在尾端加入新的天數，舊的估計區間結果仍然有效
+    path = str(tmp_path / "cache.pkl")
+    filled_cache(prices.iloc[:-20], assets, path)
+    optimizer = PortfolioOptimizer(prices, cache=OptimizerCache(path=path))
+    assert optimizer.cache.stats()['size'] == 1
+
+
+def test_reload_after_restatement_drops_entries(prices, assets, tmp_path):
+    path = str(tmp_path / "cache.pkl")
+    filled_cache(prices, assets, path)
+    restated = prices.copy()
+    restated.iloc[500, 1] *= 1.01
+    optimizer = PortfolioOptimizer(restated, cache=OptimizerCache(path=path))
+    assert optimizer.cache.stats()['size'] == 0
+
+
+def test_solver_version_change_drops_entries(prices, assets, tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.pkl")
+    filled_cache(prices, assets, path)
+    monkeypatch.setattr(optimizer_cache, "SOLVER_VERSION", optimizer_cache.SOLVER_VERSION + 1)
+    assert OptimizerCache(path=path).stats()['size'] == 0
+
+
+def test_legacy_cache_file_is_ignored(tmp_path):
+    path = str(tmp_path / "cache.pkl")
+    with open(path, "wb") as f:
+        pickle.dump([(("A0",), 0, 1, False), (None, None, None)], f)
+    assert OptimizerCache(path=path).stats()['size'] == 0
+
+
+def test_rebuild_clears_cache(prices, assets):
+    optimizer = PortfolioOptimizer(prices, cache=OptimizerCache())
+    optimizer.solve_by_position(100, 1400, assets)
+    optimizer.rebuild(prices * 1.0)
+    assert optimizer.cache.stats()['size'] == 0
+
+
+@pytest.mark.parametrize("estimator", ["sample", "ledoit_wolf"])
+def test_key_separates_estimators(estimator):
+    key = OptimizerCache.make_key(["A0", "A1"], 0, 1, False, estimator=estimator)
+    other = OptimizerCache.make_key(["A0", "A1"], 0, 1, False, estimator="oas")
+    assert key != other
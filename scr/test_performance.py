@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.performance import METRIC_NAMES, PerformanceEvaluator, compute_performance_metrics
+
+
+def naive_metrics(returns):
+    """
+    原本 PerformanceEvaluator 的逐項算法（pandas Series，每個指標各走一次）
+    """
+    returns = pd.Series(returns).dropna()
+    cumulative_nav = (1 + returns).cumprod()
+    annualized_return = cumulative_nav.iloc[-1] ** (252 / len(returns)) - 1
+    annualized_volatility = returns.std() * np.sqrt(252)
+    return {
+        'Annualized Return': annualized_return,
+        'Annualized Volatility': annualized_volatility,
+        'Sharpe Ratio': annualized_return / annualized_volatility,
+        'Max Drawdown': ((cumulative_nav - cumulative_nav.cummax()) / cumulative_nav.cummax()).min()
+    }
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(2)
+    values = rng.normal(0.0003, 0.012, (6, 400))
+    # 長度不一的 trial：尾端以 NaN 補齊
+    for i, n_days in enumerate([400, 399, 250, 3, 2, 1]):
+        values[i, n_days:] = np.nan
+    return values
+
+
+def test_series_matches_naive(matrix):
+    metrics = compute_performance_metrics(matrix[0])
+    for name, expected in naive_metrics(matrix[0]).items():
+        assert metrics[name] == pytest.approx(expected, rel=1e-10)
+
+
+@pytest.mark.parametrize("axis", [1, 0])
+def test_nan_padded_matrix_matches_per_row(matrix, axis):
+    data = matrix if axis == 1 else matrix.T
+    metrics = compute_performance_metrics(data, axis=axis)
+    for i, row in enumerate(matrix[:-1]):
+        for name, expected in naive_metrics(row).items():
+            assert metrics[name][i] == pytest.approx(expected, rel=1e-10), (i, name)
+
+    # 只有一天的 trial：報酬與回撤仍可計算，波動與 Sharpe 無定義
+    assert metrics['Annualized Return'][-1] == pytest.approx((1 + matrix[-1, 0]) ** 252 - 1)
+    assert np.isnan(metrics['Annualized Volatility'][-1]) and np.isnan(metrics['Sharpe Ratio'][-1])
+
+
+def test_empty_rows_are_nan():
+    metrics = compute_performance_metrics(np.full((2, 5), np.nan), axis=1)
+    for name in METRIC_NAMES:
+        assert np.isnan(metrics[name]).all()
+    assert all(np.isnan(compute_performance_metrics(np.empty((3, 0)), axis=1)[name]).all() for name in METRIC_NAMES)
+
+
+def test_zero_volatility_sharpe_is_nan():
+    assert np.isnan(compute_performance_metrics(np.zeros(10))['Sharpe Ratio'])
+
+
+def test_evaluator_summary_uses_kernel(matrix):
+    series = pd.Series(matrix[2])
+    summary = PerformanceEvaluator(series).summary()
+    for name, expected in naive_metrics(series).items():
+        assert summary[name] == pytest.approx(expected, rel=1e-10)
+    assert PerformanceEvaluator(series.to_frame()).compute_max_drawdown() == summary['Max Drawdown']
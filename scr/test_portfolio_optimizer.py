@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_estimate_parameters_matches_pandas(optimizer, assets):
+    subset = [assets[3], assets[0], assets[2]]
+    mu, sigma = optimizer.estimate_parameters("2003-05-01", "2006-05-01", subset)
+
+    window = optimizer.returns.loc["2003-05-01":"2006-05-01", subset]
+    pd.testing.assert_series_equal(mu, window.mean() * 252, rtol=1e-10, check_names=False)
+    pd.testing.assert_frame_equal(sigma, window.cov() * 252, rtol=1e-9, check_names=False)
+
+
+def sharpe(weights, mu, sigma):
+    return weights @ mu / np.sqrt(weights @ sigma @ weights)
+
+
+@pytest.fixture
+def moments(optimizer):
+    mu, sigma = optimizer.estimate_parameters_by_position(100, 1400)
+    return np.asarray(mu), np.asarray(sigma)
+
+
+def test_active_set_matches_slsqp(optimizer, moments):
+    mu, sigma = moments
+    exact = optimizer.optimize_portfolio(mu, sigma, method="active_set")
+    iterative = optimizer.optimize_portfolio(mu, sigma, method="slsqp")
+    assert np.all(exact >= 0) and np.isclose(exact.sum(), 1.0)
+    # active-set 是精確解，Sharpe 不會比 SLSQP 差
+    assert sharpe(exact, mu, sigma) >= sharpe(iterative, mu, sigma) - 1e-9
+    # SLSQP 只收斂到預設的 ftol，權重差在 1e-3 以內
+    np.testing.assert_allclose(exact, iterative, atol=1e-3)
+
+
+def test_active_set_with_binding_constraints(optimizer, moments):
+    # 把其中兩個資產的期望報酬壓到負值，最適解在這兩個資產的權重必須為 0
+    mu, sigma = moments
+    mu = mu.copy()
+    mu[[0, 2]] = -0.05
+    weights = optimizer.optimize_portfolio(mu, sigma)
+    assert weights[0] == 0 and weights[2] == 0
+    np.testing.assert_allclose(weights, optimizer.optimize_portfolio(mu, sigma, method="slsqp"), atol=1e-3)
+
+
+@pytest.mark.parametrize("method, atol", [("active_set", 1e-10), ("slsqp", 1e-3)])
+def test_warm_start_does_not_change_solution(optimizer, moments, method, atol):
+    mu, sigma = moments
+    cold = optimizer.optimize_portfolio(mu, sigma, method=method)
+    warm = optimizer.optimize_portfolio(mu, sigma, method=method, initial_weights=np.roll(cold, 1))
+    np.testing.assert_allclose(warm, cold, atol=atol)
+
+
+def test_all_negative_mu_falls_back_to_slsqp(optimizer, moments):
+    mu, sigma = moments
+    weights = optimizer.optimize_portfolio(-np.abs(mu) - 0.01, sigma)
+    assert np.all(weights >= -1e-12) and np.isclose(weights.sum(), 1.0)
+
+
+def test_unknown_method_is_rejected(optimizer, moments):
+    with pytest.raises(ValueError):
+        optimizer.optimize_portfolio(*moments, method="newton")
+
+
+def test_price_gap_only_skips_two_days(gap_prices, assets):
+    # 與原本對整張表 dropna 相同，只少缺值那天與隔天的報酬，不會截掉缺值前的歷史
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    optimizer = PortfolioOptimizer(gap_prices)
+    asset_idx = optimizer.get_asset_positions(assets)
+    assert optimizer.get_valid_range(assets) == (0, 2799)
+    np.testing.assert_array_equal(optimizer.availability.holes(asset_idx), [1499, 1500])
+    assert optimizer.get_valid_range(assets[:2]) == (0, 2799)
+    assert len(optimizer.availability.holes(optimizer.get_asset_positions(assets[:2]))) == 0
+
+
+def test_estimates_across_gap_match_dropna(gap_prices, assets):
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    optimizer = PortfolioOptimizer(gap_prices)
+    mu, sigma = optimizer.estimate_parameters("2004-01-01", "2007-01-01", assets)
+    window = optimizer.returns.loc["2004-01-01":"2007-01-01", assets].dropna()
+    pd.testing.assert_series_equal(mu, window.mean() * 252, rtol=1e-10, check_names=False)
+    pd.testing.assert_frame_equal(sigma, window.cov() * 252, rtol=1e-9, check_names=False)
+
+    growth = optimizer.get_window_return("2004-01-01", "2007-01-01", assets)
+    pd.testing.assert_series_equal(growth, (1 + window).prod() - 1, rtol=1e-10, check_names=False)
+
+
+def test_extend_matches_rebuild(gap_prices, assets):
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    prices = gap_prices.copy()
+    prices.iloc[:300, 3] = np.nan  # 晚上市的資產
+    grown = PortfolioOptimizer(prices.iloc[:1500])
+    for lo, hi in [(1500, 1501), (1501, 1800), (1800, 1801), (1801, 2800)]:
+        grown.extend(prices.iloc[lo:hi])  # 第一段就從缺值那天開始
+    rebuilt = PortfolioOptimizer(prices)
+
+    pd.testing.assert_frame_equal(grown.returns, rebuilt.returns, check_freq=False)
+    for window in [(300, 2799), (1400, 1600), (1700, 1900), (2100, 2500)]:
+        for got, expected in zip(grown.estimate_parameters_by_position(*window),
+                                 rebuilt.estimate_parameters_by_position(*window)):
+            np.testing.assert_allclose(np.asarray(got), np.asarray(expected), rtol=1e-9)
+    np.testing.assert_allclose(grown.nav_index.log_nav, rebuilt.nav_index.log_nav, rtol=1e-12)
+    assert grown.get_valid_range(assets) == rebuilt.get_valid_range(assets)
+
+
+def test_extend_rejects_old_dates(optimizer, prices):
+    with pytest.raises(ValueError):
+        optimizer.extend(prices.iloc[-3:])
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scr.prepare_data import ETFDataLoader
+
+
+def naive_load(data_dir, files):
+    """
+    原本的讀法：整個 CSV 讀進來、自動推斷型別與日期格式，再以 Date outer join
+    """
+    frames = []
+    for etf_code, filename in files.items():
+        df = pd.read_csv(os.path.join(data_dir, filename))
+        df = df[['Date', 'Adj Close']].rename(columns={'Adj Close': etf_code})
+        df['Date'] = pd.to_datetime(df['Date'])
+        frames.append(df.set_index('Date'))
+    return pd.concat(frames, axis=1, join='outer').sort_index()
+
+
+@pytest.mark.parametrize("chunksize", [None, 37])
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_load_matches_naive_read(csv_dir, chunksize, max_workers):
+    data_dir, files = csv_dir
+    loaded = ETFDataLoader(files, data_dir=str(data_dir), max_workers=max_workers, chunksize=chunksize).price_df
+    pd.testing.assert_frame_equal(loaded, naive_load(data_dir, files))
+    assert (loaded.dtypes == np.float64).all()
+
+
+def test_null_prices_and_late_listing_become_nan(csv_dir, prices):
+    data_dir, files = csv_dir
+    loaded = ETFDataLoader(files, data_dir=str(data_dir)).price_df
+    assert np.isnan(loaded.loc[prices.index[120], "A0"])
+    assert loaded["A1"].iloc[:30].isna().all() and loaded["A1"].iloc[30:].notna().all()
+
+
+def test_missing_file_raises(csv_dir):
+    data_dir, files = csv_dir
+    with pytest.raises(FileNotFoundError):
+        ETFDataLoader(dict(files, A9="A9.csv"), data_dir=str(data_dir))
+
+
+def test_unexpected_date_format_is_rejected(csv_dir):
+    # 日期格式固定為 %Y-%m-%d，格式不符時直接報錯，而不是默默推斷成別的日期
+    data_dir, files = csv_dir
+    with open(os.path.join(data_dir, "BAD.csv"), "w", encoding="utf-8") as f:
+        f.write("Date,Open,High,Low,Close,Adj Close,Volume\n05/13/1996,1,1,1,1,1.0,0\n")
+    with pytest.raises(ValueError):
+        ETFDataLoader({"BAD": "BAD.csv"}, data_dir=str(data_dir))
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scr.prepare_data import ETFDataLoader
+from scr.price_store import PriceStore
+
+
+@pytest.fixture
+def source_paths(csv_dir):
+    data_dir, files = csv_dir
+    return {code: os.path.join(data_dir, name) for code, name in files.items()}
+
+
+def test_write_then_load_roundtrip(tmp_path, prices, source_paths):
+    frame = prices.iloc[:200, :3].copy()
+    frame.iloc[5:9, 1] = np.nan
+    store = PriceStore(tmp_path / "store")
+    store.write(frame, source_paths)
+    frame.index = frame.index.as_unit('ns')  # 快取一律存成 ns 日期
+
+    for mmap in (True, False):
+        loaded = store.load(mmap=mmap)
+        pd.testing.assert_frame_equal(loaded, frame, check_freq=False)
+    assert isinstance(np.load(store.prices_path, mmap_mode='r'), np.memmap)
+
+
+def test_store_is_invalidated_when_a_source_changes(tmp_path, prices, source_paths):
+    store = PriceStore(tmp_path / "store")
+    store.write(prices.iloc[:10, :3], source_paths)
+    assert store.is_valid(source_paths)
+
+    # 只改 mtime、內容不變：仍然有效，且 manifest 換成新的 mtime
+    path = source_paths["A0"]
+    os.utime(path, ns=(0, 10 ** 9))
+    assert store.is_valid(source_paths)
+    assert store.read_manifest()['sources']["A0"]['mtime_ns'] == 10 ** 9
+
+    # 大小不變但內容改了：依 sha1 判定失效
+    with open(path, "r+b") as f:
+        f.seek(-5, os.SEEK_END)
+        digit = f.read(1)
+        f.seek(-5, os.SEEK_END)
+        f.write(b"1" if digit != b"1" else b"2")
+    os.utime(path, ns=(0, 2 * 10 ** 9))
+    assert not store.is_valid(source_paths)
+
+
+def test_store_is_invalidated_when_columns_change(tmp_path, prices, source_paths):
+    store = PriceStore(tmp_path / "store")
+    store.write(prices.iloc[:10, :3], source_paths)
+    reordered = dict(reversed(list(source_paths.items())))
+    assert not store.is_valid(reordered)
+
+
+def test_append_npy_extends_in_place(tmp_path):
+    path = str(tmp_path / "array.npy")
+    np.save(path, np.arange(6, dtype=np.float64).reshape(3, 2))
+    PriceStore._append_npy(path, np.array([[6.0, 7.0]]))
+    np.testing.assert_array_equal(np.load(path), np.arange(8, dtype=np.float64).reshape(4, 2))
+    with pytest.raises(ValueError):
+        PriceStore._append_npy(path, np.zeros((1, 3)))
+
+
+def test_loader_reads_store_on_second_run(csv_dir, tmp_path, monkeypatch):
+    data_dir, files = csv_dir
+    cache_dir = str(tmp_path / "store")
+    first = ETFDataLoader(files, data_dir=str(data_dir), cache_dir=cache_dir).price_df
+
+    # 第二次不可再解析 CSV
+    def fail(*args, **kwargs):
+        raise AssertionError("CSV 不應被重新讀取")
+    monkeypatch.setattr(ETFDataLoader, "load_csv", fail)
+    second = ETFDataLoader(files, data_dir=str(data_dir), cache_dir=cache_dir).price_df
+    first.index = first.index.as_unit('ns')
+    pd.testing.assert_frame_equal(second, first, check_freq=False)
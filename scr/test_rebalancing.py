@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.rebalancing import drift_block, parse_rebalance_freq, rebalance_offset
+
+
+def naive_drift(returns, target, holdings=None, cost_rate=0.0, fixed_cost=0.0, nav=1.0, threshold=None,
+                rebalance=True):
+    """
+    逐日模擬的參考版本：交易日調整到 target 並扣成本，之後每天按各資產報酬更新權重
+    """
+    trade = rebalance
+    portfolio_returns = []
+    n_trades, total_turnover = 0, 0.0
+    for day in returns:
+        cost = 0.0
+        if trade:
+            turnover = np.abs(target - (0 if holdings is None else holdings)).sum()
+            if turnover > 0:
+                cost = min(cost_rate * turnover + fixed_cost / nav, 1.0)
+                n_trades += 1
+                total_turnover += turnover
+            holdings = target
+        growth = holdings * (1 + day)
+        daily = (1 - cost) * growth.sum() - 1
+        holdings = growth / growth.sum()
+        nav *= 1 + daily
+        portfolio_returns.append(daily)
+        trade = threshold is not None and np.abs(holdings - target).max() > threshold
+    return np.array(portfolio_returns), holdings, nav, n_trades, total_turnover
+
+
+@pytest.fixture
+def block():
+    rng = np.random.default_rng(3)
+    return rng.normal(0.0004, 0.02, (250, 4))
+
+
+@pytest.fixture
+def target():
+    return np.array([0.1, 0.2, 0.3, 0.4])
+
+
+def assert_same(got, expected):
+    np.testing.assert_allclose(got[0], expected[0], rtol=1e-9, atol=1e-13)
+    np.testing.assert_allclose(got[1], expected[1], rtol=1e-9)
+    assert got[2] == pytest.approx(expected[2], rel=1e-9)
+    assert got[3] == expected[3]
+    assert got[4] == pytest.approx(expected[4], rel=1e-9)
+
+
+@pytest.mark.parametrize("threshold", [None, 0.02, 0.05])
+@pytest.mark.parametrize("holdings", [None, np.array([0.25, 0.25, 0.25, 0.25])])
+def test_matches_daily_loop(block, target, threshold, holdings):
+    kwargs = dict(cost_rate=0.001, fixed_cost=5.0, nav=10000.0, threshold=threshold)
+    assert_same(drift_block(block, target, holdings, **kwargs), naive_drift(block, target, holdings, **kwargs))
+
+
+@pytest.mark.parametrize("split", [1, 37, 249])
+def test_continuation_matches_single_block(block, target, split):
+    # 同一段 rebalance 區間分成兩次計算，第二次接著漂移、不重新交易
+    kwargs = dict(cost_rate=0.001, fixed_cost=5.0, threshold=0.03)
+    whole = drift_block(block, target, nav=10000.0, **kwargs)
+    head, holdings, nav, trades, turnover = drift_block(block[:split], target, nav=10000.0, **kwargs)
+    tail = drift_block(block[split:], target, holdings, nav=nav, rebalance=False, **kwargs)
+    assert_same(tail, naive_drift(block[split:], target, holdings, nav=nav, rebalance=False, **kwargs))
+
+    if np.abs(holdings - target).max() <= kwargs['threshold']:
+        np.testing.assert_allclose(np.concatenate([head, tail[0]]), whole[0], rtol=1e-9, atol=1e-13)
+        assert trades + tail[3] == whole[3]
+
+
+def test_continuation_needs_holdings(block, target):
+    with pytest.raises(ValueError):
+        drift_block(block, target, rebalance=False)
+
+
+def test_empty_block_keeps_state(target):
+    returns, holdings, nav, trades, turnover = drift_block(np.empty((0, 4)), target, nav=3.0)
+    assert len(returns) == 0 and holdings is None and nav == 3.0 and trades == 0
+
+
+@pytest.mark.parametrize("freq, expected", [("6M", ("months", 6)), ("q", ("months", 3)), ("1Y", ("years", 1)),
+                                            ("2W", ("weeks", 2))])
+def test_parse_rebalance_freq(freq, expected):
+    assert parse_rebalance_freq(freq) == expected
+
+
+@pytest.mark.parametrize("freq", ["0M", "6X", "", "M6"])
+def test_parse_rebalance_freq_rejects(freq):
+    with pytest.raises(ValueError):
+        parse_rebalance_freq(freq)
+
+
+def test_rebalance_offset_does_not_accumulate_month_ends():
+    start = pd.Timestamp("2020-01-31")
+    assert start + rebalance_offset("1M", 2) == pd.Timestamp("2020-03-31")
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scr.result_reporter import METRICS, ResultReporter
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("seaborn")
+
+
+@pytest.fixture
+def summary_df():
+    rng = np.random.default_rng(8)
+    rows = []
+    for years in (3, 5):
+        for mode in ("optimal", "equal", "historical"):
+            for trial in range(1, 6):
+                rows.append({'Mode': mode, 'Years': years, 'Trial': trial,
+                             **{metric: rng.normal() for metric in METRICS}})
+    return pd.DataFrame(rows)
+
+
+def redrawn(capsys):
+    out = capsys.readouterr().out
+    return int(out.split("重畫 ")[1].split(" 張圖")[0])
+
+
+def test_import_does_not_load_matplotlib():
+    code = "import sys; import scr.result_reporter; print('matplotlib' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert result.stdout.strip() == "False"
+
+
+def test_export_writes_tables_and_charts(summary_df, tmp_path, capsys):
+    reporter = ResultReporter(summary_df, headless=True)
+    reporter.export_all_outputs(str(tmp_path))
+    assert redrawn(capsys) == 5
+
+    table = pd.read_csv(tmp_path / "summary_table.csv")
+    expected = summary_df.groupby(["Mode", "Years"])[METRICS].mean().reset_index().round(4)
+    pd.testing.assert_frame_equal(table, expected)
+    for spec in reporter.chart_specs(str(tmp_path)):
+        assert os.path.getsize(spec['path']) > 0
+
+
+def test_unchanged_charts_are_not_redrawn(summary_df, tmp_path, capsys):
+    ResultReporter(summary_df, headless=True).export_all_outputs(str(tmp_path))
+    capsys.readouterr()
+
+    ResultReporter(summary_df, headless=True).export_all_outputs(str(tmp_path))
+    assert redrawn(capsys) == 0
+
+    # 只動 Sharpe Ratio：它的 bar chart 與 boxplot 重畫，其餘沿用
+    changed = summary_df.copy()
+    changed.loc[0, "Sharpe Ratio"] += 1
+    ResultReporter(changed, headless=True).export_all_outputs(str(tmp_path))
+    assert redrawn(capsys) == 2
+
+    ResultReporter(changed, headless=True).export_all_outputs(str(tmp_path), force=True)
+    assert redrawn(capsys) == 5
+
+
+def test_serial_export_keeps_the_backend(summary_df, tmp_path, capsys):
+    # 依序匯出在目前的 process 畫圖，不能把呼叫端的 backend 換成 Agg
+    import matplotlib
+    original = matplotlib.get_backend()
+    matplotlib.use("svg")
+    try:
+        ResultReporter(summary_df).export_all_outputs(str(tmp_path))
+        assert matplotlib.get_backend() == "svg"
+    finally:
+        matplotlib.use(original)
+    assert redrawn(capsys) == 5
+
+
+def test_parallel_export_matches_serial(summary_df, tmp_path, capsys):
+    ResultReporter(summary_df, headless=True).export_all_outputs(str(tmp_path / "serial"))
+    ResultReporter(summary_df, headless=True).export_all_outputs(str(tmp_path / "parallel"), workers=2)
+    capsys.readouterr()
+    assert sorted(os.listdir(tmp_path / "serial")) == sorted(os.listdir(tmp_path / "parallel"))
+
+
+def test_headless_plots_do_not_block(summary_df):
+    reporter = ResultReporter(summary_df.assign(Label=summary_df["Mode"]), headless=True)
+    reporter.plot_avg_metrics_by_year()
+    reporter.plot_boxplot_by_year("Sharpe Ratio")
+    reporter.plot_boxplot_by_label("Sharpe Ratio")
+    reporter.plot_trial_lines_by_year()
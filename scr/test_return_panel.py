@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.return_panel import ReturnPanel
+
+
+@pytest.fixture
+def returns(prices):
+    return prices.pct_change(fill_method=None).iloc[1:]
+
+
+def test_frame_roundtrip_without_copy(returns):
+    panel = ReturnPanel.from_frame(returns)
+    frame = panel.to_frame()
+    pd.testing.assert_frame_equal(frame, returns, check_freq=False, check_index_type=False)
+    assert panel.index.dtype == np.dtype('datetime64[ns]')
+    assert np.shares_memory(frame.to_numpy(), panel.values)
+    assert np.shares_memory(ReturnPanel.from_frame(frame).values, panel.values)
+
+
+def test_float32_panel(returns):
+    panel = ReturnPanel.from_frame(returns.astype(np.float32))
+    assert panel.dtype == np.float32 and panel.nbytes == panel.values.nbytes + panel.dates.nbytes
+    np.testing.assert_allclose(panel.values, returns.to_numpy(), rtol=1e-6)
+
+
+def test_positions_and_searchsorted(returns):
+    panel = ReturnPanel.from_frame(returns)
+    np.testing.assert_array_equal(panel.positions(["A3", "A0"]), [3, 0])
+    with pytest.raises(KeyError):
+        panel.positions(["A0", "ZZZ"])
+
+    assert panel.searchsorted(returns.index[10]) == 10
+    assert panel.searchsorted(returns.index[10], side='right') == 11
+    # 非交易日落在下一個交易日之前
+    saturday = returns.index[10] + pd.Timedelta(days=(5 - returns.index[10].weekday()) % 7 or 7)
+    assert panel.searchsorted(saturday) == panel.searchsorted(saturday, side='right')
+    np.testing.assert_array_equal(panel.searchsorted(returns.index[[3, 5]]), [3, 5])
+
+
+def test_window_and_expand_weights(returns):
+    panel = ReturnPanel.from_frame(returns)
+    assert np.shares_memory(panel.window(10, 50), panel.values)
+    asset_idx = np.array([4, 1])
+    weights = np.array([0.7, 0.3])
+    full = panel.expand_weights(weights, asset_idx)
+    np.testing.assert_array_equal(full, [0, 0.3, 0, 0, 0.7])
+    np.testing.assert_allclose(panel.window(10, 50) @ full, panel.window(10, 50, asset_idx) @ weights, rtol=1e-14)
+
+
+def test_append_keeps_existing_views(returns):
+    panel = ReturnPanel.from_frame(returns.iloc[:100])
+    view = panel.values
+    for lo, hi in [(100, 101), (101, 400)]:
+        panel.append(returns.to_numpy()[lo:hi], returns.index[lo:hi])
+    np.testing.assert_array_equal(view, returns.to_numpy()[:100])
+    np.testing.assert_array_equal(panel.values, returns.to_numpy()[:400])
+    assert panel.index.equals(returns.index[:400].as_unit('ns'))
+
+    with pytest.raises(ValueError):
+        panel.append(returns.to_numpy()[:1], returns.index[:1])
+    with pytest.raises(ValueError):
+        panel.append(returns.to_numpy()[400:402], returns.index[400:401])
+
+
+def test_dates_must_increase(returns):
+    with pytest.raises(ValueError):
+        ReturnPanel(returns.to_numpy()[:3], returns.index[[0, 2, 1]], returns.columns)
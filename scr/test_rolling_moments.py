@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scr.rolling_moments import RollingMoments
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(1)
+    return rng.normal(0.0004, 0.01, (600, 4))
+
+
+def reference(values, start_pos, end_pos, asset_idx=None):
+    block = values[start_pos:end_pos] if asset_idx is None else values[start_pos:end_pos][:, asset_idx]
+    return block.mean(axis=0), np.cov(block, rowvar=False)
+
+
+@pytest.mark.parametrize("max_bytes", [256 * 2 ** 20, 4000])
+@pytest.mark.parametrize("window", [(0, 600), (17, 250), (333, 335), (599 - 126, 599)])
+def test_window_matches_numpy(values, max_bytes, window):
+    # max_bytes 很小時改成每 stride 天一個 checkpoint，結果必須相同
+    moments = RollingMoments(values, max_bytes=max_bytes)
+    mean, cov = moments.window(*window)
+    expected_mean, expected_cov = reference(values, *window)
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-10, atol=1e-15)
+    np.testing.assert_allclose(cov, expected_cov, rtol=1e-9, atol=1e-15)
+
+
+def test_stride_is_used_when_memory_is_limited(values):
+    assert RollingMoments(values, max_bytes=4000).stride > 1
+
+
+def test_asset_subset(values):
+    moments = RollingMoments(values)
+    mean, cov = moments.window(50, 400, [3, 1])
+    expected_mean, expected_cov = reference(values, 50, 400, [3, 1])
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-10)
+    np.testing.assert_allclose(cov, expected_cov, rtol=1e-9)
+
+
+def test_window_needs_two_observations(values):
+    with pytest.raises(ValueError):
+        RollingMoments(values).window(10, 11)
+
+
+@pytest.mark.parametrize("max_bytes", [256 * 2 ** 20, 4000])
+def test_extend_matches_rebuild(values, max_bytes):
+    moments = RollingMoments(values[:400], max_bytes=max_bytes)
+    moments.extend(values[400:401])
+    moments.extend(values[401:])
+    rebuilt = RollingMoments(values, max_bytes=max_bytes)
+    for window in [(0, 600), (380, 420), (450, 599)]:
+        for got, expected in zip(moments.window(*window), rebuilt.window(*window)):
+            np.testing.assert_allclose(got, expected, rtol=1e-9, atol=1e-15)
+
+
+def test_nan_is_excluded_inside_valid_window(values):
+    # 資產還沒有資料的日子是 NaN：只要查詢落在有資料的區間，結果與沒有 NaN 時相同
+    with_gaps = values.copy()
+    with_gaps[:100, 2] = np.nan
+    mean, cov = RollingMoments(with_gaps).window(100, 600)
+    expected_mean, expected_cov = reference(values, 100, 600)
+    np.testing.assert_allclose(mean, expected_mean, rtol=1e-10)
+    np.testing.assert_allclose(cov, expected_cov, rtol=1e-9)
+
+
+@pytest.mark.parametrize("max_bytes", [256 * 2 ** 20, 4000])
+def test_excluded_rows_match_dropna(values, max_bytes):
+    # 區間中某檔資產缺值的日子整列扣掉，結果與先 dropna 再計算相同（也與 shift 無關）
+    with_gaps = values.copy()
+    with_gaps[[200, 201], 2] = np.nan
+    exclude = np.array([200, 201])
+    expected = reference(np.delete(values, exclude, axis=0), 100, 498)
+
+    grown = RollingMoments(with_gaps[:150], max_bytes=max_bytes)
+    grown.extend(with_gaps[150:])
+    for moments in (RollingMoments(with_gaps, max_bytes=max_bytes), grown):
+        mean, cov = moments.window(100, 500, exclude=exclude)
+        np.testing.assert_allclose(mean, expected[0], rtol=1e-10)
+        np.testing.assert_allclose(cov, expected[1], rtol=1e-9)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.performance import METRIC_NAMES, compute_performance_metrics
+from scr.scenario import ScenarioGenerator
+
+WEIGHTS = {'equal': np.full(5, 0.2), 'tilted': np.array([0.1, 0.1, 0.2, 0.3, 0.3])}
+
+
+def test_results_do_not_depend_on_memory_budget(optimizer, assets):
+    # 預算很小時每批只評估 paths_per_seed 條路徑，抽出的路徑與一次評估全部時相同
+    large = ScenarioGenerator(optimizer, assets, seed=11, paths_per_seed=16).run(WEIGHTS, n_paths=70, horizon_years=1)
+    small = ScenarioGenerator(optimizer, assets, seed=11, paths_per_seed=16, memory_budget_mb=0.01)
+    assert small._chunk_paths(252) == 16
+    pd.testing.assert_frame_equal(small.run(WEIGHTS, n_paths=70, horizon_years=1), large)
+
+
+def test_spawned_seeds_give_different_paths(optimizer, assets):
+    # SeedSequence.spawn() 的兄弟種子 entropy 相同、只有 spawn_key 不同，不能抽出同一批路徑
+    first, second = np.random.SeedSequence(5).spawn(2)
+    tables = [ScenarioGenerator(optimizer, assets, seed=seed).run(WEIGHTS, n_paths=20, horizon_years=1)
+              for seed in (first, second)]
+    assert not np.allclose(tables[0][METRIC_NAMES].to_numpy(), tables[1][METRIC_NAMES].to_numpy())
+
+    again = ScenarioGenerator(optimizer, assets, seed=np.random.SeedSequence(5).spawn(2)[0])
+    pd.testing.assert_frame_equal(again.run(WEIGHTS, n_paths=20, horizon_years=1), tables[0])
+
+
+@pytest.mark.parametrize("method", ["stationary", "block"])
+def test_metrics_match_sampled_paths(optimizer, assets, method):
+    generator = ScenarioGenerator(optimizer, assets, method=method, seed=2)
+    (_, metrics, paths), = generator.iter_chunks(WEIGHTS, 10, 300, keep_paths=True)
+
+    lo, hi = optimizer.get_valid_range(asset_idx=generator.asset_idx)
+    history = optimizer.panel.window(lo, hi, generator.asset_idx) @ WEIGHTS['tilted']
+    for path in paths['tilted']:
+        # 每條路徑都是由歷史日報酬組成
+        assert np.abs(path[:, None] - history[None, :]).min(axis=1).max() < 1e-15
+    expected = compute_performance_metrics(paths['tilted'], axis=1)
+    for name in METRIC_NAMES:
+        np.testing.assert_allclose(metrics['tilted'][name], expected[name], rtol=1e-12)
+
+
+def test_block_method_keeps_consecutive_days(optimizer, assets):
+    generator = ScenarioGenerator(optimizer, assets, method="block", block_length=10)
+    indices = generator.sample_indices(np.random.default_rng(0), 4, 95)
+    assert indices.shape == (4, 95)
+    blocks = indices[:, :90].reshape(4, 9, 10)
+    np.testing.assert_array_equal(np.diff(blocks, axis=2), 1)
+
+
+def test_stationary_indices_stay_in_valid_range(optimizer, assets):
+    generator = ScenarioGenerator(optimizer, assets, block_length=5)
+    lo, hi = optimizer.get_valid_range(asset_idx=generator.asset_idx)
+    indices = generator.sample_indices(np.random.default_rng(0), 50, 500)
+    assert indices.min() >= 0 and indices.max() < hi - lo
+    # 平均區塊長度接近 block_length
+    assert np.mean(np.diff(indices, axis=1) != 1) == pytest.approx(1 / 5, abs=0.02)
+
+
+def test_strategy_names_are_solved_on_recent_history(optimizer, assets):
+    weights = ScenarioGenerator(optimizer, assets).strategy_weights(("equal", "max_sharpe"))
+    np.testing.assert_allclose(weights['equal'], np.full(5, 0.2))
+    assert np.isclose(weights['max_sharpe'].sum(), 1.0) and (weights['max_sharpe'] >= -1e-12).all()
+
+
+@pytest.mark.parametrize("kwargs", [dict(method="iid"), dict(block_length=0)])
+def test_invalid_settings_are_rejected(optimizer, assets, kwargs):
+    with pytest.raises(ValueError):
+        ScenarioGenerator(optimizer, assets, **kwargs)
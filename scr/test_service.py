@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from scr.backtester import Backtester
+from scr.performance import compute_performance_metrics
+from scr.service import JobService, job_key, normalize_job
+
+BACKTEST = {'type': "backtest", 'assets': ["A0", "A1", "A2"], 'start_date': "2006-03-15",
+            'end_date': "2008-03-14"}
+SIMULATE = {'type': "simulate", 'assets': ["A0", "A1", "A2"], 'trials': 3, 'seed': 1}
+ROLLING = {**SIMULATE, 'sampling': "rolling", 'step': 5}
+
+
+def test_defaults_are_filled():
+    job = normalize_job(SIMULATE)
+    assert job == {'type': "simulate", 'assets': ["A0", "A1", "A2"], 'mode': "optimal", 'years': 3, 'trials': 3,
+                   'sampling': "random", 'step': 1, 'seed': 1, 'rebalance_freq': "6M", 'lookback_years': 5}
+
+
+@pytest.mark.parametrize("base, variant", [
+    (SIMULATE, {'trials': "3", 'seed': 1.0, 'years': 3.0}),
+    (SIMULATE, {'rebalance_freq': "6m", 'lookback_years': "5"}),
+    (SIMULATE, {'step': 1, 'sampling': "random", 'mode': "optimal"}),
+    # Simulator 在 random 模式不看 step、rolling 模式不看 trials 與 seed
+    (SIMULATE, {'step': 5}),
+    (ROLLING, {'trials': 50, 'seed': 7}),
+    (ROLLING, {'trials': None, 'seed': None}),
+])
+def test_equivalent_requests_share_a_key(base, variant):
+    # 欄位順序、省略預設值、數字的寫法、用不到的欄位都不影響 key
+    data_version = {'days': 10}
+    expected = job_key(normalize_job(base), data_version)
+    assert job_key(normalize_job({**dict(reversed(list(base.items()))), **variant}), data_version) == expected
+
+
+def test_rolling_key_changes_with_step():
+    assert job_key(normalize_job({**ROLLING, 'step': 10}), {}) != job_key(normalize_job(ROLLING), {})
+    with pytest.raises(ValueError):
+        normalize_job({**ROLLING, 'trials': 0})
+
+
+def test_equivalent_frequencies_share_a_key():
+    quarterly = normalize_job({**BACKTEST, 'rebalance_freq': "q"})
+    assert quarterly['rebalance_freq'] == "3M"
+    assert job_key(quarterly, {}) == job_key(normalize_job({**BACKTEST, 'rebalance_freq': "3M"}), {})
+
+
+def test_key_changes_with_job_and_data():
+    job = normalize_job(BACKTEST)
+    assert job_key(job, {'days': 10}) != job_key(job, {'days': 11})
+    assert job_key(job, {'days': 10}) != job_key(normalize_job({**BACKTEST, 'lookback_years': 3}), {'days': 10})
+
+
+@pytest.mark.parametrize("field, value", [
+    ('trials', 0), ('trials', -2), ('trials', 2.5), ('trials', True), ('trials', "abc"), ('trials', float("nan")),
+    ('years', 0), ('step', "1.5"), ('seed', -1), ('lookback_years', 0), ('sampling', "bootstrap"),
+    ('rebalance_freq', "6X"), ('rebalance_freq', "0M"), ('mode', "best"), ('assets', []), ('assets', "A0"),
+    ('color', "red"),
+])
+def test_invalid_simulate_fields_are_rejected(field, value):
+    with pytest.raises(ValueError):
+        normalize_job({**SIMULATE, field: value})
+
+
+@pytest.mark.parametrize("field, value", [
+    ('lookback_years', "five"), ('end_date', "2005-01-01"), ('start_date', "not a date"), ('allow_short', "yes"),
+    ('mode', "historical"),
+])
+def test_invalid_backtest_fields_are_rejected(field, value):
+    with pytest.raises(ValueError):
+        normalize_job({**BACKTEST, field: value})
+
+
+@pytest.mark.parametrize("job", [None, [], {'type': "optimize"}, {'type': "backtest", 'assets': ["A0"]}])
+def test_malformed_jobs_are_rejected(job):
+    with pytest.raises(ValueError):
+        normalize_job(job)
+
+
+def run_service(optimizer, coroutine):
+    async def main():
+        service = JobService(optimizer, queue_size=4)
+        await service.start()
+        try:
+            return service, await coroutine(service)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+def test_submit_matches_backtester_and_caches(optimizer):
+    async def submit_twice(service):
+        first = await service.submit(BACKTEST)
+        second = await service.submit({**BACKTEST, 'mode': "optimal", 'lookback_years': "5"})
+        return first, second
+
+    service, (first, second) = run_service(optimizer, submit_twice)
+    assert first[0] == second[0] and not first[2] and second[2]
+    assert service.hits == 1 and service.misses == 1
+
+    returns = Backtester(optimizer, BACKTEST['assets']).run_backtest(BACKTEST['start_date'], BACKTEST['end_date'])
+    expected = compute_performance_metrics(returns.to_numpy())
+    assert first[1]['days'] == len(returns)
+    for name, value in expected.items():
+        assert first[1]['metrics'][name] == pytest.approx(value, rel=1e-12)
+
+
+def test_invalid_request_returns_400_without_queueing(optimizer):
+    async def post(service):
+        return await service._route("POST", "/jobs", json.dumps({**SIMULATE, 'trials': 0}).encode())
+
+    service, (status, payload) = run_service(optimizer, post)
+    assert status == 400 and "trials" in payload['error']
+    assert service.misses == 0 and not service.results
+
+
+def test_concurrent_duplicates_run_once(optimizer):
+    async def submit_together(service):
+        return await asyncio.gather(service.submit(SIMULATE), service.submit({**SIMULATE, 'trials': "3"}))
+
+    service, results = run_service(optimizer, submit_together)
+    assert results[0][0] == results[1][0]
+    assert len(service.results) == 1
+    np.testing.assert_equal(results[0][1], results[1][1])
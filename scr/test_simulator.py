@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.backtester import Backtester
+from scr.performance import PerformanceEvaluator
+from scr.simulator import Simulator
+
+
+def make_simulator(optimizer, assets, **kwargs):
+    return Simulator(optimizer, Backtester(optimizer, assets), assets, **kwargs)
+
+
+def test_same_seed_selects_same_start_dates(optimizer, assets):
+    first = make_simulator(optimizer, assets, n_trials=10, seed=7).get_valid_start_dates()
+    second = make_simulator(optimizer, assets, n_trials=10, seed=7).get_valid_start_dates()
+    other = make_simulator(optimizer, assets, n_trials=10, seed=8).get_valid_start_dates()
+    pd.testing.assert_index_equal(first, second)
+    assert not first.equals(other)
+
+
+def test_parallel_grid_matches_serial(optimizer, assets):
+    # 起始日在主 process 抽好，chunk 切法與 workers 數量無關，結果必須逐筆相同
+    options = dict(n_trials=9, seed=3, chunk_size=4)
+    serial = make_simulator(optimizer, assets, **options).run_grid(horizons=(3,))
+    parallel = make_simulator(optimizer, assets, workers=2, **options).run_grid(horizons=(3,))
+    pd.testing.assert_frame_equal(parallel, serial, rtol=1e-12)
+
+
+def test_parallel_stream_matches_serial(optimizer, assets):
+    options = dict(n_trials=6, seed=5, chunk_size=4)
+    serial = list(make_simulator(optimizer, assets, **options).iter_grid(modes=("optimal",), horizons=(3,),
+                                                                           keep_paths=True))
+    parallel = list(make_simulator(optimizer, assets, workers=2, **options).iter_grid(modes=("optimal",),
+                                                                                      horizons=(3,), keep_paths=True))
+    assert len(parallel) == len(serial) == 6
+    for got, expected in zip(parallel, serial):
+        np.testing.assert_allclose(got.pop('Path'), expected.pop('Path'), rtol=1e-12)
+        assert got == expected
+
+
+def test_rolling_enumerates_every_step_th_valid_start(optimizer, assets):
+    everything = make_simulator(optimizer, assets, sampling="rolling").get_valid_start_dates(holding_years=3)
+    stepped = make_simulator(optimizer, assets, sampling="rolling", step=5).get_valid_start_dates(holding_years=3)
+    pd.testing.assert_index_equal(stepped, everything[::5])
+
+    index = optimizer.panel.index
+    assert everything[0] == index[index >= index[0] + pd.DateOffset(years=5)][0]
+    assert everything[-1] == index[index <= index[-1] - pd.DateOffset(years=3)][-1]
+    assert everything.isin(index).all()
+
+
+def test_rolling_trials_match_individual_runs(optimizer, assets):
+    simulator = make_simulator(optimizer, assets, sampling="rolling", step=40)
+    table = simulator.run_and_summarize(mode="optimal", holding_years=3)
+    assert len(table) == len(simulator.start_dates)
+
+    for i in range(0, len(table), 7):
+        start_date = simulator.start_dates[i]
+        single = Backtester(optimizer, assets).run_backtest(start_date, start_date + pd.DateOffset(years=3))
+        expected = PerformanceEvaluator(single).summary()
+        for name, value in expected.items():
+            assert table.iloc[i][name] == pytest.approx(value, rel=1e-9)
+
+
+def test_unknown_sampling_is_rejected(optimizer, assets):
+    with pytest.raises(ValueError):
+        make_simulator(optimizer, assets, sampling="grid")
+
+
+def test_price_gap_dates_are_not_start_dates(gap_prices, prices, assets):
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    gap_optimizer = PortfolioOptimizer(gap_prices)
+    with_gap = make_simulator(gap_optimizer, assets, sampling="rolling").get_valid_start_dates(holding_years=3)
+    everything = make_simulator(PortfolioOptimizer(prices), assets, sampling="rolling").get_valid_start_dates(
+        holding_years=3)
+    holes = gap_optimizer.panel.index[[1499, 1500]]
+    pd.testing.assert_index_equal(with_gap, everything.drop(holes))
+
+
+def test_historical_mode_skips_price_gap(gap_prices, assets):
+    from scr.portfolio_optimizer import PortfolioOptimizer
+
+    optimizer = PortfolioOptimizer(gap_prices)
+    start_date = optimizer.panel.index[1700]
+    (_, metrics, path), = make_simulator(optimizer, assets).simulate_dates([start_date], mode="historical",
+                                                                           holding_years=1, keep_paths=True)
+    window = optimizer.returns.loc[start_date - pd.DateOffset(years=1):start_date, assets].dropna()
+    expected = window.mean(axis=1).to_numpy()
+    np.testing.assert_allclose(path, expected, rtol=1e-12, atol=1e-15)
+    assert metrics['Annualized Volatility'] == pytest.approx(expected.std(ddof=1) * np.sqrt(252), rel=1e-9)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.backtester import Backtester
+from scr.simulator import Simulator
+from scr.streaming import GroupSummary, OnlineStats, PathWriter, QuantileSketch, TrialWriter, load_paths
+
+
+def test_online_stats_match_numpy():
+    rng = np.random.default_rng(4)
+    values = rng.normal(1.0, 2.0, 5000)
+    stats = OnlineStats()
+    for batch in np.array_split(np.append(values, np.nan), 17):
+        stats.update(batch)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std() == pytest.approx(values.std(ddof=1), rel=1e-10)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_quantile_sketch_rank_error_is_bounded():
+    rng = np.random.default_rng(5)
+    values = rng.lognormal(0, 1, 20000)
+    sketch = QuantileSketch(max_centroids=256)
+    for batch in np.array_split(values, 40):
+        sketch.update(batch)
+    assert len(sketch.means) <= 256
+    for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+        rank = np.mean(values <= sketch.quantile(q, values.min(), values.max()))
+        assert abs(rank - q) < 2 / 256
+
+
+def test_streamed_summary_matches_in_memory_grid(optimizer, assets, tmp_path):
+    def simulator():
+        return Simulator(optimizer, Backtester(optimizer, assets), assets, n_trials=12, seed=9)
+
+    grid = simulator().run_grid(modes=("optimal", "historical"), horizons=(3,))
+    summary = GroupSummary()
+    with TrialWriter(str(tmp_path / "trials.csv")) as writer:
+        n_records = simulator().stream_grid(modes=("optimal", "historical"), horizons=(3,), writer=writer,
+                                            summary=summary, batch_size=5)
+    assert n_records == writer.rows_written == len(grid)
+
+    written = pd.read_csv(tmp_path / "trials.csv")
+    pd.testing.assert_frame_equal(written[grid.columns], grid, check_dtype=False)
+
+    expected = grid.groupby(["Mode", "Years"], sort=False)[summary.metrics].mean().reset_index()
+    got = summary.means_table(decimals=12).set_index(["Mode", "Years"]).loc[
+        list(zip(expected["Mode"], expected["Years"]))].reset_index()
+    pd.testing.assert_frame_equal(got, expected, rtol=1e-9)
+
+
+def test_path_writer_roundtrip(tmp_path):
+    rng = np.random.default_rng(6)
+    paths = [rng.normal(size=n) for n in (5, 0, 12, 1)]
+    with PathWriter(str(tmp_path / "out" / "paths"), dtype=np.float64) as writer:
+        for i, path in enumerate(paths):
+            writer.write(f"trial_{i}", path)
+    assert writer.n_paths == len(paths)
+
+    labels, loaded = load_paths(str(tmp_path / "out" / "paths"))
+    assert labels == [f"trial_{i}" for i in range(len(paths))]
+    for got, expected in zip(loaded, paths):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_path_writer_keeps_no_per_path_state(tmp_path):
+    # 長度與標籤直接寫到 .idx，寫到一半也能讀回已完成的路徑
+    writer = PathWriter(str(tmp_path / "paths"))
+    for i in range(1000):
+        writer.write(str(i), np.full(3, i))
+    assert not hasattr(writer, "lengths") and not hasattr(writer, "labels")
+    writer._file.flush()
+    writer._index_file.flush()
+    labels, loaded = load_paths(str(tmp_path / "paths"))
+    assert len(labels) == 1000 and loaded[-1].tolist() == [999, 999, 999]
+    writer.close()
+
+
+def test_path_writer_empty(tmp_path):
+    with PathWriter(str(tmp_path / "paths")):
+        pass
+    assert load_paths(str(tmp_path / "paths")) == ([], [])
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scr.backtester import Backtester
+from scr.performance import METRIC_NAMES, compute_performance_metrics
+from scr.subset_search import SubsetSearch
+
+WINDOW = dict(start_date="2006-01-02", end_date="2008-12-31")
+
+
+def test_scores_match_backtester(optimizer, assets):
+    # 樣本共變異數的子矩陣就是子集合自己的估計：每組的分數與單獨回測這幾檔相同
+    search = SubsetSearch(optimizer, assets, k=2, method="exhaustive", **WINDOW)
+    search.run()
+    assert len(search.scores) == 10
+
+    for subset, (_, row) in search.scores.items():
+        asset_list = [assets[i] for i in subset]
+        returns = Backtester(optimizer, asset_list).run_backtest(WINDOW['start_date'], WINDOW['end_date'])
+        expected = compute_performance_metrics(returns.to_numpy())
+        for name in METRIC_NAMES:
+            assert row[name] == pytest.approx(expected[name], rel=1e-9)
+
+
+def test_wide_beam_matches_exhaustive(optimizer, assets):
+    exhaustive = SubsetSearch(optimizer, assets, k=3, method="exhaustive", **WINDOW).run()
+    beam = SubsetSearch(optimizer, assets, k=3, method="beam", beam_width=10, **WINDOW).run()
+    pd.testing.assert_frame_equal(beam, exhaustive.head(len(beam)))
+
+
+def test_greedy_adds_one_asset_per_layer(optimizer, assets):
+    exhaustive = SubsetSearch(optimizer, assets, k=3, method="exhaustive", **WINDOW)
+    best = exhaustive.run().iloc[0]
+    greedy = SubsetSearch(optimizer, assets, k=3, method="greedy", **WINDOW)
+    result = greedy.run()
+    # 每層只從上一層最好的一組往外加一檔：5 + 4 + 3 組
+    assert greedy.summary['evaluated'] == 12
+    assert len(result) == 1 and result.iloc[0]["Sharpe Ratio"] <= best["Sharpe Ratio"]
+
+    first = max((subset for subset in greedy.scores if len(subset) == 1), key=lambda s: greedy.scores[s][0])
+    assert all(set(first) < set(subset) for subset in greedy.scores if len(subset) == 3)
+
+
+def test_parallel_matches_serial(optimizer, assets):
+    serial = SubsetSearch(optimizer, assets, k=2, method="beam", beam_width=3, **WINDOW).run()
+    parallel = SubsetSearch(optimizer, assets, k=2, method="beam", beam_width=3, workers=2, chunk_size=2,
+                            **WINDOW).run()
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_universe_is_estimated_once_per_period(optimizer, assets):
+    search = SubsetSearch(optimizer, assets, k=2, **WINDOW)
+    estimates = search.estimate_universe()
+    assert len(estimates) == 6
+    mu, covariance = estimates.estimates[0]
+    np.testing.assert_allclose(covariance.subset(np.array([1, 3])).matrix, covariance.matrix[np.ix_([1, 3], [1, 3])])
+
+
+def test_exhaustive_respects_max_candidates(optimizer, assets):
+    with pytest.raises(ValueError):
+        SubsetSearch(optimizer, assets, k=2, method="exhaustive", max_candidates=5, **WINDOW).run()
+
+
+@pytest.mark.parametrize("kwargs", [dict(method="random"), dict(objective="Sortino"), dict(k=0), dict(k=6)])
+def test_invalid_settings_are_rejected(optimizer, assets, kwargs):
+    with pytest.raises(ValueError):
+        SubsetSearch(optimizer, assets, **kwargs)
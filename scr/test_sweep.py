@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from scr.backtester import Backtester
+from scr.performance import METRIC_NAMES
+from scr.simulator import Simulator
+from scr.sweep import SweepRunner
+
+GRID = dict(modes=("optimal", "equal"), horizons=(3,), lookbacks=(3, 5), rebalance_freqs=("6M", "Q"),
+            sampling="rolling", step=150)
+
+
+@pytest.fixture
+def asset_sets(assets):
+    return {'all': assets, 'head': assets[:3]}
+
+
+def test_points_match_individual_simulations(optimizer, asset_sets):
+    runner = SweepRunner(optimizer, asset_sets, **GRID)
+    table = runner.run()
+    assert len(table.groupby(["Assets", "Lookback", "Rebalance", "Mode", "Years"])) == len(runner.points())
+
+    for point in runner.points():
+        asset_list = asset_sets[point['Assets']]
+        backtester = Backtester(optimizer, asset_list, rebalance_freq=point['Rebalance'],
+                                lookback_years=point['Lookback'])
+        start_dates = runner.get_start_dates(asset_list)
+        outcomes = Simulator(optimizer, backtester, asset_list).simulate_dates(start_dates, mode=point['Mode'],
+                                                                                holding_years=point['Years'])
+        expected = pd.DataFrame([metrics for _, metrics, _ in outcomes], columns=METRIC_NAMES)
+
+        rows = table[(table["Assets"] == point['Assets']) & (table["Lookback"] == point['Lookback'])
+                     & (table["Rebalance"] == point['Rebalance']) & (table["Mode"] == point['Mode'])]
+        np.testing.assert_allclose(rows[METRIC_NAMES].to_numpy(), expected.to_numpy(), rtol=1e-12)
+        pd.testing.assert_index_equal(pd.DatetimeIndex(rows["Start Date"]), start_dates, check_names=False)
+
+
+def test_equal_weight_points_are_deduplicated(optimizer, asset_sets):
+    # 不漂移的等權重與估計年數、rebalance 週期無關：每組資產只算一次
+    runner = SweepRunner(optimizer, asset_sets, **GRID)
+    runner.run()
+    assert runner.summary == {'points': 16, 'resumed': 0, 'computed': 10, 'deduplicated': 6}
+
+
+def test_drift_disables_equal_weight_deduplication(optimizer, assets):
+    runner = SweepRunner(optimizer, [assets], drift=True, **GRID)
+    runner.run()
+    assert runner.summary['deduplicated'] == 0
+
+
+def test_resume_from_checkpoints(optimizer, asset_sets, tmp_path):
+    checkpoint_dir = str(tmp_path / "sweep")
+    first = SweepRunner(optimizer, asset_sets, checkpoint_dir=checkpoint_dir, **GRID).run()
+
+    # 模擬中斷：刪掉兩個 point 的結果，重跑只補算缺少的部分
+    files = sorted(os.listdir(checkpoint_dir))
+    assert len(files) == 16
+    for name in files[:2]:
+        os.remove(os.path.join(checkpoint_dir, name))
+
+    runner = SweepRunner(optimizer, asset_sets, checkpoint_dir=checkpoint_dir, **GRID)
+    resumed = runner.run()
+    assert runner.summary['resumed'] == 14
+    assert runner.summary['computed'] + runner.summary['deduplicated'] == 2
+    pd.testing.assert_frame_equal(resumed, first)
+
+
+def test_checkpoints_are_ignored_when_options_change(optimizer, assets, tmp_path):
+    checkpoint_dir = str(tmp_path / "sweep")
+    SweepRunner(optimizer, [assets], checkpoint_dir=checkpoint_dir, **GRID).run()
+    runner = SweepRunner(optimizer, [assets], checkpoint_dir=checkpoint_dir, drift=True, cost_rate=0.001, **GRID)
+    runner.run()
+    assert runner.summary['resumed'] == 0
+
+
+def test_parallel_matches_serial(optimizer, asset_sets):
+    serial = SweepRunner(optimizer, asset_sets, chunk_size=3, **GRID).run()
+    parallel = SweepRunner(optimizer, asset_sets, chunk_size=3, workers=2, **GRID).run()
+    pd.testing.assert_frame_equal(parallel, serial, rtol=1e-12)
+
+
+def test_invalid_rebalance_freq_fails_before_running(optimizer, assets):
+    with pytest.raises(ValueError):
+        SweepRunner(optimizer, [assets], rebalance_freqs=("6X",))